@@ -0,0 +1,173 @@
+"""Admission control in front of the database.
+
+Requests are sorted into route classes, each with its own concurrency
+limit and a bounded wait queue. A request that finds its class busy waits
+in the queue for at most the class timeout; one that finds the queue full,
+or times out waiting, is answered straight away with a 503 and a
+Retry-After header instead of piling up in front of the MongoDB pool,
+where it would slow down every other request.
+
+The limits together stay under the pool size (MONGO_MAX_POOL_SIZE, 100
+by default), so the pool itself never has callers waiting on it. Health
+probes, metrics and event streams are never limited; preference reads,
+which the app needs before it can render anything, have a lane of their
+own that busy listings and aggregations cannot take over. Limits apply
+per worker process.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Optional
+from fastapi.responses import ORJSONResponse
+from metrics import Counter, Gauge, Histogram, register
+
+# Route class -> (concurrency limit, queue size, queue timeout in seconds). Each is
+# overridable with ADMISSION_<CLASS>_LIMIT, ADMISSION_<CLASS>_QUEUE and ADMISSION_<CLASS>_TIMEOUT
+ROUTE_CLASSES = {
+    "read": (48, 96, 0.5),
+    "write": (24, 48, 1.0),
+    # Aggregations (facets, analytics, dashboard stats) and exports hold a connection for long
+    "aggregate": (8, 16, 2.0),
+    "priority": (8, 32, 2.0),
+}
+RETRY_AFTER_SECONDS = int(os.environ.get("ADMISSION_RETRY_AFTER", 1))
+
+# Paths that are never limited: the probes must answer however busy the worker is,
+# and an event stream would hold its slot for as long as the client stays connected
+UNLIMITED_PATHS = {"/api/", "/api/metrics", "/api/events"}
+UNLIMITED_PREFIXES = ("/api/health/",)
+AGGREGATE_SUFFIXES = ("/facets", "/export", "/stats/dashboard")
+READ_METHODS = {"GET", "HEAD"}
+
+IN_FLIGHT = register(Gauge(
+    "admission_in_flight", "Requests being served per route class", ("route_class",)
+))
+QUEUE_DEPTH = register(Gauge(
+    "admission_queue_depth", "Requests waiting for a slot per route class", ("route_class",)
+))
+QUEUE_WAIT = register(Histogram(
+    "admission_queue_wait_seconds", "Time queued requests waited for a slot", ("route_class",)
+))
+REJECTED = register(Counter(
+    "admission_rejected_total", "Requests shed with a 503 per route class and reason", ("route_class", "reason")
+))
+
+def class_limits(name: str) -> tuple:
+    limit, queue_size, timeout = ROUTE_CLASSES[name]
+    prefix = f"ADMISSION_{name.upper()}"
+    return (
+        int(os.environ.get(f"{prefix}_LIMIT", limit)),
+        int(os.environ.get(f"{prefix}_QUEUE", queue_size)),
+        float(os.environ.get(f"{prefix}_TIMEOUT", timeout)),
+    )
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """The class a request is admitted under, or None when it is not limited"""
+    if not path.startswith("/api/") or path in UNLIMITED_PATHS or path.startswith(UNLIMITED_PREFIXES):
+        return None
+    if method not in READ_METHODS:
+        return "write"
+    if path.rstrip("/") == "/api/preferences":
+        return "priority"
+    if path.startswith("/api/analytics/") or path.rstrip("/").endswith(AGGREGATE_SUFFIXES):
+        return "aggregate"
+    return "read"
+
+class Limiter:
+    """At most `limit` requests at once, and at most `queue_size` more waiting up to `timeout` seconds"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+        self._report()
+
+    def _report(self):
+        IN_FLIGHT.set(self.active, self.name)
+        QUEUE_DEPTH.set(len(self._waiters), self.name)
+
+    async def acquire(self) -> Optional[str]:
+        """None once the request holds a slot, otherwise the reason it is shed"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._report()
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return "queue_full"
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        # The waiter resolves to True when handed a slot, False when its time is up
+        timer = loop.call_later(self.timeout, self._expire, waiter)
+        self._waiters.append(waiter)
+        self._report()
+        started = time.perf_counter()
+        try:
+            admitted = await waiter
+        except asyncio.CancelledError:
+            # The client went away; a slot handed over in the meantime goes to the next waiter
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            raise
+        finally:
+            timer.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                # Handed a slot: release() has taken it off the queue already
+                pass
+            QUEUE_WAIT.observe(time.perf_counter() - started, self.name)
+            self._report()
+        return None if admitted else "timeout"
+
+    @staticmethod
+    def _expire(waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(False)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the longest waiting request
+                waiter.set_result(True)
+                self._report()
+                return
+        self.active -= 1
+        self._report()
+
+class AdmissionMiddleware:
+    """Sheds requests with a 503 when their route class is saturated"""
+
+    def __init__(self, app, limits: dict = None):
+        self.app = app
+        limits = limits or {name: class_limits(name) for name in ROUTE_CLASSES}
+        self.limiters = {name: Limiter(name, *values) for name, values in limits.items()}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiters.get(route_class(scope["method"], scope["path"]))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await limiter.acquire()
+        if reason is not None:
+            REJECTED.inc(limiter.name, reason)
+            response = ORJSONResponse(
+                {"detail": "The server is overloaded, retry shortly"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,209 @@
+"""Rollups behind the /api/analytics charts.
+
+Each user has monthly documents (key "month:YYYY-MM") counting
+completions, backlog additions and moves to the library, and a "totals"
+document holding playtime and game counts per genre and platform and the
+rating distribution; documents are found by (userId, key). The write
+handlers apply every change as $inc deltas, so the chart endpoints read a
+few small documents instead of scanning the games collection.
+
+`rebuild_analytics` recomputes the game rollups in one vectorized pass
+with pandas. Backlog moves are events that leave no trace in the current
+data, so a rebuild keeps the recorded flow counters as they are.
+"""
+from datetime import datetime
+from typing import Optional
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+from database import analytics_collection, backlog_collection, games_archive_collection, games_collection
+from dates import parse_date
+from stats import field_key
+
+TOTALS_ID = "totals"
+MONTH_PREFIX = "month:"
+RATING_BUCKETS = range(0, 11)
+FLOW_FIELDS = ("backlogAdded", "backlogMoved")
+
+def month_key(value) -> Optional[str]:
+    """The "YYYY-MM" a stored date falls in, or None when there is no usable date"""
+    if isinstance(value, str):
+        try:
+            value = parse_date(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return f"{value.year:04d}-{value.month:02d}"
+
+def rating_bucket(rating) -> Optional[int]:
+    """Whole-point bucket of a 0-10 rating"""
+    if rating is None:
+        return None
+    return int(min(max(rating, 0), 10))
+
+def _merge(rollups: dict, more: dict):
+    for key, delta in more.items():
+        target = rollups.setdefault(key, {})
+        for field, value in delta.items():
+            target[field] = target.get(field, 0) + value
+
+def _game_rollups(game: Optional[dict], sign: int) -> dict:
+    if not game:
+        return {}
+    playtime = game.get("playtime") or 0
+    totals = {
+        f"playtimeByGenre.{field_key(game.get('genre'))}": sign * playtime,
+        f"gamesByGenre.{field_key(game.get('genre'))}": sign,
+        f"playtimeByPlatform.{field_key(game.get('platform'))}": sign * playtime,
+        f"gamesByPlatform.{field_key(game.get('platform'))}": sign,
+    }
+    bucket = rating_bucket(game.get("rating"))
+    if bucket is not None:
+        totals[f"ratings.{bucket}"] = sign
+
+    rollups = {TOTALS_ID: totals}
+    month = month_key(game.get("completionDate"))
+    if month:
+        rollups[MONTH_PREFIX + month] = {"completions": sign}
+    return rollups
+
+async def _apply(user_id: str, rollups: dict):
+    """Apply per-document $inc deltas to `user_id`'s rollups with a single bulk write"""
+    updates = []
+    for key, delta in rollups.items():
+        delta = {field: value for field, value in delta.items() if value}
+        if delta:
+            updates.append(UpdateOne({"userId": user_id, "key": key}, {"$inc": delta}, upsert=True))
+    if updates:
+        await analytics_collection.bulk_write(updates, ordered=False)
+
+async def record_game_change(user_id: str, before: Optional[dict] = None, after: Optional[dict] = None):
+    """Apply a game insert (no before), update or delete (no after) to the rollups"""
+    rollups = _game_rollups(before, -1)
+    _merge(rollups, _game_rollups(after, 1))
+    await _apply(user_id, rollups)
+
+async def record_games_inserted(user_id: str, games: list):
+    rollups = {}
+    for game in games:
+        _merge(rollups, _game_rollups(game, 1))
+    await _apply(user_id, rollups)
+
+async def record_backlog_added(user_id: str, items: list):
+    rollups = {}
+    for item in items:
+        month = month_key(item.get("createdAt"))
+        if month:
+            _merge(rollups, {MONTH_PREFIX + month: {"backlogAdded": 1}})
+    await _apply(user_id, rollups)
+
+async def record_backlog_moved(user_id: str, moved_at: Optional[datetime] = None):
+    month = month_key(moved_at or datetime.utcnow())
+    await _apply(user_id, {MONTH_PREFIX + month: {"backlogMoved": 1}})
+
+def _month_series(frame: pd.DataFrame, column: str) -> pd.Series:
+    """Month keys of a date column; values that are not dates become NaN"""
+    dates = pd.to_datetime(frame[column], errors="coerce", format="mixed")
+    return dates.dt.strftime("%Y-%m")
+
+def _counts(series: pd.Series) -> dict:
+    return {field_key(key): int(value) for key, value in series.items()}
+
+async def _load_frame(collection, user_id: str, fields: list) -> pd.DataFrame:
+    docs = await collection.find({"userId": user_id}, {"_id": 0, **{field: 1 for field in fields}}).to_list(None)
+    return pd.DataFrame(docs, columns=fields)
+
+async def compute_analytics(user_id: str, flows: Optional[dict] = None) -> list:
+    """Recompute every rollup document of `user_id` from the collections.
+
+    `flows` maps monthly keys to their recorded backlog flow counters; when
+    none are given, additions are estimated from the current backlog.
+    """
+    game_fields = ["genre", "platform", "playtime", "rating", "completionDate"]
+    # Archived games are finished games, the ones the completion and rating rollups are mostly about
+    games = pd.concat([
+        await _load_frame(games_collection, user_id, game_fields),
+        await _load_frame(games_archive_collection, user_id, game_fields)
+    ], ignore_index=True)
+    games["playtime"] = pd.to_numeric(games["playtime"], errors="coerce").fillna(0)
+
+    ratings = pd.to_numeric(games["rating"], errors="coerce").dropna().to_numpy()
+    buckets = np.bincount(np.clip(ratings, 0, 10).astype(int), minlength=len(RATING_BUCKETS))
+
+    totals = {
+        "userId": user_id,
+        "key": TOTALS_ID,
+        "playtimeByGenre": _counts(games.groupby("genre")["playtime"].sum()),
+        "gamesByGenre": _counts(games.groupby("genre").size()),
+        "playtimeByPlatform": _counts(games.groupby("platform")["playtime"].sum()),
+        "gamesByPlatform": _counts(games.groupby("platform").size()),
+        "ratings": {str(bucket): int(count) for bucket, count in enumerate(buckets) if count},
+    }
+
+    months = {}
+    for month, count in _month_series(games, "completionDate").value_counts().items():
+        months.setdefault(MONTH_PREFIX + month, {})["completions"] = int(count)
+
+    if flows is None:
+        backlog = await _load_frame(backlog_collection, user_id, ["createdAt"])
+        flows = {
+            MONTH_PREFIX + month: {"backlogAdded": int(count)}
+            for month, count in _month_series(backlog, "createdAt").value_counts().items()
+        }
+    for key, counters in flows.items():
+        months.setdefault(key, {}).update(counters)
+
+    return [totals] + [{"userId": user_id, "key": key, **counters} for key, counters in sorted(months.items())]
+
+async def _recorded_flows(user_id: str) -> Optional[dict]:
+    recorded = await analytics_collection.find(
+        {"userId": user_id, "key": {"$regex": f"^{MONTH_PREFIX}"}}, {"key": 1, **{field: 1 for field in FLOW_FIELDS}}
+    ).to_list(None)
+    flows = {
+        doc["key"]: {field: doc[field] for field in FLOW_FIELDS if field in doc}
+        for doc in recorded
+    }
+    return flows or None
+
+async def rebuild_analytics(user_id: str, reset_flow: bool = False, dry_run: bool = False) -> list:
+    """Replace `user_id`'s rollups with freshly computed ones.
+
+    Writes that land while the rebuild runs can be lost, so run this
+    during a quiet period.
+    """
+    flows = None if reset_flow else await _recorded_flows(user_id)
+
+    docs = await compute_analytics(user_id, flows)
+    if not dry_run:
+        await analytics_collection.delete_many({"userId": user_id})
+        await analytics_collection.insert_many(docs)
+    return docs
+
+def _months_between(start: str, end: str) -> list:
+    year, month = map(int, start.split("-"))
+    months = []
+    while f"{year:04d}-{month:02d}" <= end:
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+async def read_monthly(user_id: str, fields: tuple, start: Optional[str] = None, end: Optional[str] = None) -> list:
+    """Monthly counters from `start` to `end` ("YYYY-MM", inclusive), with empty months as zeros"""
+    key_range = {"$gte": MONTH_PREFIX + (start or "0000-00"), "$lte": MONTH_PREFIX + (end or "9999-99")}
+    docs = await analytics_collection.find({"userId": user_id, "key": key_range}).sort("key", 1).to_list(None)
+    by_month = {doc["key"][len(MONTH_PREFIX):]: doc for doc in docs}
+    # Months are shared by every chart, so only those with data for `fields` bound an open range
+    with_data = [month for month, doc in by_month.items() if any(doc.get(field) for field in fields)]
+    if not with_data and not (start and end):
+        return []
+
+    first = start or min(with_data, default=end)
+    last = end or max(with_data, default=start)
+    return [
+        {"month": month, **{field: by_month.get(month, {}).get(field, 0) for field in fields}}
+        for month in _months_between(first, last)
+    ]
+
+async def read_totals(user_id: str) -> dict:
+    return await analytics_collection.find_one({"userId": user_id, "key": TOTALS_ID}) or {}
@@ -0,0 +1,145 @@
+"""Moves finished games out of the working set.
+
+Completed and dropped games make up most of a long-time user's library
+but are rarely looked at again. Once one has not been changed for
+ARCHIVE_AFTER_DAYS, the archiver moves it from the games collection to
+games_archive, which MongoDB stores with zstd compression. The hot
+collection, its indexes and the listings served from it then only hold
+the games that are still being played.
+
+Archived games are not gone: listings and facets include them with
+`includeArchived`, exports always do, detail reads and deletes look in
+both tiers, and updating an archived game moves it back to the hot tier
+first. Stats, analytics and genre affinities count both tiers, so moving
+a game changes none of them.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import DeleteOne, UpdateOne
+from database import games_archive_collection, games_collection
+from changes import games_archived
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_STATUSES = ["Completed", "Dropped"]
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ARCHIVE_AFTER_DAYS", 180))
+# Seconds between sweeps; 0 turns the background archiver off
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", 3600))
+BATCH_SIZE = 500
+
+def archivable(cutoff: datetime) -> dict:
+    """Games finished and last changed before `cutoff`, served by the status_updatedAt index"""
+    return {"status": {"$in": ARCHIVE_STATUSES}, "updatedAt": {"$lt": cutoff}}
+
+async def _hot_versions(docs: list) -> dict:
+    """updatedAt of those of `docs` still in the hot tier, by _id, in one read"""
+    current = await games_collection.find(
+        {"_id": {"$in": [doc["_id"] for doc in docs]}}, {"_id": 1, "updatedAt": 1}
+    ).to_list(None)
+    return {doc["_id"]: doc["updatedAt"] for doc in current}
+
+async def _archive_batch(cutoff: datetime, batch_size: int) -> dict:
+    """Move up to `batch_size` archivable games; returns the moved ids per user"""
+    docs = await games_collection.find(archivable(cutoff)).limit(batch_size).to_list(None)
+    if not docs:
+        return {}
+    archived_at = datetime.utcnow()
+    # Copy before deleting, so an interruption leaves a game in both tiers rather than in neither
+    await games_archive_collection.bulk_write([
+        UpdateOne(
+            {"userId": doc["userId"], "id": doc["id"]},
+            {"$set": {**{k: v for k, v in doc.items() if k != "_id"}, "archivedAt": archived_at}},
+            upsert=True
+        )
+        for doc in docs
+    ], ordered=False)
+    # A game changed or deleted since it was read stays where the user left it, and its copy
+    # is dropped again. Deletes look in both tiers, so one deleted from here on goes entirely
+    versions = await _hot_versions(docs)
+    unchanged = [doc for doc in docs if versions.get(doc["_id"]) == doc["updatedAt"]]
+    stale = [doc for doc in docs if versions.get(doc["_id"]) != doc["updatedAt"]]
+    if unchanged:
+        result = await games_collection.bulk_write([
+            DeleteOne({"_id": doc["_id"], "updatedAt": doc["updatedAt"]}) for doc in unchanged
+        ], ordered=False)
+        if result.deleted_count < len(unchanged):
+            # Some changed between the check and the delete; those are still hot
+            still_hot = await _hot_versions(unchanged)
+            stale += [doc for doc in unchanged if doc["_id"] in still_hot]
+            unchanged = [doc for doc in unchanged if doc["_id"] not in still_hot]
+    if stale:
+        await games_archive_collection.bulk_write(
+            [DeleteOne({"userId": doc["userId"], "id": doc["id"]}) for doc in stale], ordered=False
+        )
+    moved = defaultdict(list)
+    for doc in unchanged:
+        moved[doc["userId"]].append(doc["id"])
+    return moved
+
+async def archive_games(
+    older_than_days: float = ARCHIVE_AFTER_DAYS, now: Optional[datetime] = None, batch_size: int = BATCH_SIZE
+) -> int:
+    """Move every game finished more than `older_than_days` ago to the archive; returns how many moved"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        moved = await _archive_batch(cutoff, batch_size)
+        if not moved:
+            return total
+        for user_id, game_ids in moved.items():
+            await games_archived(user_id, game_ids)
+            total += len(game_ids)
+
+async def find_game(user_id: str, game_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+    """Read a game from whichever tier holds it"""
+    for collection in (games_collection, games_archive_collection):
+        game = await collection.find_one({"userId": user_id, "id": game_id}, projection)
+        if game:
+            return game
+    return None
+
+async def restore_game(user_id: str, game_id: str) -> bool:
+    """Move an archived game back to the hot tier; False when it is not archived"""
+    game = await games_archive_collection.find_one({"userId": user_id, "id": game_id}, {"_id": 0, "archivedAt": 0})
+    if not game:
+        return False
+    # Should a copy already be hot (an interrupted archiving), that copy is the current one
+    await games_collection.update_one({"userId": user_id, "id": game_id}, {"$setOnInsert": game}, upsert=True)
+    await games_archive_collection.delete_one({"userId": user_id, "id": game_id})
+    return True
+
+class Archiver:
+    """Runs archive_games every `interval` seconds for as long as the server is up"""
+
+    def __init__(self, interval: float = ARCHIVE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                moved = await archive_games()
+                if moved:
+                    logger.info("Archived %d finished games", moved)
+            except Exception:
+                # Whatever went wrong, the next sweep starts over from what is still hot
+                logger.exception("Archiving finished games failed; retrying in %.0fs", self.interval)
+            await asyncio.sleep(self.interval)
+
+archiver = Archiver()
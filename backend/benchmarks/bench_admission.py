@@ -0,0 +1,128 @@
+"""Show tail latency holding steady under overload with admission control.
+
+The database is modelled as a pool of POOL_SIZE connections, each query
+holding one for SERVICE_MS. Listings may use READ_LIMIT of them, which
+caps their throughput at a known capacity, and the rest stay free for
+the probes, as admission.ROUTE_CLASSES does with the real pool. Listing
+requests are offered open-loop at 1x and 2x that capacity, with
+a health probe mixed in, once straight to the app and once through the
+admission middleware (with limits scaled to the small pool). Without it,
+the overloaded run queues without bound and every request, the probe
+included, waits longer the longer the overload lasts; with it, the
+excess is shed with 503s and admitted requests keep their latency. No
+database needed:
+
+    python -m benchmarks.bench_admission
+    python -m benchmarks.bench_admission --duration 20 --load 1,1.5,2,3
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from admission import AdmissionMiddleware
+
+POOL_SIZE = 12
+READ_LIMIT = 10
+SERVICE_MS = 20
+HEALTH_EVERY = 20
+# Scaled down from admission.ROUTE_CLASSES to fit POOL_SIZE
+LIMITS = {"read": (READ_LIMIT, 2 * READ_LIMIT, 0.25)}
+
+def build_app(admission: bool) -> FastAPI:
+    app = FastAPI()
+    pool = asyncio.Semaphore(POOL_SIZE)
+
+    @app.get("/api/games/")
+    async def list_games():
+        async with pool:
+            await asyncio.sleep(SERVICE_MS / 1000)
+        return []
+
+    @app.get("/api/health/live")
+    async def liveness():
+        # The probe pings the database, so it needs a connection too
+        async with pool:
+            await asyncio.sleep(0.001)
+        return {"status": "alive"}
+
+    if admission:
+        app.add_middleware(AdmissionMiddleware, limits=LIMITS)
+    return app
+
+async def call(app, path: str) -> int:
+    status = 500
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": [], "server": ("bench", 80),
+    }
+    await app(scope, receive, send)
+    return status
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+async def offer(app, rps: float, duration: float) -> dict:
+    """Start requests at `rps` for `duration` seconds; latency counts from each planned start"""
+    served, shed, health = [], 0, []
+
+    async def fire(path: str, planned: float):
+        nonlocal shed
+        status = await call(app, path)
+        latency = (time.perf_counter() - planned) * 1000
+        if path.startswith("/api/health/"):
+            health.append(latency)
+        elif status == 503:
+            shed += 1
+        else:
+            served.append(latency)
+
+    tasks = []
+    started = time.perf_counter()
+    for sent in range(int(rps * duration)):
+        planned = started + sent / rps
+        delay = planned - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        path = "/api/health/live" if sent % HEALTH_EVERY == 0 else "/api/games/"
+        tasks.append(asyncio.ensure_future(fire(path, planned)))
+    await asyncio.gather(*tasks)
+    served.sort()
+    health.sort()
+    return {
+        "served": len(served), "shed": shed,
+        "p50": percentile(served, 0.5), "p99": percentile(served, 0.99), "health_p99": percentile(health, 0.99),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Latency under overload with and without admission control")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per run")
+    parser.add_argument("--load", default="1,2", help="comma-separated multiples of capacity to offer")
+    args = parser.parse_args()
+
+    capacity = READ_LIMIT * 1000 / SERVICE_MS
+    print(f"capacity {capacity:.0f} req/s ({READ_LIMIT} of {POOL_SIZE} connections x {SERVICE_MS} ms)")
+    print(f"{'admission':>9} {'load':>5} {'served':>7} {'shed':>6} {'p50 ms':>9} {'p99 ms':>9} {'health p99':>11}")
+    for admission in (False, True):
+        for load in (float(value) for value in args.load.split(",")):
+            result = await offer(build_app(admission), capacity * load, args.duration)
+            print(
+                f"{'on' if admission else 'off':>9} {load:>4.1f}x {result['served']:>7} {result['shed']:>6} "
+                f"{result['p50']:>9.1f} {result['p99']:>9.1f} {result['health_p99']:>11.1f}"
+            )
+
+if __name__ == "__main__":
+    asyncio.run(main())
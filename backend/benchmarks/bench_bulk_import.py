@@ -0,0 +1,71 @@
+"""Measure bulk import throughput for 50k-row uploads in each format.
+
+Run from the backend directory against a local mongod:
+
+    python -m benchmarks.bench_bulk_import
+"""
+import asyncio
+import csv
+import io
+import json
+import random
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.common import make_game
+from database import close_db_connection, games_collection
+from models import GameCreate
+from server import app
+
+ROWS = 50_000
+
+def build_rows() -> list:
+    rng = random.Random(42)
+    fields = list(GameCreate.model_fields)
+    return [{field: game.get(field) for field in fields} for game in (make_game(rng) for _ in range(ROWS))]
+
+def _iso(value: datetime) -> str:
+    return value.isoformat()
+
+def encode(rows: list, fmt: str) -> bytes:
+    if fmt == "json":
+        return json.dumps(rows, default=_iso).encode()
+    if fmt == "ndjson":
+        return "".join(json.dumps(row, default=_iso) + "\n" for row in rows).encode()
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+async def main():
+    rows = build_rows()
+    content_types = {"json": "application/json", "ndjson": "application/x-ndjson", "csv": "text/csv"}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'format':>7} {'seconds':>8} {'rows/s':>9}")
+        for fmt, content_type in content_types.items():
+            await games_collection.delete_many({})
+            body = encode(rows, fmt)
+            started = time.perf_counter()
+            response = await client.post("/api/games/bulk", content=body, headers={"content-type": content_type})
+            elapsed = time.perf_counter() - started
+            assert response.json()["inserted"] == ROWS, response.text[:500]
+            print(f"{fmt:>7} {elapsed:>8.2f} {ROWS / elapsed:>9.0f}")
+
+        started = time.perf_counter()
+        exported = 0
+        async with client.stream("GET", "/api/games/export") as response:
+            async for _ in response.aiter_lines():
+                exported += 1
+        elapsed = time.perf_counter() - started
+        print(f"{'export':>7} {elapsed:>8.2f} {exported / elapsed:>9.0f}")
+
+    await games_collection.delete_many({})
+    await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+"""Compare the in-Python dashboard stats, the aggregation pipeline and the
+point read of the materialized counters behind the endpoint.
+
+Run from the backend directory against a local mongod:
+
+    python -m benchmarks.bench_dashboard_stats
+"""
+import asyncio
+
+from benchmarks.common import make_backlog_item, make_game, measure, seed
+from database import backlog_collection, close_db_connection, games_collection
+from stats import compute_stats, read_stats, rebuild_stats
+from tenants import DEFAULT_USER_ID
+
+SIZES = [1_000, 10_000, 100_000]
+
+async def legacy_dashboard_stats():
+    """The original implementation, without the 1000 document cap so results match"""
+    games = await games_collection.find().to_list(None)
+    backlog = await backlog_collection.find().to_list(None)
+
+    completed = len([g for g in games if g.get("status") == "Completed"])
+    in_progress = len([g for g in games if g.get("status") == "In Progress"])
+    total_playtime = sum(g.get("playtime", 0) for g in games)
+    avg_rating = sum(g.get("rating", 0) for g in games) / len(games) if games else 0
+    return completed, in_progress, total_playtime, round(avg_rating, 1), len(games), len(backlog)
+
+async def main():
+    print(f"{'games':>8} {'legacy ms':>10} {'pipeline ms':>12} {'counters ms':>12}")
+    for size in SIZES:
+        await seed(games_collection, make_game, size)
+        await seed(backlog_collection, make_backlog_item, size // 10)
+        await rebuild_stats(DEFAULT_USER_ID)
+
+        legacy = await measure(legacy_dashboard_stats)
+        pipeline = await measure(lambda: compute_stats(DEFAULT_USER_ID))
+        counters = await measure(lambda: read_stats(DEFAULT_USER_ID))
+        print(f"{size:>8} {legacy:>10.1f} {pipeline:>12.1f} {counters:>12.1f}")
+
+    await games_collection.delete_many({})
+    await backlog_collection.delete_many({})
+    await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Measure the per-request overhead of the metrics middleware and the
+per-command overhead of the MongoDB listener. No database needed:
+
+    python -m benchmarks.bench_metrics_overhead
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+
+from metrics import MetricsMiddleware, query_monitor
+
+REQUESTS = 20_000
+COMMANDS = 200_000
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/items/{item_id}")
+    async def get_item(item_id: str):
+        return {"id": item_id}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+async def drive(app, requests: int) -> float:
+    """Call the ASGI app directly so client overhead does not hide the middleware"""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for i in range(requests):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": f"/api/items/{i}", "raw_path": b"",
+            "root_path": "", "query_string": b"", "headers": [], "server": ("bench", 80),
+        }
+        await app(scope, receive, send)
+    return (time.perf_counter() - started) / requests * 1_000_000
+
+def listener_cost(commands: int) -> float:
+    started_event = SimpleNamespace(
+        command_name="find", command={"find": "games", "filter": {"status": "Completed"}},
+        connection_id=("localhost", 27017), request_id=0
+    )
+    succeeded_event = SimpleNamespace(
+        command_name="find", connection_id=("localhost", 27017), request_id=0,
+        duration_micros=800, reply={"cursor": {"firstBatch": [{}] * 20}}
+    )
+    started = time.perf_counter()
+    for i in range(commands):
+        started_event.request_id = succeeded_event.request_id = i
+        query_monitor.started(started_event)
+        query_monitor.succeeded(succeeded_event)
+    return (time.perf_counter() - started) / commands * 1_000_000
+
+async def main():
+    plain, instrumented = build_app(False), build_app(True)
+    await drive(plain, 1000)
+    await drive(instrumented, 1000)
+
+    baseline = await drive(plain, REQUESTS)
+    with_metrics = await drive(instrumented, REQUESTS)
+    print(f"request without metrics: {baseline:8.1f} us")
+    print(f"request with metrics:    {with_metrics:8.1f} us  (+{with_metrics - baseline:.1f} us)")
+    print(f"listener per command:    {listener_cost(COMMANDS):8.2f} us")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""Measure payload size and latency of large list responses.
+
+Requests a 10k-game listing through the whole ASGI app, with every field
+and with the grid view's `fields` selection, uncompressed and with each
+negotiated encoding. The response cache is invalidated before every
+request so each one reads from MongoDB. Run from the backend directory
+against a local mongod:
+
+    python -m benchmarks.bench_payload
+"""
+import asyncio
+
+import httpx
+
+from benchmarks.common import make_game, measure, seed
+from cache import GAMES, response_cache
+from database import close_db_connection, create_indexes, games_collection
+from server import app
+from tenants import DEFAULT_USER_ID
+
+LIBRARY_SIZE = 10_000
+FIELD_SETS = {"all": None, "grid": "id,title,cover,status,platform"}
+ENCODINGS = ("identity", "gzip", "br")
+
+async def main():
+    await seed(games_collection, make_game, LIBRARY_SIZE)
+    await create_indexes()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def fetch(fields, encoding):
+            await response_cache.invalidate(DEFAULT_USER_ID, GAMES)
+            params = {"fields": fields} if fields else {}
+            return await client.get("/api/games/", params=params, headers={"Accept-Encoding": encoding})
+
+        print(f"{'fields':>6} {'encoding':>9} {'bytes':>10} {'best ms':>8}")
+        for label, fields in FIELD_SETS.items():
+            for encoding in ENCODINGS:
+                response = await fetch(fields, encoding)
+                assert len(response.json()) == LIBRARY_SIZE
+                best = await measure(lambda: fetch(fields, encoding))
+                print(f"{label:>6} {encoding:>9} {response.num_bytes_downloaded:>10} {best:>8.2f}")
+
+    await games_collection.delete_many({})
+    await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
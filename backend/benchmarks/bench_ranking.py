@@ -0,0 +1,58 @@
+"""Measure how long ranking the whole backlog takes.
+
+Compares scoring every item in Python and sorting with the NumPy scoring
+and argpartition used by GET /api/backlog/ranked. Pure CPU, no database
+needed:
+
+    python -m benchmarks.bench_ranking
+"""
+import random
+import time
+
+from benchmarks.common import GENRES, make_backlog_item
+from ranking import (
+    CATEGORY_SCORES, PRIORITY_SCORES, SHORT_PLAYTIME_HOURS, WEIGHTS, BacklogFeatures, score, top_k
+)
+
+SIZES = (1_000, 10_000, 100_000)
+TOP_K = 10
+REPEAT = 5
+
+def python_rank(docs: list, affinity: dict, k: int) -> list:
+    def item_score(doc):
+        wishlist = max(doc["wishlistPrice"], 0.01)
+        discount = min(max((doc["wishlistPrice"] - doc["currentPrice"]) / wishlist, -1), 1)
+        return (
+            WEIGHTS["priority"] * PRIORITY_SCORES.get(doc["priority"], 0.0)
+            + WEIGHTS["category"] * CATEGORY_SCORES.get(doc["category"], 0.0)
+            + WEIGHTS["discount"] * discount
+            + WEIGHTS["short"] / (1 + doc["estimatedPlaytime"] / SHORT_PLAYTIME_HOURS)
+            + WEIGHTS["affinity"] * affinity.get(doc["genre"], 0.0)
+        )
+
+    return sorted(docs, key=item_score, reverse=True)[:k]
+
+def best_ms(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    rng = random.Random(42)
+    affinity = {genre: rng.uniform(-0.2, 0.2) for genre in GENRES}
+
+    print(f"{'items':>8} {'python ms':>10} {'numpy ms':>9} {'speedup':>8} {'load ms':>8}")
+    for size in SIZES:
+        docs = [make_backlog_item(rng) for _ in range(size)]
+        load = best_ms(lambda: BacklogFeatures(docs))
+        features = BacklogFeatures(docs)
+
+        baseline = best_ms(lambda: python_rank(docs, affinity, TOP_K))
+        vectorized = best_ms(lambda: top_k(score(features, affinity), TOP_K))
+        print(f"{size:>8} {baseline:>10.2f} {vectorized:>9.2f} {baseline / vectorized:>7.1f}x {load:>8.1f}")
+
+if __name__ == "__main__":
+    main()
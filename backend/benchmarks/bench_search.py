@@ -0,0 +1,38 @@
+"""Measure ranked text search latency on a large library.
+
+Run from the backend directory against a local mongod:
+
+    python -m benchmarks.bench_search
+"""
+import asyncio
+
+from benchmarks.common import make_game, measure, seed
+from database import close_db_connection, create_indexes, games_collection
+from pagination import SORT_ORDER
+from routes.games import build_games_query
+from search import ranked_find
+from tenants import DEFAULT_USER_ID
+
+LIBRARY_SIZE = 100_000
+TERMS = ["Studio 42", "Game 123456", "seeded", "platform"]
+
+async def search(term: str):
+    """Run the query behind GET /api/games?search=<term>&limit=50"""
+    cursor = ranked_find(games_collection, build_games_query(DEFAULT_USER_ID, search=term), SORT_ORDER)
+    return await cursor.limit(50).to_list(None)
+
+async def main():
+    await seed(games_collection, make_game, LIBRARY_SIZE)
+    await create_indexes()
+
+    print(f"{'term':>14} {'hits':>6} {'best ms':>8}")
+    for term in TERMS:
+        hits = len(await search(term))
+        best = await measure(lambda: search(term), repeat=20)
+        print(f"{term:>14} {hits:>6} {best:>8.2f}")
+
+    await games_collection.delete_many({})
+    await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""Show that one user's queries cost the same however many users share the database.
+
+Users are added in steps up to 100k, each with the same small library,
+and after every step the queries behind the listing, filtered listing,
+detail, search and dashboard routes are timed for a random sample of
+users. With every index led by userId, latency should stay flat while
+the collection grows by five orders of magnitude. Run from the backend
+directory against a local mongod (100k users is 2M games by default):
+
+    python -m benchmarks.bench_tenants
+    python -m benchmarks.bench_tenants --tenants 1,100,1000 --games-per-tenant 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+from benchmarks.common import make_game
+from database import close_db_connection, create_indexes, games_collection, stats_collection
+from pagination import SORT_ORDER
+from routes.games import build_games_query
+from search import ranked_find
+from stats import read_stats
+
+TENANT_COUNTS = (1, 100, 1_000, 10_000, 100_000)
+GAMES_PER_TENANT = 20
+SAMPLE = 200
+PAGE = 50
+BATCH_SIZE = 5000
+
+def tenant_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+async def add_tenants(tenants: list, count: int, games_per_tenant: int, rng: random.Random):
+    """Add users with `games_per_tenant` games each until there are `count`"""
+    batch = []
+    while len(tenants) < count:
+        user_id = tenant_id(rng)
+        tenants.append(user_id)
+        batch.extend(make_game(rng, user_id) for _ in range(games_per_tenant))
+        if len(batch) >= BATCH_SIZE:
+            await games_collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await games_collection.insert_many(batch, ordered=False)
+
+async def list_page(user_id: str) -> list:
+    """GET /api/games?limit=50"""
+    query = build_games_query(user_id)
+    return await games_collection.find(query, {"_id": 0}).sort(SORT_ORDER).limit(PAGE).to_list(PAGE)
+
+async def filtered_page(user_id: str) -> list:
+    """GET /api/games?status=Completed&limit=50"""
+    query = build_games_query(user_id, status="Completed")
+    return await games_collection.find(query, {"_id": 0}).sort(SORT_ORDER).limit(PAGE).to_list(PAGE)
+
+async def detail(user_id: str, game_id: str):
+    """GET /api/games/{id}"""
+    return await games_collection.find_one({"userId": user_id, "id": game_id}, {"_id": 0})
+
+async def search(user_id: str) -> list:
+    """GET /api/games?search=studio&limit=50"""
+    cursor = ranked_find(games_collection, build_games_query(user_id, search="studio"), SORT_ORDER, {"_id": 0})
+    return await cursor.limit(PAGE).to_list(PAGE)
+
+async def timed(call) -> float:
+    started = time.perf_counter()
+    await call
+    return (time.perf_counter() - started) * 1000
+
+async def measure_tenants(sample: list) -> dict:
+    """Per-query latencies (ms), one per sampled user"""
+    game_ids = {user_id: (await list_page(user_id))[0]["id"] for user_id in sample}
+    # Dashboard counters are built on a user's first read; time the point reads after it
+    for user_id in sample:
+        await read_stats(user_id)
+    queries = {
+        "list": list_page,
+        "filtered": filtered_page,
+        "detail": lambda user_id: detail(user_id, game_ids[user_id]),
+        "search": search,
+        "stats": read_stats,
+    }
+    return {name: [await timed(query(user_id)) for user_id in sample] for name, query in queries.items()}
+
+def percentile(values: list, fraction: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(fraction * 100) - 1]
+
+async def main():
+    parser = argparse.ArgumentParser(description="Per-user query latency as the number of users grows")
+    parser.add_argument(
+        "--tenants", default=",".join(map(str, TENANT_COUNTS)), help="comma-separated user counts to measure at"
+    )
+    parser.add_argument("--games-per-tenant", type=int, default=GAMES_PER_TENANT)
+    parser.add_argument("--sample", type=int, default=SAMPLE, help="users timed at every step")
+    args = parser.parse_args()
+    counts = sorted(int(count) for count in args.tenants.split(","))
+
+    rng = random.Random(42)
+    await games_collection.drop()
+    await stats_collection.drop()
+    await create_indexes()
+
+    tenants = []
+    names = ("list", "filtered", "detail", "search", "stats")
+    print(f"{'users':>8} {'games':>9} " + " ".join(f"{name + ' p50/p95':>17}" for name in names))
+    try:
+        for count in counts:
+            await add_tenants(tenants, count, args.games_per_tenant, rng)
+            sample = rng.sample(tenants, min(args.sample, len(tenants)))
+            latencies = await measure_tenants(sample)
+            cells = " ".join(
+                f"{percentile(latencies[name], 0.5):>8.2f}/{percentile(latencies[name], 0.95):<8.2f}" for name in names
+            )
+            print(f"{count:>8} {count * args.games_per_tenant:>9} {cells}")
+    finally:
+        await games_collection.drop()
+        await stats_collection.drop()
+        await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+
+# Benchmarks never touch the application database
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "gamevault_bench")
+
+from tenants import DEFAULT_USER_ID
+
+PLATFORMS = ["PC", "PlayStation 5", "Xbox Series X", "Nintendo Switch"]
+GENRES = ["RPG", "Action", "Adventure", "Roguelike", "Strategy", "Shooter"]
+STATUSES = ["Completed", "In Progress", "Dropped", "Not Started"]
+CATEGORIES = ["Next to Play", "Maybe Later", "Wishlist"]
+PRIORITIES = ["High", "Medium", "Low"]
+
+def make_game(rng: random.Random, user_id: str = DEFAULT_USER_ID) -> dict:
+    """Build a random game document of `user_id` shaped like the ones the API stores"""
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "userId": user_id,
+        "title": f"Game {rng.randrange(10**6)}",
+        "platform": rng.choice(PLATFORMS),
+        "genre": rng.choice(GENRES),
+        "status": rng.choice(STATUSES),
+        "rating": round(rng.uniform(0, 10), 1),
+        "playtime": rng.randrange(0, 200),
+        "developer": f"Studio {rng.randrange(500)}",
+        "releaseDate": datetime(2020, 1, 1),
+        "cover": "https://example.com/cover.jpg",
+        "progress": rng.randrange(0, 101),
+        "notes": "Seeded by the benchmark suite.",
+        "createdAt": now,
+        "updatedAt": now,
+    }
+
+def make_backlog_item(rng: random.Random, user_id: str = DEFAULT_USER_ID) -> dict:
+    """Build a random backlog document of `user_id` shaped like the ones the API stores"""
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "userId": user_id,
+        "title": f"Backlog {rng.randrange(10**6)}",
+        "platform": rng.choice(PLATFORMS),
+        "genre": rng.choice(GENRES),
+        "category": rng.choice(CATEGORIES),
+        "priority": rng.choice(PRIORITIES),
+        "developer": f"Studio {rng.randrange(500)}",
+        "releaseDate": datetime(2021, 1, 1),
+        "cover": "https://example.com/cover.jpg",
+        "estimatedPlaytime": rng.randrange(1, 120),
+        "currentPrice": round(rng.uniform(5, 70), 2),
+        "wishlistPrice": round(rng.uniform(5, 50), 2),
+        "notes": None,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+
+async def seed(collection, factory, count: int, seed: int = 42, batch_size: int = 5000):
+    """Replace the contents of a collection with `count` generated documents"""
+    rng = random.Random(seed)
+    await collection.delete_many({})
+    for start in range(0, count, batch_size):
+        batch = [factory(rng) for _ in range(min(batch_size, count - start))]
+        await collection.insert_many(batch, ordered=False)
+
+async def measure(fn, repeat: int = 5) -> float:
+    """Return the best wall-clock time in milliseconds of `repeat` awaited calls"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best
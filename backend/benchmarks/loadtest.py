@@ -0,0 +1,356 @@
+"""Drive a running API at a target request rate and report latency percentiles.
+
+Seed a local mongod and start the server first, then run from the
+backend directory:
+
+    python init_data.py --games 1000000 --backlog 200000
+    uvicorn server:app --port 8001
+    python -m benchmarks.loadtest --url http://localhost:8001 --rps 200 --duration 60
+
+Every route under routes/ has a scenario, picked at random in proportion
+to its weight; --weight name=N changes one (0 disables it) and --list
+shows them. Requests are scheduled open-loop: each starts at its planned
+time whether or not earlier ones have finished, and its latency is
+measured from that time, so an overloaded server shows up as latency
+rather than as a quietly lower request rate. Requests the server sheds
+with a 503 (see admission.py) are counted apart and left out of the
+percentiles, so a run at twice the capacity the server sustains shows
+whether the requests it admits keep their latency. --output writes the results
+as JSON so runs can be compared over time.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+import httpx
+
+from init_data import LibraryGenerator
+from models import BacklogCreate, GameCreate
+from tenants import USER_HEADER
+
+SAMPLE_SIZE = 500
+REQUEST_TIMEOUT = 30.0
+
+def _body(doc: dict, model) -> dict:
+    """Request body for `model` from a generated document"""
+    return {
+        field: value.date().isoformat() if isinstance(value, datetime) else value
+        for field, value in doc.items() if field in model.model_fields
+    }
+
+class State:
+    """Ids the scenarios work on: a sample of existing items plus the ones created during the run"""
+
+    def __init__(self, rng: random.Random, seed: int):
+        self.rng = rng
+        self.generator = LibraryGenerator(seed)
+        self.game_ids = []
+        self.backlog_ids = []
+        self.created_games = deque()
+        self.created_backlog = deque()
+
+    async def load(self, client: httpx.AsyncClient):
+        for path, ids in (("/api/games/", self.game_ids), ("/api/backlog/", self.backlog_ids)):
+            response = await client.get(path, params={"limit": SAMPLE_SIZE, "fields": "id"})
+            response.raise_for_status()
+            ids.extend(item["id"] for item in response.json())
+        if not self.game_ids or not self.backlog_ids:
+            raise SystemExit("The database is empty; seed it with init_data.py first")
+
+    def game_id(self) -> str:
+        return self.rng.choice(self.game_ids)
+
+    def backlog_id(self) -> str:
+        return self.rng.choice(self.backlog_ids)
+
+    def game_body(self) -> dict:
+        return _body(self.generator.game(), GameCreate)
+
+    def backlog_body(self) -> dict:
+        return _body(self.generator.backlog_item(), BacklogCreate)
+
+    def pick(self, weights: dict) -> str:
+        return self.rng.choices(list(weights), list(weights.values()))[0]
+
+# Scenarios return the response, or None when there is nothing to do (e.g. no item left to delete)
+
+async def games_list(client, state):
+    params = {"limit": 50, "fields": "id,title,cover,status,platform"}
+    if state.rng.random() < 0.5:
+        params["status"] = state.pick({"Completed": 3, "In Progress": 2, "Not Started": 3, "Dropped": 1})
+    if state.rng.random() < 0.3:
+        params["platform"] = state.pick({"PC": 4, "PlayStation 5": 2, "Nintendo Switch": 2})
+    return await client.get("/api/games/", params=params)
+
+async def games_search(client, state):
+    return await client.get("/api/games/", params={"search": state.rng.choice(["shadow", "legacy", "studio 12"]), "limit": 20})
+
+async def games_facets(client, state):
+    return await client.get("/api/games/facets", params={"status": "Completed"})
+
+async def game_detail(client, state):
+    return await client.get(f"/api/games/{state.game_id()}")
+
+async def game_create(client, state):
+    response = await client.post("/api/games/", json=state.game_body())
+    if response.status_code == 200:
+        state.created_games.append(response.json()["id"])
+    return response
+
+async def game_update(client, state):
+    return await client.put(f"/api/games/{state.game_id()}", json={"progress": state.rng.randint(0, 100)})
+
+async def game_delete(client, state):
+    if not state.created_games:
+        return None
+    return await client.delete(f"/api/games/{state.created_games.popleft()}")
+
+async def games_bulk(client, state):
+    return await client.post("/api/games/bulk", json=[state.game_body() for _ in range(20)])
+
+async def games_export(client, state):
+    return await client.get("/api/games/export")
+
+async def dashboard_stats(client, state):
+    return await client.get("/api/games/stats/dashboard")
+
+async def backlog_list(client, state):
+    params = {"limit": 50}
+    if state.rng.random() < 0.5:
+        params["category"] = state.pick({"Wishlist": 3, "Maybe Later": 2, "Next to Play": 1})
+    return await client.get("/api/backlog/", params=params)
+
+async def backlog_facets(client, state):
+    return await client.get("/api/backlog/facets")
+
+async def backlog_ranked(client, state):
+    return await client.get("/api/backlog/ranked", params={"limit": 10})
+
+async def backlog_deals(client, state):
+    return await client.get("/api/backlog/deals", params={"limit": 20})
+
+async def backlog_detail(client, state):
+    return await client.get(f"/api/backlog/{state.backlog_id()}")
+
+async def backlog_create(client, state):
+    response = await client.post("/api/backlog/", json=state.backlog_body())
+    if response.status_code == 200:
+        state.created_backlog.append(response.json()["id"])
+    return response
+
+async def backlog_update(client, state):
+    return await client.put(f"/api/backlog/{state.backlog_id()}", json={"priority": state.pick({"High": 1, "Low": 1})})
+
+async def backlog_delete(client, state):
+    if not state.created_backlog:
+        return None
+    return await client.delete(f"/api/backlog/{state.created_backlog.popleft()}")
+
+async def backlog_move(client, state):
+    if not state.created_backlog:
+        return None
+    response = await client.post(
+        f"/api/backlog/{state.created_backlog.popleft()}/move-to-library", json={"status": "In Progress", "playtime": 2}
+    )
+    if response.status_code == 200:
+        state.created_games.append(response.json()["id"])
+    return response
+
+async def backlog_bulk(client, state):
+    return await client.post("/api/backlog/bulk", json=[state.backlog_body() for _ in range(20)])
+
+async def backlog_export(client, state):
+    return await client.get("/api/backlog/export")
+
+async def price_ingest(client, state):
+    rows = [{"id": state.backlog_id(), "price": round(state.rng.uniform(5, 70), 2)} for _ in range(10)]
+    return await client.post(
+        "/api/backlog/prices",
+        content="".join(json.dumps(row) + "\n" for row in rows),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+
+async def price_history(client, state):
+    return await client.get(f"/api/backlog/{state.backlog_id()}/prices")
+
+async def preferences_get(client, state):
+    return await client.get("/api/preferences/")
+
+async def preferences_update(client, state):
+    return await client.put("/api/preferences/", json={"language": state.pick({"en": 1, "pt": 1})})
+
+async def analytics_completions(client, state):
+    return await client.get("/api/analytics/completions")
+
+async def analytics_backlog_flow(client, state):
+    return await client.get("/api/analytics/backlog-flow")
+
+async def analytics_playtime(client, state):
+    return await client.get("/api/analytics/playtime", params={"by": state.pick({"genre": 1, "platform": 1})})
+
+async def analytics_ratings(client, state):
+    return await client.get("/api/analytics/ratings")
+
+async def bootstrap(client, state):
+    return await client.get("/api/bootstrap", params={"games.limit": 50, "backlog.limit": 50})
+
+async def cover(client, state):
+    return await client.get(f"/api/covers/{state.game_id()}", params={"size": "small"})
+
+async def events(client, state):
+    # The stream stays open; what is measured is the time until it is established
+    async with client.stream("GET", "/api/events") as response:
+        return response
+
+async def health_live(client, state):
+    return await client.get("/api/health/live")
+
+async def health_ready(client, state):
+    return await client.get("/api/health/ready")
+
+# Relative frequency of each scenario; reads dominate, as they do in the app.
+# Exports read the whole library and are off unless weighted in explicitly
+SCENARIOS = {
+    games_list: 20, games_search: 4, games_facets: 4, game_detail: 8, game_create: 2, game_update: 2,
+    game_delete: 1, games_bulk: 0.2, games_export: 0, dashboard_stats: 8,
+    backlog_list: 10, backlog_facets: 3, backlog_ranked: 3, backlog_deals: 3, backlog_detail: 4,
+    backlog_create: 2, backlog_update: 2, backlog_delete: 0.5, backlog_move: 0.5, backlog_bulk: 0.2,
+    backlog_export: 0, price_ingest: 1, price_history: 2,
+    preferences_get: 3, preferences_update: 0.5,
+    analytics_completions: 2, analytics_backlog_flow: 1, analytics_playtime: 1, analytics_ratings: 1,
+    bootstrap: 5, cover: 2, events: 0.5, health_live: 1, health_ready: 1,
+}
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def summarize(latencies: list, errors: int, shed: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "shed": shed,
+        "throughput": round(len(values) / elapsed, 2),
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+        "max_ms": round(values[-1], 2) if values else 0.0,
+    }
+
+async def run(args, weights: dict) -> dict:
+    rng = random.Random(args.seed)
+    state = State(rng, args.seed)
+    scenarios = [scenario for scenario, weight in weights.items() if weight > 0]
+    scenario_weights = [weights[scenario] for scenario in scenarios]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    shed = defaultdict(int)
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+
+    # Without --user the server acts for its default user
+    headers = {USER_HEADER: args.user} if args.user else {}
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=REQUEST_TIMEOUT, headers=headers) as client:
+        await state.load(client)
+
+        async def fire(scenario, planned: float, record: bool):
+            try:
+                response = await scenario(client, state)
+                if response is None:
+                    return
+                failed = response.status_code >= 400
+                overloaded = response.status_code == 503 and "retry-after" in response.headers
+            except httpx.HTTPError:
+                failed, overloaded = True, False
+            if not record:
+                return
+            if overloaded:
+                shed[scenario.__name__] += 1
+                return
+            latencies[scenario.__name__].append((time.perf_counter() - planned) * 1000)
+            if failed:
+                errors[scenario.__name__] += 1
+
+        tasks = set()
+        interval = 1 / args.rps
+        started = time.perf_counter()
+        measured_from = started + args.warmup
+        total = int((args.warmup + args.duration) * args.rps)
+        for sent in range(total):
+            planned = started + sent * interval
+            delay = planned - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            scenario = rng.choices(scenarios, scenario_weights)[0]
+            task = asyncio.ensure_future(fire(scenario, planned, planned >= measured_from))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - measured_from
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "startedAt": datetime.utcnow().isoformat(timespec="seconds"),
+        "url": args.url,
+        "targetRps": args.rps,
+        "duration": args.duration,
+        "seed": args.seed,
+        "host": platform.node(),
+        "total": summarize(all_latencies, sum(errors.values()), sum(shed.values()), elapsed),
+        "routes": {
+            name: summarize(latencies[name], errors[name], shed[name], elapsed)
+            for name in sorted(set(latencies) | set(shed))
+        },
+    }
+
+def print_report(report: dict):
+    print(f"{'scenario':>24} {'requests':>8} {'errors':>6} {'shed':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    rows = list(report["routes"].items()) + [("total", report["total"])]
+    for name, stats in rows:
+        print(
+            f"{name:>24} {stats['requests']:>8} {stats['errors']:>6} {stats['shed']:>6} {stats['throughput']:>8.1f} "
+            f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['max_ms']:>8.2f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API at a fixed request rate")
+    parser.add_argument("--url", default="http://localhost:8001", help="base URL of the running server")
+    parser.add_argument("--rps", type=float, default=100, help="requests started per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    parser.add_argument("--connections", type=int, default=256, help="maximum open connections")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the scenario mix and request bodies")
+    parser.add_argument("--user", help="user id sent in the X-User-Id header")
+    parser.add_argument("--weight", action="append", default=[], metavar="NAME=N", help="override a scenario's weight")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and their weights")
+    args = parser.parse_args()
+
+    weights = dict(SCENARIOS)
+    by_name = {scenario.__name__: scenario for scenario in SCENARIOS}
+    for override in args.weight:
+        name, _, value = override.partition("=")
+        if name not in by_name:
+            parser.error(f"Unknown scenario {name}; see --list")
+        weights[by_name[name]] = float(value)
+    if args.list:
+        for scenario, weight in weights.items():
+            print(f"{scenario.__name__:>24} {weight:>6}")
+        return
+
+    report = asyncio.run(run(args, weights))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Callable, Iterator, Type
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+from models import BulkImportResponse, BulkRowError
+from dates import DATE_FIELDS, format_date
+
+BATCH_SIZE = 1000
+# Only the first errors are echoed back so a bad file cannot produce a huge response
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS_BY_MEDIA_TYPE = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+FORMATS_BY_SUFFIX = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _media_type(content_type: str) -> str:
+    return (content_type or "").split(";")[0].strip().lower()
+
+def _parse_rows(text, fmt: str) -> Iterator:
+    """Yield one dict per row, or the exception that made a row unreadable"""
+    if fmt == "json":
+        try:
+            rows = json.load(text)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array")
+        yield from rows
+    elif fmt == "ndjson":
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+    else:
+        for row in csv.DictReader(text):
+            # Blank cells mean "not provided" so optional fields fall back to their defaults
+            yield {k: v for k, v in row.items() if k and v not in ("", None)}
+
+async def read_rows(request: Request) -> Iterator:
+    """Read a JSON array, NDJSON or CSV body, or a multipart upload in the `file` field"""
+    media_type = _media_type(request.headers.get("content-type"))
+
+    if media_type == "multipart/form-data":
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected an uploaded file in the 'file' field")
+        suffix = "." + (upload.filename or "").rsplit(".", 1)[-1].lower()
+        fmt = FORMATS_BY_SUFFIX.get(suffix) or FORMATS_BY_MEDIA_TYPE.get(_media_type(upload.content_type))
+        text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    else:
+        fmt = FORMATS_BY_MEDIA_TYPE.get(media_type)
+        text = io.StringIO((await request.body()).decode("utf-8-sig"), newline="")
+
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Upload JSON, NDJSON or CSV data")
+    return _parse_rows(text, fmt)
+
+async def _insert_batch(collection, batch: list, errors: list) -> list:
+    """Insert a batch unordered and return the documents that were written"""
+    try:
+        await collection.insert_many([doc for _, doc in batch], ordered=False)
+        return [doc for _, doc in batch]
+    except BulkWriteError as e:
+        failed = {}
+        for write_error in e.details.get("writeErrors", []):
+            failed[write_error["index"]] = write_error.get("errmsg", "Write failed")
+        for position, message in failed.items():
+            errors.append(BulkRowError(row=batch[position][0], errors=[message]))
+        return [doc for position, (_, doc) in enumerate(batch) if position not in failed]
+
+def validate_rows(rows: Iterator, model: Type[BaseModel], errors: list) -> Iterator:
+    """Yield (row number, model instance) for every valid row; invalid rows are added to `errors`.
+
+    Rows are numbered from 0 in upload order.
+    """
+    for index, row in enumerate(rows):
+        if isinstance(row, Exception):
+            errors.append(BulkRowError(row=index, errors=[f"Unreadable row: {row}"]))
+            continue
+        if not isinstance(row, dict):
+            errors.append(BulkRowError(row=index, errors=["Expected an object"]))
+            continue
+        try:
+            instance = model(**row)
+        except ValidationError as e:
+            errors.append(BulkRowError(
+                row=index,
+                errors=[f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()]
+            ))
+            continue
+        yield index, instance
+
+async def import_rows(
+    rows: Iterator,
+    model: Type[BaseModel],
+    collection,
+    to_document: Callable[[BaseModel], dict],
+    on_inserted: Callable
+) -> BulkImportResponse:
+    """Validate rows against `model` and insert them in unordered batches.
+
+    `on_inserted` is awaited with every written batch so derived data such
+    as the stats counters stays in sync.
+    """
+    errors = []
+    inserted = 0
+    batch = []
+
+    for index, instance in validate_rows(rows, model, errors):
+        batch.append((index, to_document(instance)))
+        if len(batch) >= BATCH_SIZE:
+            written = await _insert_batch(collection, batch, errors)
+            await on_inserted(written)
+            inserted += len(written)
+            batch = []
+
+    if batch:
+        written = await _insert_batch(collection, batch, errors)
+        await on_inserted(written)
+        inserted += len(written)
+
+    errors.sort(key=lambda error: error.row)
+    return BulkImportResponse(inserted=inserted, failed=len(errors), errors=errors[:MAX_REPORTED_ERRORS])
+
+def _export_value(field: str, value):
+    if field in DATE_FIELDS:
+        return format_date(value)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+async def _export_rows(cursor, fields: list, fmt: str):
+    """Stream documents from `cursor` as NDJSON or CSV, one batch of rows at a time"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        async for doc in cursor:
+            writer.writerow({field: _export_value(field, doc.get(field)) for field in fields})
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        async for doc in cursor:
+            yield json.dumps({field: _export_value(field, doc.get(field)) for field in fields}) + "\n"
+
+def export_response(cursor, model: Type[BaseModel], fmt: str, name: str) -> StreamingResponse:
+    """Stream a download of every document in `cursor` with the fields of `model`"""
+    return StreamingResponse(
+        _export_rows(cursor, list(model.model_fields), fmt),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    )
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from fastapi import Request, Response
+from serialize import encode
+
+# Cache namespaces, invalidated by the write handlers that change their data
+GAMES = "games"
+BACKLOG = "backlog"
+PREFERENCES = "preferences"
+STATS = "stats"
+ANALYTICS = "analytics"
+
+class InMemoryCacheBackend:
+    """Process-local TTL + LRU store.
+
+    It exposes the same small get/set/incr surface as a Redis client so a
+    shared backend can be swapped in when several workers must see the same
+    invalidations; with this backend each worker invalidates only its own
+    entries and other workers catch up when their entries expire.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        # Counters live outside the LRU so they are never evicted
+        if key in self._counters:
+            return self._counters[key]
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ex: int):
+        self._entries[key] = (time.monotonic() + ex, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+class ResponseCache:
+    """Caches encoded JSON responses per user, namespace and filter parameters.
+
+    Invalidating a user's namespace gives it a new version, which is part
+    of every key, so stale entries are never read again and age out through
+    TTL/LRU. Versions are drawn from one ever-increasing sequence and are
+    cached entries themselves: with many users they cannot all be kept, and
+    one that was evicted is replaced by a fresh number that no stale entry
+    carries. Responses carry an ETag and unchanged ones are answered with 304.
+    """
+
+    def __init__(self, backend, ttl: int = 30):
+        self.backend = backend
+        self.ttl = ttl
+
+    async def _new_version(self, version_key: str) -> int:
+        version = await self.backend.incr("version:sequence")
+        # Outlives every entry cached under it, so losing it only costs misses
+        await self.backend.set(version_key, version, ex=self.ttl * 10)
+        return version
+
+    async def _key(self, user_id: str, namespace: str, params: dict) -> str:
+        version_key = f"version:{user_id}:{namespace}"
+        version = await self.backend.get(version_key) or await self._new_version(version_key)
+        normalized = sorted((k, str(v)) for k, v in params.items() if v not in (None, "", "All"))
+        return f"{namespace}:{version}:{json.dumps(normalized)}"
+
+    async def respond(
+        self,
+        request: Request,
+        user_id: str,
+        namespace: str,
+        params: dict,
+        produce: Callable[[Response], Awaitable[Any]]
+    ) -> Response:
+        """Serve a cached response, or build one with `produce` and cache it.
+
+        `produce` receives a scratch response so it can set headers, such as
+        the next page cursor, that are cached alongside the body. It may
+        return pre-encoded JSON bytes or anything `serialize.encode` accepts.
+        """
+        key = await self._key(user_id, namespace, params)
+        entry = await self.backend.get(key)
+        if entry is None:
+            scratch = Response()
+            data = await produce(scratch)
+            body = encode(data)
+            headers = {k: v for k, v in scratch.headers.items() if k.lower() != "content-length"}
+            headers["ETag"] = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            entry = (body, headers)
+            await self.backend.set(key, entry, ex=self.ttl)
+
+        body, headers = entry
+        headers = {**headers, "Cache-Control": "no-cache"}
+        if headers["ETag"] in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, user_id: str, *namespaces: str):
+        """Drop `user_id`'s cached responses in `namespaces`; other users' entries stay valid"""
+        for namespace in namespaces:
+            await self._new_version(f"version:{user_id}:{namespace}")
+
+response_cache = ResponseCache(
+    InMemoryCacheBackend(max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", 1024))),
+    ttl=int(os.environ.get("CACHE_TTL_SECONDS", 30))
+)
@@ -0,0 +1,108 @@
+"""Bookkeeping that has to follow every write made by the route handlers.
+
+Handlers call these after a successful write so derived data (stats
+counters, analytics rollups, cached responses) stays consistent with the
+collections and subscribers of the change feed hear about it. Each takes
+the id of the user whose data was written and only touches that user's
+derived data and subscribers.
+"""
+import asyncio
+import analytics
+from cache import ANALYTICS, BACKLOG, GAMES, PREFERENCES, STATS, response_cache
+from dates import DATE_FIELDS, format_date
+from events import broker
+from ranking import backlog_rankers
+from deals import record_prices
+from stats import record_backlog_change, record_game_change, record_games_inserted
+
+def _public(doc: dict) -> dict:
+    return {k: format_date(v) if k in DATE_FIELDS else v for k, v in doc.items() if k != "_id"}
+
+def _changed_fields(before: dict, after: dict) -> dict:
+    changed = _public({k: v for k, v in after.items() if before.get(k) != v})
+    changed["id"] = after["id"]
+    return changed
+
+async def game_created(user_id: str, game: dict):
+    backlog_rankers.invalidate_affinity(user_id)
+    await asyncio.gather(record_game_change(user_id, after=game), analytics.record_game_change(user_id, after=game))
+    await response_cache.invalidate(user_id, GAMES, STATS, ANALYTICS)
+    broker.publish(user_id, "games", "create", _public(game))
+
+async def games_inserted(user_id: str, games: list):
+    backlog_rankers.invalidate_affinity(user_id)
+    await asyncio.gather(record_games_inserted(user_id, games), analytics.record_games_inserted(user_id, games))
+    await response_cache.invalidate(user_id, GAMES, STATS, ANALYTICS)
+    # Bulk imports are announced as a whole; subscribers refetch the listing
+    broker.publish(user_id, "games", "bulk_create", {"count": len(games)})
+
+async def game_updated(user_id: str, before: dict, after: dict):
+    if before.get("rating") != after.get("rating") or before.get("genre") != after.get("genre"):
+        backlog_rankers.invalidate_affinity(user_id)
+    await asyncio.gather(
+        record_game_change(user_id, before, after), analytics.record_game_change(user_id, before, after)
+    )
+    await response_cache.invalidate(user_id, GAMES, STATS, ANALYTICS)
+    broker.publish(user_id, "games", "update", _changed_fields(before, after))
+
+async def game_deleted(user_id: str, game: dict):
+    backlog_rankers.invalidate_affinity(user_id)
+    await asyncio.gather(record_game_change(user_id, before=game), analytics.record_game_change(user_id, before=game))
+    await response_cache.invalidate(user_id, GAMES, STATS, ANALYTICS)
+    broker.publish(user_id, "games", "delete", {"id": game["id"]})
+
+async def games_archived(user_id: str, game_ids: list):
+    """Games moved to the archive tier; counted the same there, they only leave the default listings"""
+    await response_cache.invalidate(user_id, GAMES)
+    broker.publish(user_id, "games", "archive", {"ids": game_ids})
+
+def _price_point(item: dict) -> tuple:
+    return item["id"], item["currentPrice"], item["updatedAt"]
+
+async def backlog_created(user_id: str, item: dict):
+    backlog_rankers.invalidate_backlog(user_id)
+    await asyncio.gather(
+        record_backlog_change(user_id, 1),
+        analytics.record_backlog_added(user_id, [item]),
+        record_prices([_price_point(item)])
+    )
+    await response_cache.invalidate(user_id, BACKLOG, STATS, ANALYTICS)
+    broker.publish(user_id, "backlog", "create", _public(item))
+
+async def backlog_inserted(user_id: str, items: list):
+    backlog_rankers.invalidate_backlog(user_id)
+    await asyncio.gather(
+        record_backlog_change(user_id, len(items)),
+        analytics.record_backlog_added(user_id, items),
+        record_prices([_price_point(item) for item in items])
+    )
+    await response_cache.invalidate(user_id, BACKLOG, STATS, ANALYTICS)
+    broker.publish(user_id, "backlog", "bulk_create", {"count": len(items)})
+
+async def backlog_updated(user_id: str, before: dict, after: dict):
+    backlog_rankers.invalidate_backlog(user_id)
+    if before.get("currentPrice") != after.get("currentPrice"):
+        await record_prices([_price_point(after)])
+    await response_cache.invalidate(user_id, BACKLOG)
+    broker.publish(user_id, "backlog", "update", _changed_fields(before, after))
+
+async def backlog_prices_updated(user_id: str, item_ids: list):
+    """A price sync changed the current price of `item_ids`; their history is already recorded"""
+    backlog_rankers.invalidate_backlog(user_id)
+    await response_cache.invalidate(user_id, BACKLOG)
+    broker.publish(user_id, "backlog", "bulk_update", {"count": len(item_ids)})
+
+async def backlog_deleted(user_id: str, item: dict):
+    backlog_rankers.invalidate_backlog(user_id)
+    await record_backlog_change(user_id, -1)
+    await response_cache.invalidate(user_id, BACKLOG, STATS)
+    broker.publish(user_id, "backlog", "delete", {"id": item["id"]})
+
+async def backlog_moved(user_id: str, item: dict):
+    """A backlog item was moved to the library; the new game is reported separately"""
+    await asyncio.gather(backlog_deleted(user_id, item), analytics.record_backlog_moved(user_id))
+    await response_cache.invalidate(user_id, ANALYTICS)
+
+async def preferences_updated(user_id: str, prefs: dict):
+    await response_cache.invalidate(user_id, PREFERENCES)
+    broker.publish(user_id, "preferences", "update", _public(prefs))
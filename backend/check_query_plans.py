@@ -0,0 +1,146 @@
+import asyncio
+import sys
+from datetime import date, datetime
+from archive import archivable
+from database import (
+    games_collection, games_archive_collection, backlog_collection, price_history_collection, preferences_collection,
+    stats_collection, analytics_collection, create_indexes, close_db_connection, get_database
+)
+from facets import facet_pipeline
+from pagination import SORT_ORDER, apply_cursor, encode_cursor
+from ranking import affinity_pipeline
+from search import SCORE_SORT
+from stats import games_stats_pipeline
+from routes.games import build_games_query
+from routes.backlog import build_backlog_query
+from routes.covers import cover_query
+from tenants import DEFAULT_USER_ID
+
+SAMPLE_CURSOR = encode_cursor({"createdAt": datetime(2024, 1, 1), "id": "sample"})
+USER = {"userId": DEFAULT_USER_ID}
+
+def route_queries():
+    """Yield (label, collection, filter, sort) for every query shape the routes issue"""
+    for collection, label in (
+        (games_collection, "games"), (games_archive_collection, "games archive"), (backlog_collection, "backlog")
+    ):
+        yield f"{label} by id", collection, {**USER, "id": "sample"}, None
+        yield f"{label} cover", collection, cover_query(DEFAULT_USER_ID, "sample"), None
+    yield "games archive list", games_archive_collection, USER, SORT_ORDER
+    yield "games archive page", games_archive_collection, apply_cursor(USER, SAMPLE_CURSOR), SORT_ORDER
+    yield "games archiver sweep", games_collection, archivable(datetime(2024, 1, 1)), None
+
+    game_filters = [
+        {},
+        {"platform": "PC"},
+        {"genre": "RPG"},
+        {"status": "Completed"},
+        {"platform": "PC", "genre": "RPG", "status": "Completed"},
+        {"completed_from": date(2024, 1, 1), "completed_to": date(2024, 12, 31)},
+        {"released_from": date(2020, 1, 1)},
+        {"search": "witcher"},
+        {"platform": "PC", "search": "witcher"},
+    ]
+    for filters in game_filters:
+        query = build_games_query(DEFAULT_USER_ID, **filters)
+        if "search" in filters:
+            yield f"games search {filters}", games_collection, query, SCORE_SORT + SORT_ORDER
+            continue
+        yield f"games list {filters}", games_collection, query, SORT_ORDER
+        yield f"games page {filters}", games_collection, apply_cursor(query, SAMPLE_CURSOR), SORT_ORDER
+
+    backlog_filters = [
+        {},
+        {"category": "Wishlist"},
+        {"priority": "High"},
+        {"platform": "PC"},
+        {"category": "Wishlist", "priority": "High", "platform": "PC"},
+        {"released_to": date(2023, 12, 31)},
+        {"search": "gate"},
+    ]
+    deals_sort = [("discountPct", -1), ("id", 1)]
+    yield "backlog deals", backlog_collection, {**USER, "isDeal": True}, deals_sort
+    yield "backlog deals min discount", backlog_collection, {**USER, "isDeal": True, "discountPct": {"$gte": 20}}, deals_sort
+    yield "price history", price_history_collection, {"itemId": "sample"}, [("at", 1)]
+    yield "preferences", preferences_collection, USER, None
+    yield "stats", stats_collection, USER, None
+    yield "analytics totals", analytics_collection, {**USER, "key": "totals"}, None
+    yield "analytics months", analytics_collection, {**USER, "key": {"$gte": "month:2024-01", "$lte": "month:2024-12"}}, [("key", 1)]
+
+    for filters in backlog_filters:
+        query = build_backlog_query(DEFAULT_USER_ID, **filters)
+        if "search" in filters:
+            yield f"backlog search {filters}", backlog_collection, query, SCORE_SORT + SORT_ORDER
+            continue
+        yield f"backlog list {filters}", backlog_collection, query, SORT_ORDER
+        yield f"backlog page {filters}", backlog_collection, apply_cursor(query, SAMPLE_CURSOR), SORT_ORDER
+
+def route_aggregations():
+    """Yield (label, collection, pipeline) for every aggregation the routes run"""
+    game_facets = {"platform": "PC", "genre": None, "status": None}
+    for search in (None, "witcher"):
+        base_query = build_games_query(DEFAULT_USER_ID, search=search)
+        for collection, label in ((games_collection, "games"), (games_archive_collection, "games archive")):
+            yield f"{label} facets search={search}", collection, facet_pipeline(game_facets, base_query)
+        base_query = build_backlog_query(DEFAULT_USER_ID, search=search)
+        backlog_facets = {"category": "Wishlist", "priority": None, "platform": None}
+        yield f"backlog facets search={search}", backlog_collection, facet_pipeline(backlog_facets, base_query)
+    for collection, label in ((games_collection, "games"), (games_archive_collection, "games archive")):
+        yield f"{label} genre affinity", collection, affinity_pipeline(DEFAULT_USER_ID)
+        yield f"{label} stats", collection, games_stats_pipeline(DEFAULT_USER_ID)
+
+def winning_plans(explained: dict):
+    """Yield the winning plans in the explain output of a find or an aggregation"""
+    if "queryPlanner" in explained:
+        yield explained["queryPlanner"]["winningPlan"]
+    for stage in explained.get("stages", []):
+        if "$cursor" in stage:
+            yield from winning_plans(stage["$cursor"])
+    for shard in explained.get("shards", {}).values():
+        yield from winning_plans(shard)
+
+def plan_stages(plan: dict):
+    """Yield every stage name in a winning plan tree"""
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+async def explained_queries():
+    """Yield (label, explain output) for every route query and aggregation"""
+    for label, collection, query, sort in route_queries():
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        yield label, await cursor.explain()
+    for label, collection, pipeline in route_aggregations():
+        yield label, await get_database().command("aggregate", collection.name, pipeline=pipeline, explain=True)
+
+async def find_collection_scans() -> list:
+    """Explain every route query and aggregation and return the labels of those planned as COLLSCAN"""
+    failures = []
+    async for label, explained in explained_queries():
+        stages = [stage for plan in winning_plans(explained) for stage in plan_stages(plan)]
+        status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        print(f"{status:>8}  {label}: {' <- '.join(stages)}")
+        if status == "COLLSCAN":
+            failures.append(label)
+    return failures
+
+async def main() -> int:
+    try:
+        await create_indexes()
+        failures = await find_collection_scans()
+    finally:
+        await close_db_connection()
+    if failures:
+        print(f"{len(failures)} route queries fall back to a collection scan")
+        return 1
+    print("All route queries are served by an index")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
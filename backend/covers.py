@@ -0,0 +1,269 @@
+"""Local cache of cover images and their thumbnails.
+
+Each cover URL is fetched once; the image is stored under the SHA-256 of
+its content, so covers shared by several games are kept once, and a small
+file per URL records which content it resolved to. Thumbnails are
+rendered in a process pool at a few fixed sizes. Originals, thumbnails and
+the URL files share one size budget and the least recently served are
+evicted first. File work runs in threads, off the event loop.
+
+The fetcher is pluggable: anything with an async `fetch(url) -> bytes`
+can replace the HTTP one, e.g. to serve covers from a local directory.
+"""
+import asyncio
+import hashlib
+import ipaddress
+import os
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+import httpx
+from PIL import Image, ImageOps
+
+ROOT_DIR = Path(__file__).parent
+
+CACHE_DIR = Path(os.environ.get("COVER_CACHE_DIR", ROOT_DIR / "cover_cache"))
+CACHE_MAX_BYTES = int(os.environ.get("COVER_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+THUMBNAIL_WORKERS = int(os.environ.get("COVER_THUMBNAIL_WORKERS", 2))
+MAX_COVER_BYTES = 10 * 1024 * 1024
+MAX_REDIRECTS = 3
+
+# Box art is 2:3; every size is cropped to fill the box exactly so grids line up
+THUMBNAIL_SIZES = {"small": (120, 180), "medium": (240, 360), "large": (480, 720)}
+THUMBNAIL_MEDIA_TYPE = "image/webp"
+
+class CoverUnavailable(Exception):
+    """The cover could not be fetched or is not an image"""
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+def render_thumbnail(source: str, target: str, size: tuple) -> int:
+    """Crop and scale `source` to `size` and save it as WebP; runs in the thumbnail pool"""
+    try:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            thumbnail = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+    except (OSError, Image.DecompressionBombError):
+        raise CoverUnavailable("Cover is not a readable image")
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    temporary = f"{target}.{os.getpid()}.tmp"
+    thumbnail.save(temporary, "WEBP", quality=80)
+    os.replace(temporary, target)
+    return os.path.getsize(target)
+
+class HttpCoverFetcher:
+    """Downloads covers over HTTP(S), refusing hosts on private networks"""
+
+    def __init__(self, timeout: float = 10.0, max_bytes: int = MAX_COVER_BYTES):
+        self.max_bytes = max_bytes
+        self._client = httpx.AsyncClient(timeout=timeout, follow_redirects=False)
+
+    async def _check_public(self, url: str):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise CoverUnavailable(f"Unsupported cover URL: {url}")
+        try:
+            addresses = await asyncio.get_running_loop().getaddrinfo(parsed.hostname, None, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise CoverUnavailable(f"Cannot resolve {parsed.hostname}: {e}")
+        for *_, sockaddr in addresses:
+            if not ipaddress.ip_address(sockaddr[0]).is_global:
+                raise CoverUnavailable(f"Refusing to fetch a cover from {parsed.hostname}")
+
+    async def fetch(self, url: str) -> bytes:
+        for _ in range(MAX_REDIRECTS + 1):
+            await self._check_public(url)
+            try:
+                async with self._client.stream("GET", url) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    if response.status_code != 200:
+                        raise CoverUnavailable(f"Cover host answered {response.status_code}")
+                    data = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        data += chunk
+                        if len(data) > self.max_bytes:
+                            raise CoverUnavailable("Cover image is too large")
+                    return bytes(data)
+            except httpx.HTTPError as e:
+                raise CoverUnavailable(f"Cover download failed: {e}")
+        raise CoverUnavailable("Too many redirects")
+
+    async def close(self):
+        await self._client.aclose()
+
+class DiskLRU:
+    """Tracks cached files by last use and deletes the oldest beyond `max_bytes`.
+
+    Serving a file bumps its mtime, so recency survives restarts. Called
+    from worker threads; the bookkeeping is guarded by a lock.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._files = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        files = []
+        for directory in ("objects", "thumbs", "urls"):
+            for path in (self.root / directory).rglob("*"):
+                if path.is_file() and not path.name.endswith(".tmp"):
+                    stat = path.stat()
+                    files.append((stat.st_mtime, str(path), stat.st_size))
+        self._files = OrderedDict((path, size) for _, path, size in sorted(files))
+        self.total = sum(self._files.values())
+
+    def touch(self, *paths: Path):
+        with self._lock:
+            if self._files is None:
+                self._load()
+            for path in paths:
+                key = str(path)
+                if key in self._files:
+                    self._files.move_to_end(key)
+                    try:
+                        os.utime(path)
+                    except FileNotFoundError:
+                        self.total -= self._files.pop(key)
+
+    def add(self, path: Path, size: int):
+        with self._lock:
+            if self._files is None:
+                self._load()
+            key = str(path)
+            self.total += size - self._files.pop(key, 0)
+            self._files[key] = size
+            while self.total > self.max_bytes and len(self._files) > 1:
+                oldest, oldest_size = self._files.popitem(last=False)
+                self.total -= oldest_size
+                try:
+                    os.remove(oldest)
+                except FileNotFoundError:
+                    pass
+
+class CoverStore:
+    def __init__(self, root: Path = CACHE_DIR, fetcher=None, max_bytes: int = CACHE_MAX_BYTES, workers: int = THUMBNAIL_WORKERS):
+        self.root = root
+        self.fetcher = fetcher or HttpCoverFetcher()
+        self.lru = DiskLRU(root, max_bytes)
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight = {}
+
+    def _url_path(self, url: str) -> Path:
+        key = _sha256(url.encode())
+        return self.root / "urls" / key[:2] / key
+
+    def _object_path(self, content_hash: str) -> Path:
+        return self.root / "objects" / content_hash[:2] / content_hash
+
+    def _thumb_path(self, content_hash: str, size: str) -> Path:
+        return self.root / "thumbs" / content_hash[:2] / f"{content_hash}-{size}.webp"
+
+    async def _once(self, key: tuple, factory):
+        """Run `factory()` once for concurrent requests sharing `key`"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    # The blocking helpers below run in a thread through asyncio.to_thread
+
+    def _cached_hash(self, url: str) -> Optional[str]:
+        """Content hash `url` resolved to, if its URL file is still cached"""
+        try:
+            return self._url_path(url).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    def _cached_original(self, url: str) -> Optional[str]:
+        content_hash = self._cached_hash(url)
+        if content_hash is not None and self._object_path(content_hash).exists():
+            return content_hash
+        return None
+
+    def _cached_thumbnail(self, url: str, size: str) -> Optional[tuple]:
+        """(path, content hash) of the cached `size` thumbnail of `url`, marked as used"""
+        content_hash = self._cached_hash(url)
+        if content_hash is None:
+            return None
+        thumb_path = self._thumb_path(content_hash, size)
+        if not thumb_path.exists():
+            return None
+        self.lru.touch(self._url_path(url), thumb_path)
+        return thumb_path, content_hash
+
+    def _store_original(self, url: str, content_hash: str, data: bytes):
+        object_path = self._object_path(content_hash)
+        if not object_path.exists():
+            _write_atomic(object_path, data)
+            self.lru.add(object_path, len(data))
+        url_path = self._url_path(url)
+        _write_atomic(url_path, content_hash.encode())
+        self.lru.add(url_path, len(content_hash))
+
+    async def _original(self, url: str) -> str:
+        """Content hash of the image behind `url`, downloading it if it is not cached"""
+        content_hash = await asyncio.to_thread(self._cached_original, url)
+        if content_hash is not None:
+            return content_hash
+
+        data = await self.fetcher.fetch(url)
+        content_hash = _sha256(data)
+        await asyncio.to_thread(self._store_original, url, content_hash, data)
+        return content_hash
+
+    async def _render(self, content_hash: str, size: str) -> Path:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        thumb_path = self._thumb_path(content_hash, size)
+        object_path = self._object_path(content_hash)
+        try:
+            written = await asyncio.get_running_loop().run_in_executor(
+                self._pool, render_thumbnail, str(object_path), str(thumb_path), THUMBNAIL_SIZES[size]
+            )
+        except CoverUnavailable:
+            # Forget the download so a cover fixed at its source is fetched again
+            await asyncio.to_thread(object_path.unlink, missing_ok=True)
+            raise
+        await asyncio.to_thread(self.lru.add, thumb_path, written)
+        return thumb_path
+
+    async def thumbnail(self, url: str, size: str) -> tuple:
+        """(path, content hash) of the `size` thumbnail of the cover at `url`"""
+        cached = await asyncio.to_thread(self._cached_thumbnail, url, size)
+        if cached is not None:
+            return cached
+
+        content_hash = await self._once(("fetch", url), lambda: self._original(url))
+        thumb_path = self._thumb_path(content_hash, size)
+        if not await asyncio.to_thread(thumb_path.exists):
+            thumb_path = await self._once(("render", content_hash, size), lambda: self._render(content_hash, size))
+        await asyncio.to_thread(self.lru.touch, self._url_path(url), thumb_path)
+        return thumb_path, content_hash
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        close = getattr(self.fetcher, "close", None)
+        if close is not None:
+            await close()
+
+cover_store = CoverStore()
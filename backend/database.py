@@ -1,20 +1,268 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+"""Database lifecycle, collections and indexes.
+
+The client is created on first use rather than at import, so importing
+the app never waits on the network (a mongodb+srv:// URL is resolved
+when the client is built). `connect_db` opens it at startup, retrying
+while MongoDB is still coming up, and warms the connection pool.
+
+STORAGE_BACKEND selects where the data lives: "mongo" (the default) or
+"sqlite", the embedded store in embedded.py for single-node deployments,
+kept in the file at SQLITE_PATH. Both expose the same collection API, so
+nothing outside this module depends on the choice.
+"""
+import asyncio
+import logging
 import os
+import time
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import CollectionInvalid, ConnectionFailure
 from dotenv import load_dotenv
 from pathlib import Path
+from embedded import EmbeddedDatabase
+from metrics import query_monitor
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+logger = logging.getLogger(__name__)
+
+# Client options and the environment variables overriding them. Server
+# selection gives up well before the driver's 30s default so a missing
+# database fails probes and requests quickly instead of piling them up
+CLIENT_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", 100),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", 300_000),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10_000),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5_000),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", 5_000),
+    # 0 leaves operations without a socket timeout, as long exports and rebuilds need
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", 0),
+}
+CONNECT_ATTEMPTS = int(os.environ.get("MONGO_CONNECT_ATTEMPTS", 5))
+RETRY_BASE_DELAY = float(os.environ.get("MONGO_RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = 5.0
+WARM_CONNECTIONS = int(os.environ.get("MONGO_WARM_CONNECTIONS", 4))
+BACKENDS = ("mongo", "sqlite")
+
+def client_options() -> dict:
+    options = {name: int(os.environ.get(variable, default)) for name, (variable, default) in CLIENT_OPTIONS.items()}
+    # Reads and writes interrupted by a failover or dropped connection are retried once by the driver
+    return {**options, "retryReads": True, "retryWrites": True}
+
+_client: Optional[AsyncIOMotorClient] = None
+_db = None
+
+def get_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[query_monitor], **client_options())
+    return _client
+
+def storage_backend() -> str:
+    backend = os.environ.get("STORAGE_BACKEND", "mongo").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+    return backend
+
+def get_database():
+    global _db
+    if _db is None:
+        if storage_backend() == "sqlite":
+            path = os.environ.get("SQLITE_PATH") or ROOT_DIR / f"{os.environ.get('DB_NAME', 'gameplan')}.sqlite3"
+            _db = EmbeddedDatabase(path)
+        else:
+            _db = get_client()[os.environ['DB_NAME']]
+    return _db
+
+class LazyCollection:
+    """Stands in for a collection of the configured backend and resolves it on first use.
+
+    Modules import the collections below at import time; this keeps those
+    imports from creating the client.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._database = None
+        self._collection = None
+
+    def __getattr__(self, attribute: str):
+        database = get_database()
+        if self._database is not database:
+            self._database, self._collection = database, database[self.name]
+        return getattr(self._collection, attribute)
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({self.name!r})"
 
 # Collections
-games_collection = db.games
-backlog_collection = db.backlog
-preferences_collection = db.preferences
+games_collection = LazyCollection("games")
+games_archive_collection = LazyCollection("games_archive")
+backlog_collection = LazyCollection("backlog")
+preferences_collection = LazyCollection("preferences")
+stats_collection = LazyCollection("stats")
+analytics_collection = LazyCollection("analytics")
+price_history_collection = LazyCollection("price_history")
+
+async def with_retries(operation, attempts: int = CONNECT_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY):
+    """Await `operation()`, retrying connection errors with exponential backoff.
+
+    Meant for idempotent work such as startup; request handlers rely on the
+    driver's own retryable reads and writes.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await operation()
+        except ConnectionFailure as e:
+            if attempt == attempts:
+                raise
+            delay = min(base_delay * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+            logger.warning("MongoDB unavailable (attempt %d/%d), retrying in %.1fs: %s", attempt, attempts, delay, e)
+            await asyncio.sleep(delay)
+
+async def ping() -> float:
+    """Round trip a ping to the database; returns the latency in milliseconds"""
+    started = time.perf_counter()
+    await get_database().command("ping")
+    return (time.perf_counter() - started) * 1000
+
+async def connect_db(warm_connections: int = WARM_CONNECTIONS):
+    """Wait until the database answers, then open `warm_connections` pooled connections.
+
+    Concurrent pings each check out their own connection, so the first
+    requests after startup do not pay for connection handshakes.
+    """
+    await with_retries(ping)
+    if warm_connections > 1:
+        await asyncio.gather(*(ping() for _ in range(warm_connections)))
+
+# Every query is scoped to one user, so every index leads with userId; listings
+# sort on (createdAt, id) and every equality filter leads an index ending in that sort
+_SORT_KEYS = [("createdAt", ASCENDING), ("id", ASCENDING)]
+_USER = [("userId", ASCENDING)]
+
+# Title matches rank above developer matches, which rank above matches in notes.
+# The userId prefix makes a search read only the user's part of the index
+_SEARCH_INDEX = IndexModel(
+    _USER + [("title", TEXT), ("developer", TEXT), ("notes", TEXT)],
+    name="userId_search_text",
+    weights={"title": 10, "developer": 5, "notes": 1}
+)
+
+INDEXES = {
+    "games": [
+        IndexModel(_USER + [("id", ASCENDING)], name="userId_id_unique", unique=True),
+        IndexModel(_USER + _SORT_KEYS, name="userId_createdAt_id"),
+        IndexModel(_USER + [("platform", ASCENDING)] + _SORT_KEYS, name="userId_platform_createdAt_id"),
+        IndexModel(_USER + [("genre", ASCENDING)] + _SORT_KEYS, name="userId_genre_createdAt_id"),
+        IndexModel(_USER + [("status", ASCENDING)] + _SORT_KEYS, name="userId_status_createdAt_id"),
+        IndexModel(_USER + [("completionDate", ASCENDING)], name="userId_completionDate"),
+        IndexModel(_USER + [("releaseDate", ASCENDING)], name="userId_releaseDate"),
+        _SEARCH_INDEX,
+        # The one index not led by userId: the archiver's sweep (archive.py) spans every user
+        IndexModel([("status", ASCENDING), ("updatedAt", ASCENDING)], name="status_updatedAt"),
+    ],
+    # Archived games are only read by id, in full listings and by search, so they keep fewer indexes
+    "games_archive": [
+        IndexModel(_USER + [("id", ASCENDING)], name="userId_id_unique", unique=True),
+        IndexModel(_USER + _SORT_KEYS, name="userId_createdAt_id"),
+        _SEARCH_INDEX,
+    ],
+    "backlog": [
+        IndexModel(_USER + [("id", ASCENDING)], name="userId_id_unique", unique=True),
+        IndexModel(_USER + _SORT_KEYS, name="userId_createdAt_id"),
+        IndexModel(_USER + [("category", ASCENDING)] + _SORT_KEYS, name="userId_category_createdAt_id"),
+        IndexModel(_USER + [("priority", ASCENDING)] + _SORT_KEYS, name="userId_priority_createdAt_id"),
+        IndexModel(_USER + [("platform", ASCENDING)] + _SORT_KEYS, name="userId_platform_createdAt_id"),
+        IndexModel(_USER + [("releaseDate", ASCENDING)], name="userId_releaseDate"),
+        IndexModel(
+            _USER + [("isDeal", ASCENDING), ("discountPct", DESCENDING), ("id", ASCENDING)],
+            name="userId_isDeal_discountPct_id"
+        ),
+        _SEARCH_INDEX,
+    ],
+    "price_history": [
+        IndexModel([("itemId", ASCENDING), ("at", ASCENDING)], name="itemId_at"),
+    ],
+    "preferences": [
+        IndexModel(_USER, name="userId_unique", unique=True),
+    ],
+    "stats": [
+        IndexModel(_USER, name="userId_unique", unique=True),
+    ],
+    "analytics": [
+        IndexModel(_USER + [("key", ASCENDING)], name="userId_key_unique", unique=True),
+    ],
+}
+
+# Indexes of the single-user schema, dropped by migrate_tenants.py
+SUPERSEDED_INDEXES = {
+    "games": [
+        "id_unique", "createdAt_id", "platform_createdAt_id", "genre_createdAt_id", "status_createdAt_id",
+        "completionDate", "releaseDate", "search_text",
+    ],
+    "backlog": [
+        "id_unique", "createdAt_id", "category_createdAt_id", "priority_createdAt_id", "platform_createdAt_id",
+        "releaseDate", "isDeal_discountPct_id", "search_text",
+    ],
+    "preferences": ["id_unique"],
+}
+
+# Shard keys for spreading users across a sharded cluster (see shard_collections.py).
+# Every request reads and writes one user's documents, and each query carries
+# userId, so it is routed to the shard holding that user instead of being
+# broadcast; the second field lets a very large library split across chunks.
+# Each unique index above starts with its collection's shard key, as sharding
+# requires. User ids should not increase monotonically (prefer UUIDs or
+# opaque subject ids), or new users would all land in the last chunk.
+SHARD_KEYS = {
+    "games": {"userId": 1, "id": 1},
+    "games_archive": {"userId": 1, "id": 1},
+    "backlog": {"userId": 1, "id": 1},
+    "preferences": {"userId": 1},
+    "stats": {"userId": 1},
+    "analytics": {"userId": 1, "key": 1},
+    # Time-series collections shard on their metaField; an item's points stay together
+    "price_history": {"itemId": 1},
+}
+
+# Options of the collections that are created explicitly. Price points are
+# stored as a time-series collection: MongoDB buckets the points of each item
+# together, which keeps the history compact on disk. Archived games are rarely
+# read, so their blocks are compressed with zstd, smaller than the default snappy
+COLLECTION_OPTIONS = {
+    "price_history": {"timeseries": {"timeField": "at", "metaField": "itemId", "granularity": "hours"}},
+    "games_archive": {"storageEngine": {"wiredTiger": {"configString": "block_compressor=zstd"}}},
+}
+
+async def create_indexes():
+    """Create the collections with options and the declared indexes; existing ones are left untouched"""
+    db = get_database()
+    existing = await db.list_collection_names()
+    for collection_name, options in COLLECTION_OPTIONS.items():
+        if collection_name not in existing:
+            try:
+                await db.create_collection(collection_name, **options)
+            except CollectionInvalid:
+                pass  # created by another worker in the meantime
+    for collection_name, indexes in INDEXES.items():
+        await db[collection_name].create_indexes(indexes)
+
+async def user_ids() -> list:
+    """Ids of every user who owns games, archived games or backlog items"""
+    ids = set()
+    for name in ("games", "games_archive", "backlog"):
+        rows = await get_database()[name].aggregate([{"$group": {"_id": "$userId"}}]).to_list(None)
+        ids.update(row["_id"] for row in rows if row["_id"] is not None)
+    return sorted(ids)
 
 async def close_db_connection():
-    client.close()
\ No newline at end of file
+    global _client, _db
+    if isinstance(_db, EmbeddedDatabase):
+        _db.close()
+    if _client is not None:
+        _client.close()
+    _client = _db = None
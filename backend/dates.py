@@ -0,0 +1,63 @@
+"""Calendar dates, stored as BSON dates and exchanged as "YYYY-MM-DD" strings.
+
+Storing real dates lets range filters such as "completed this year" use an
+index. The API keeps accepting and returning the plain date strings it
+always did; full ISO timestamps are also accepted and truncated to the day.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Annotated, Optional
+from pydantic import BeforeValidator, PlainSerializer, WithJsonSchema
+
+DATE_FIELDS = ("releaseDate", "startDate", "completionDate")
+
+def parse_date(value) -> Optional[datetime]:
+    """Parse a date string, date or datetime into a naive UTC midnight datetime.
+
+    Raises ValueError for anything that is not a date.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day)
+    elif isinstance(value, str):
+        text = value.strip()
+        # A bare year or year-month, common for upcoming releases, means its first day
+        if len(text) == 4:
+            text += "-01-01"
+        elif len(text) == 7:
+            text += "-01"
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            raise ValueError(f"Expected a YYYY-MM-DD date, got {value!r}")
+    else:
+        raise ValueError(f"Expected a date, got {type(value).__name__}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime(parsed.year, parsed.month, parsed.day)
+
+def format_date(value):
+    """Render a stored date as "YYYY-MM-DD"; strings not migrated yet pass through"""
+    return value.date().isoformat() if isinstance(value, datetime) else value
+
+def store_dates(doc: dict) -> dict:
+    """Copy of `doc` with its date fields converted for storage"""
+    return {k: parse_date(v) if k in DATE_FIELDS else v for k, v in doc.items()}
+
+def date_range(start: Optional[date] = None, end: Optional[date] = None) -> Optional[dict]:
+    """Filter matching stored dates from `start` through `end`, both inclusive"""
+    bounds = {}
+    if start:
+        bounds["$gte"] = parse_date(start)
+    if end:
+        bounds["$lt"] = parse_date(end) + timedelta(days=1)
+    return bounds or None
+
+StoredDate = Annotated[
+    datetime,
+    BeforeValidator(parse_date),
+    PlainSerializer(format_date, return_type=str, when_used="json"),
+    WithJsonSchema({"type": "string", "format": "date"}),
+]
@@ -0,0 +1,120 @@
+"""Wishlist price history and the maintained deal fields on backlog items.
+
+Every change of an item's current price is appended to the price_history
+time-series collection. Backlog items carry `isDeal` (current price at or
+below the wishlist price) and `discountPct` (how far below, as a
+percentage of the wishlist price), recomputed in the same write that
+changes a price so deals can be listed straight from an index.
+"""
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from pymongo import UpdateOne
+from database import backlog_collection, price_history_collection
+from bulk import BATCH_SIZE, MAX_REPORTED_ERRORS, validate_rows
+from models import BulkRowError, PriceIngestResponse, PriceUpdate
+
+def deal_fields(current_price: float, wishlist_price: float) -> dict:
+    discount = (wishlist_price - current_price) / wishlist_price * 100 if wishlist_price > 0 else 0.0
+    return {"isDeal": current_price <= wishlist_price, "discountPct": discount}
+
+# Pipeline stage computing deal_fields, with the same arithmetic, from the prices in the document being updated
+DEAL_STAGE = {"$set": {
+    "isDeal": {"$lte": ["$currentPrice", "$wishlistPrice"]},
+    "discountPct": {"$cond": [
+        {"$gt": ["$wishlistPrice", 0]},
+        {"$multiply": [{"$divide": [{"$subtract": ["$wishlistPrice", "$currentPrice"]}, "$wishlistPrice"]}, 100]},
+        0.0
+    ]}
+}}
+
+def set_with_deal_fields(values: dict) -> list:
+    """Update pipeline that sets `values` and then recomputes the deal fields"""
+    # Literal, so that strings starting with "$" are not read as field paths
+    return [{"$set": {field: {"$literal": value} for field, value in values.items()}}, DEAL_STAGE]
+
+async def ensure_deal_fields():
+    """Fill in the deal fields on items stored before they were maintained"""
+    await backlog_collection.update_many({"isDeal": {"$exists": False}}, [DEAL_STAGE])
+
+async def record_prices(points: list):
+    """Append (item id, price, time) points to the price history"""
+    if points:
+        await price_history_collection.insert_many(
+            [{"itemId": item_id, "price": price, "at": at} for item_id, price, at in points],
+            ordered=False
+        )
+
+async def price_history(item_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> list:
+    query = {"itemId": item_id}
+    if start or end:
+        query["at"] = {**({"$gte": start} if start else {}), **({"$lte": end} if end else {})}
+    return await price_history_collection.find(query, {"_id": 0, "at": 1, "price": 1}).sort("at", 1).to_list(None)
+
+def _naive_utc(at: Optional[datetime], default: datetime) -> datetime:
+    if at is None:
+        return default
+    return at.astimezone(timezone.utc).replace(tzinfo=None) if at.tzinfo else at
+
+async def _ingest_batch(user_id: str, batch: list, errors: list) -> tuple:
+    """Apply one batch of validated price updates; returns (changed ids, recorded points, unchanged points)"""
+    ids = list({update.id for _, update in batch})
+    query = {"userId": user_id, "id": {"$in": ids}}
+    current = {
+        doc["id"]: doc.get("currentPrice")
+        for doc in await backlog_collection.find(query, {"_id": 0, "id": 1, "currentPrice": 1}).to_list(None)
+    }
+
+    now = datetime.utcnow()
+    points, latest, unchanged = [], {}, 0
+    # Several points for one item are applied in time order; the last one becomes its current price
+    timed = sorted(((_naive_utc(update.at, now), index, update) for index, update in batch), key=lambda entry: entry[:2])
+    for at, index, update in timed:
+        if update.id not in current:
+            errors.append(BulkRowError(row=index, errors=[f"id: Backlog item {update.id} not found"]))
+            continue
+        if update.price == current[update.id]:
+            unchanged += 1
+            continue
+        current[update.id] = latest[update.id] = update.price
+        points.append((update.id, update.price, at))
+
+    if latest:
+        await backlog_collection.bulk_write([
+            UpdateOne({"userId": user_id, "id": item_id}, set_with_deal_fields({"currentPrice": price, "updatedAt": now}))
+            for item_id, price in latest.items()
+        ], ordered=False)
+    await record_prices(points)
+    return list(latest), len(points), unchanged
+
+async def ingest_prices(user_id: str, rows: Iterator, on_changed) -> PriceIngestResponse:
+    """Validate and apply uploaded price points to `user_id`'s backlog in batches.
+
+    A point only counts as a change, and is only recorded in the history,
+    when it differs from the item's price at that moment. Items of other
+    users are reported as not found. `on_changed` is awaited with the user
+    and the ids of the items changed by every batch.
+    """
+    errors = []
+    changed, unchanged = 0, 0
+    batch = []
+
+    async def flush():
+        nonlocal changed, unchanged, batch
+        changed_ids, recorded, batch_unchanged = await _ingest_batch(user_id, batch, errors)
+        if changed_ids:
+            await on_changed(user_id, changed_ids)
+        changed += recorded
+        unchanged += batch_unchanged
+        batch = []
+
+    for index, update in validate_rows(rows, PriceUpdate, errors):
+        batch.append((index, update))
+        if len(batch) >= BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    errors.sort(key=lambda error: error.row)
+    return PriceIngestResponse(
+        changed=changed, unchanged=unchanged, failed=len(errors), errors=errors[:MAX_REPORTED_ERRORS]
+    )
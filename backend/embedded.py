@@ -0,0 +1,909 @@
+"""Embedded document store on SQLite, used in place of MongoDB when STORAGE_BACKEND=sqlite.
+
+Single-node deployments can keep their data in a local SQLite file and
+skip the network hop to a database server. The store implements the part
+of the Motor API the app uses: find (with sort, limit, skip and async
+iteration), find_one, insert, update, replace and delete in their one,
+many and find-and-modify forms, count_documents, bulk_write, and
+aggregate for $match, $group, $facet and $sort pipelines. Update
+pipelines support the expression operators the app uses.
+
+Each collection is a table of JSON documents. The declared indexes become
+expression indexes over json_extract, so the queries the app runs are
+index lookups, and a text index becomes an FTS5 table ranked with bm25
+using the index's weights. Datetimes and ObjectIds are stored as tagged
+strings that sort in the same order as the values.
+
+The database runs in WAL mode: reads run in a small thread pool, each
+thread with its own connection, while writes go through a single writer
+thread, so find-and-modify operations are atomic.
+"""
+import asyncio
+import copy
+import json
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import Optional
+import orjson
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+READER_THREADS = 4
+PAGE_SIZE = 1000
+
+# Tags marking the values JSON has no type for; the text after them sorts like the value
+_TAG = "\ue000"
+_DATE = _TAG + "D"
+_OBJECT_ID = _TAG + "O"
+
+def _tag(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        # BSON dates hold milliseconds; storing the same keeps both backends' values equal
+        return _DATE + value.isoformat(timespec="milliseconds")
+    if isinstance(value, ObjectId):
+        return _OBJECT_ID + str(value)
+    raise TypeError(f"Cannot store a value of type {type(value).__name__}")
+
+def _encode(value):
+    if isinstance(value, (datetime, ObjectId)):
+        return _tag(value)
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+def _untag(value: str):
+    if value.startswith(_DATE):
+        return datetime.fromisoformat(value[len(_DATE):])
+    if value.startswith(_OBJECT_ID):
+        return ObjectId(value[len(_OBJECT_ID):])
+    return value
+
+def _decode(value):
+    """Restore the tagged values in parsed JSON; dicts are converted in place"""
+    if value.__class__ is str:
+        return _untag(value) if value[:1] == _TAG else value
+    if value.__class__ is dict:
+        for key, item in value.items():
+            if item.__class__ is str:
+                if item[:1] == _TAG:
+                    value[key] = _untag(item)
+            elif item.__class__ in (dict, list):
+                value[key] = _decode(item)
+        return value
+    if value.__class__ is list:
+        return [_decode(item) for item in value]
+    return value
+
+def _dumps(doc: dict) -> str:
+    return orjson.dumps(doc, default=_tag, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+
+def _key(value) -> str:
+    """Text stored in the _id column for an _id value"""
+    return orjson.dumps(_encode(value)).decode()
+
+def _row_to_doc(key: str, body: str) -> dict:
+    return {"_id": _decode(orjson.loads(key)), **_decode(orjson.loads(body))}
+
+def _bind(value):
+    """SQL parameter for comparing against json_extract of a field"""
+    value = _encode(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return value
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _json_path(field: str) -> str:
+    return "$." + ".".join('"' + part.replace('"', '\\"') + '"' for part in field.split("."))
+
+def _field_sql(field: str) -> str:
+    if field == "_id":
+        return "_id"
+    return f"json_extract(doc, '{_json_path(field)}')"
+
+def _get_path(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+def _set_path(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+def _unset_path(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+def _sort_key(value):
+    """Orders mixed values the way MongoDB does for the types the app stores"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (4, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (5, value)
+    return (3, str(value))
+
+def _regex_prefix(pattern: str) -> Optional[str]:
+    """The literal prefix of a regex anchored with ^ and containing nothing else, if it is one"""
+    if pattern.startswith("^") and not re.search(r"[.^$*+?{}\[\]\\|()]", pattern[1:]):
+        return pattern[1:]
+    return None
+
+def _compile_condition(field: str, condition, params: list) -> str:
+    column = _field_sql(field)
+    bind = _key if field == "_id" else _bind
+    if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+        if condition is None:
+            return f"{column} IS NULL"
+        params.append(bind(condition))
+        return f"{column} = ?"
+    clauses = []
+    for operator, value in condition.items():
+        if operator in ("$gt", "$gte", "$lt", "$lte", "$ne"):
+            symbol = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<=", "$ne": "IS NOT"}[operator]
+            params.append(bind(value))
+            clauses.append(f"{column} {symbol} ?")
+        elif operator in ("$in", "$nin"):
+            values = list(value)
+            present = [bind(item) for item in values if item is not None]
+            parts = []
+            if present:
+                parts.append(f"{column} IN ({', '.join('?' * len(present))})")
+                params.extend(present)
+            if len(present) < len(values):
+                parts.append(f"{column} IS NULL")
+            clause = "(" + " OR ".join(parts) + ")" if parts else "0"
+            # A missing field is not in any list, so $nin matches it
+            clauses.append(clause if operator == "$in" else f"({clause}) IS NOT 1")
+        elif operator == "$exists":
+            test = "_id IS NOT NULL" if field == "_id" else f"json_type(doc, '{_json_path(field)}') IS NOT NULL"
+            clauses.append(test if value else f"NOT ({test})")
+        elif operator == "$regex":
+            prefix = _regex_prefix(value)
+            if prefix is not None:
+                low = _key(prefix)[:-1] if field == "_id" else prefix
+                params.extend([low, low + "\U0010ffff"])
+                clauses.append(f"{column} >= ? AND {column} < ?")
+            else:
+                params.append(value)
+                clauses.append(f"{column} REGEXP ?")
+        elif operator == "$type":
+            if value == "string":
+                clauses.append(f"(json_type(doc, '{_json_path(field)}') = 'text' AND substr({column}, 1, 1) != '{_TAG}')")
+            elif value == "date":
+                clauses.append(f"substr({column}, 1, 2) = '{_DATE}'")
+            else:
+                raise OperationFailure(f"The embedded store does not support $type {value!r}")
+        else:
+            raise OperationFailure(f"The embedded store does not support the query operator {operator}")
+    return " AND ".join(clauses)
+
+def _compile_filter(query: Optional[dict], params: list) -> str:
+    clauses = []
+    for field, condition in (query or {}).items():
+        if field in ("$and", "$or"):
+            parts = [f"({_compile_filter(part, params)})" for part in condition]
+            clauses.append("(" + (" AND " if field == "$and" else " OR ").join(parts or ["1"]) + ")")
+        elif field == "$text":
+            raise OperationFailure("$text is only supported at the top level of a query")
+        elif field.startswith("$"):
+            raise OperationFailure(f"The embedded store does not support the query operator {field}")
+        else:
+            clauses.append(_compile_condition(field, condition, params))
+    return " AND ".join(clauses) or "1"
+
+def _fts_term(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def _fts_query(search: str) -> str:
+    """Translate MongoDB $search syntax (words, "phrases", -negations) into an FTS5 query"""
+    phrases = re.findall(r'"([^"]+)"', search)
+    words = re.sub(r'"[^"]*"', " ", search).split()
+    positive = [term for term in phrases + [word for word in words if not word.startswith("-")] if term.strip("-")]
+    negative = [word[1:] for word in words if word.startswith("-") and len(word) > 1]
+    # Like MongoDB, negations alone match nothing
+    query = " OR ".join(_fts_term(term) for term in positive) or '""'
+    if negative and positive:
+        query = f"({query}) NOT ({' OR '.join(_fts_term(term) for term in negative)})"
+    return query
+
+def _normalize_sort(key_or_list, direction=None) -> list:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+def _project(doc: dict, projection: Optional[dict], score: Optional[float] = None) -> dict:
+    if not projection:
+        return doc
+    meta = {field for field, spec in projection.items() if isinstance(spec, dict)}
+    # {"_id": 1} on its own is an inclusion too, returning nothing but the _id
+    included = {field for field, spec in projection.items() if field not in meta and spec}
+    if included:
+        if projection.get("_id", 1):
+            included.add("_id")
+        else:
+            included.discard("_id")
+        # Fields come back in document order, as from MongoDB
+        result = {field: value for field, value in doc.items() if field in included}
+    else:
+        excluded = {field for field, spec in projection.items() if field not in meta and not spec}
+        result = {field: value for field, value in doc.items() if field not in excluded}
+    for field in meta:
+        result[field] = score
+    return result
+
+def _evaluate(expression, doc: dict):
+    """Evaluate an aggregation expression against `doc`"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_path(doc, expression[1:])
+    if isinstance(expression, list):
+        return [_evaluate(item, doc) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) != 1 or not next(iter(expression)).startswith("$"):
+        return {key: _evaluate(value, doc) for key, value in expression.items()}
+
+    operator, arguments = next(iter(expression.items()))
+    if operator == "$literal":
+        return arguments
+    if operator == "$cond" and isinstance(arguments, dict):
+        arguments = [arguments["if"], arguments["then"], arguments["else"]]
+    if operator == "$cond":
+        condition, then, otherwise = arguments
+        return _evaluate(then if _evaluate(condition, doc) else otherwise, doc)
+    values = [_evaluate(argument, doc) for argument in (arguments if isinstance(arguments, list) else [arguments])]
+    if operator == "$ifNull":
+        return next((value for value in values if value is not None), None)
+    if operator in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        left, right = _sort_key(values[0]), _sort_key(values[1])
+        return {
+            "$eq": left == right, "$ne": left != right, "$gt": left > right,
+            "$gte": left >= right, "$lt": left < right, "$lte": left <= right,
+        }[operator]
+    if any(value is None for value in values):
+        return None
+    if operator == "$add":
+        return sum(values)
+    if operator == "$multiply":
+        product = 1
+        for value in values:
+            product *= value
+        return product
+    if operator == "$subtract":
+        return values[0] - values[1]
+    if operator == "$divide":
+        return values[0] / values[1]
+    raise OperationFailure(f"The embedded store does not support the expression operator {operator}")
+
+def _apply_update(doc: dict, update, inserting: bool) -> dict:
+    """Apply an update document or pipeline to a copy of `doc`"""
+    doc = copy.deepcopy(doc)
+    if isinstance(update, list):
+        for stage in update:
+            (operator, spec), = stage.items()
+            if operator in ("$set", "$addFields"):
+                values = {field: _evaluate(expression, doc) for field, expression in spec.items()}
+                for field, value in values.items():
+                    _set_path(doc, field, value)
+            elif operator == "$unset":
+                for field in [spec] if isinstance(spec, str) else spec:
+                    _unset_path(doc, field)
+            else:
+                raise OperationFailure(f"The embedded store does not support the update stage {operator}")
+        return doc
+    for operator, spec in update.items():
+        if operator == "$set" or (operator == "$setOnInsert" and inserting):
+            for field, value in spec.items():
+                _set_path(doc, field, value)
+        elif operator == "$inc":
+            for field, amount in spec.items():
+                _set_path(doc, field, (_get_path(doc, field) or 0) + amount)
+        elif operator == "$unset":
+            for field in spec:
+                _unset_path(doc, field)
+        elif operator != "$setOnInsert":
+            raise OperationFailure(f"The embedded store does not support the update operator {operator}")
+    return doc
+
+def _upsert_seed(query: dict) -> dict:
+    """The fields an upserted document takes from the equality conditions of its filter"""
+    doc = {}
+    for field, condition in (query or {}).items():
+        if field.startswith("$") or (isinstance(condition, dict) and any(key.startswith("$") for key in condition)):
+            continue
+        _set_path(doc, field, condition)
+    return doc
+
+def _regexp(pattern, value) -> bool:
+    return value is not None and re.search(pattern, str(value)) is not None
+
+class EmbeddedCursor:
+    """Lazy query result; sort, skip and limit narrow it before it is read"""
+
+    def __init__(self, collection: "EmbeddedCollection", query: Optional[dict], projection: Optional[dict]):
+        self.collection = collection
+        self.query = dict(query or {})
+        self.projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+        self._batch_size = PAGE_SIZE
+
+    def sort(self, key_or_list, direction=None) -> "EmbeddedCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "EmbeddedCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "EmbeddedCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, count: int) -> "EmbeddedCursor":
+        self._batch_size = max(count, 1)
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        limit = self._limit
+        if length:
+            limit = min(limit, length) if limit else length
+        return await self.collection.database._read(
+            self.collection._select, self.query, self.projection, self._sort, self._skip, limit
+        )
+
+    async def __aiter__(self):
+        # The matching rows are fixed up front and read in batches, so writes made
+        # while iterating (a migration updating what it reads) cannot shift the pages
+        database = self.collection.database
+        rows = await database._read(self.collection._match, self.query, self._sort, self._skip, self._limit)
+        for start in range(0, len(rows), self._batch_size):
+            batch = rows[start:start + self._batch_size]
+            for doc in await database._read(self.collection._fetch, batch, self.projection):
+                yield doc
+
+class _Results:
+    """Already computed results, read through the cursor interface aggregate returns"""
+
+    def __init__(self, load):
+        self._load = load
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        docs = await self._load()
+        return docs[:length] if length else docs
+
+    async def __aiter__(self):
+        for doc in await self._load():
+            yield doc
+
+class EmbeddedCollection:
+    def __init__(self, database: "EmbeddedDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.table = _quote(name)
+        self.text_table = _quote(f"{name}__text")
+
+    # Reads, run in the reader threads
+
+    def _text_search(self, query: dict) -> tuple:
+        """(filter without $text, FTS5 query or None, bm25 weights)
+
+        $text may sit at the top level or in a top-level $and, as a $match
+        merged into an aggregation's filter leaves it.
+        """
+        if "$and" in query and "$text" not in query:
+            parts = [self._text_search(part) for part in query["$and"]]
+            searches = [(search, weights) for _, search, weights in parts if search is not None]
+            if len(searches) > 1:
+                raise OperationFailure("Too many text expressions")
+            if not searches:
+                return query, None, None
+            return {**query, "$and": [part for part, _, _ in parts]}, *searches[0]
+        if "$text" not in query:
+            return query, None, None
+        query = dict(query)
+        search = _fts_query(query.pop("$text")["$search"])
+        index = self.database._text_index(self.name)
+        if index is None:
+            raise OperationFailure(f"text index required for $text query on {self.name}")
+        # Equality on a prefix field narrows the match inside the text index, as
+        # MongoDB's compound text index does; the filter still checks it exactly
+        for field in index["prefix"]:
+            if isinstance(query.get(field), str):
+                search = f"({search}) AND {_quote(field)} : {_fts_term(query[field])}"
+        return query, search, index["weights"]
+
+    def _where(self, query: dict, params: list) -> str:
+        """WHERE clause for `query`, with text search as a rowid lookup in the text index"""
+        self.database._ensure_table(self.name)
+        query, search, _ = self._text_search(query)
+        if search is None:
+            return _compile_filter(query, params)
+        params.append(search)
+        text_match = f"rowid IN (SELECT rowid FROM {self.text_table} WHERE {self.text_table} MATCH ?)"
+        return f"{text_match} AND ({_compile_filter(query, params)})"
+
+    def _query(self, columns: str, query: dict, sort: list, offset: int, limit: int) -> list:
+        """Rows of `columns` for the documents matching `query`; `score` names the text score"""
+        self.database._ensure_table(self.name)
+        query, search, weights = self._text_search(query)
+        params = []
+        source = self.table
+        score = "NULL"
+        if search is not None:
+            score = f"-bm25({self.text_table}, {', '.join(str(weight) for weight in weights)})"
+            source = f"{self.table} JOIN {self.text_table} ON {self.text_table}.rowid = {self.table}.rowid"
+        where = _compile_filter(query, params)
+        if search is not None:
+            where = f"{self.text_table} MATCH ? AND ({where})"
+            params.insert(0, search)
+        order = []
+        for field, direction in sort:
+            if isinstance(direction, dict):
+                order.append(f"{score} DESC")
+            else:
+                order.append(f"{_field_sql(field)} {'DESC' if direction == -1 else 'ASC'}")
+        sql = f"SELECT {columns.format(table=self.table, score=score)} FROM {source} WHERE {where}"
+        if order:
+            sql += " ORDER BY " + ", ".join(order)
+        sql += f" LIMIT {int(limit) if limit else -1} OFFSET {int(offset)}"
+        return self.database._connection().execute(sql, params).fetchall()
+
+    def _select(self, query: dict, projection: Optional[dict], sort: list, offset: int, limit: int) -> list:
+        rows = self._query("{table}._id, doc, {score}", query, sort, offset, limit)
+        return [_project(_row_to_doc(key, body), projection, score) for key, body, score in rows]
+
+    def _match(self, query: dict, sort: list, offset: int, limit: int) -> list:
+        """(rowid, text score) of the matching documents, in order"""
+        return self._query("{table}.rowid, {score}", query, sort, offset, limit)
+
+    def _fetch(self, rows: list, projection: Optional[dict]) -> list:
+        """The documents of the `_match` rows still present, in the same order"""
+        placeholders = ", ".join("?" * len(rows))
+        found = {
+            rowid: (key, body) for rowid, key, body in self.database._connection().execute(
+                f"SELECT rowid, _id, doc FROM {self.table} WHERE rowid IN ({placeholders})", [rowid for rowid, _ in rows]
+            )
+        }
+        return [_project(_row_to_doc(*found[rowid]), projection, score) for rowid, score in rows if rowid in found]
+
+    def _count(self, query: dict) -> int:
+        params = []
+        where = self._where(query, params)
+        return self.database._connection().execute(f"SELECT COUNT(*) FROM {self.table} WHERE {where}", params).fetchone()[0]
+
+    def _group(self, query: dict, spec: dict) -> list:
+        """Run a $group stage over the documents matching `query` as SQL GROUP BY"""
+        params = []
+        where = self._where(query, params)
+        key = spec["_id"]
+        if key is None:
+            key_sql = "NULL"
+        elif isinstance(key, str) and key.startswith("$"):
+            key_sql = _field_sql(key[1:])
+        else:
+            raise OperationFailure("The embedded store only groups by a field or by null")
+        columns = []
+        for name, accumulator in spec.items():
+            if name == "_id":
+                continue
+            (operator, argument), = accumulator.items()
+            if operator != "$sum":
+                raise OperationFailure(f"The embedded store does not support the accumulator {operator}")
+            if isinstance(argument, (int, float)):
+                columns.append(f"COUNT(*) * {argument}")
+            elif isinstance(argument, str) and argument.startswith("$"):
+                columns.append(f"TOTAL({_field_sql(argument[1:])})")
+            elif isinstance(argument, dict) and set(argument) == {"$ifNull"}:
+                field, fallback = argument["$ifNull"]
+                columns.append(f"TOTAL(COALESCE({_field_sql(field[1:])}, {float(fallback)}))")
+            else:
+                raise OperationFailure("The embedded store only sums constants and fields")
+        sql = f"SELECT {key_sql}, {', '.join(columns) or 'NULL'} FROM {self.table} WHERE {where}"
+        # Like MongoDB, no documents make no groups, not one empty group
+        sql += f" GROUP BY {key_sql}" if key is not None else " HAVING COUNT(*) > 0"
+        rows = self.database._connection().execute(sql, params).fetchall()
+        names = [name for name in spec if name != "_id"]
+        results = []
+        for row in rows:
+            values = [int(value) if isinstance(value, float) and value.is_integer() else value for value in row[1:]]
+            results.append({"_id": _decode(row[0]), **dict(zip(names, values))})
+        return results
+
+    def _aggregate(self, pipeline: list, query: Optional[dict] = None):
+        query = dict(query or {})
+        docs = None
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match" and docs is None:
+                query = {"$and": [query, spec]} if query and spec else (spec or query)
+            elif operator == "$facet" and docs is None:
+                docs = [{name: self._aggregate(stages, query) for name, stages in spec.items()}]
+            elif operator == "$group" and docs is None:
+                docs = self._group(query, spec)
+            elif operator == "$sort" and docs is not None:
+                for field, direction in reversed(list(spec.items())):
+                    docs.sort(key=lambda doc: _sort_key(_get_path(doc, field)), reverse=direction == -1)
+            elif operator == "$limit" and docs is not None:
+                docs = docs[:spec]
+            else:
+                raise OperationFailure(f"The embedded store does not support {operator} at this point of a pipeline")
+        if docs is None:
+            docs = self._select(query, None, [], 0, 0)
+        return docs
+
+    # Writes, run in the writer thread inside a transaction
+
+    def _insert(self, connection, doc: dict):
+        self.database._ensure_table(self.name)
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        body = {field: value for field, value in doc.items() if field != "_id"}
+        try:
+            connection.execute(f"INSERT INTO {self.table} (_id, doc) VALUES (?, ?)", (_key(doc["_id"]), _dumps(body)))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}: {e}", 11000)
+
+    def _replace(self, connection, doc: dict):
+        body = {field: value for field, value in doc.items() if field != "_id"}
+        try:
+            connection.execute(f"UPDATE {self.table} SET doc = ? WHERE _id = ?", (_dumps(body), _key(doc["_id"])))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}: {e}", 11000)
+
+    def _delete(self, connection, doc: dict):
+        connection.execute(f"DELETE FROM {self.table} WHERE _id = ?", (_key(doc["_id"]),))
+
+    def _update(self, connection, query: dict, update, upsert: bool, many: bool) -> tuple:
+        """Returns (matched, modified, upserted id, [(before, after)])"""
+        docs = self._select(query, None, [], 0, 0 if many else 1)
+        changes = []
+        for doc in docs:
+            updated = _apply_update(doc, update, inserting=False)
+            updated["_id"] = doc["_id"]
+            if updated != doc:
+                self._replace(connection, updated)
+            changes.append((doc, updated))
+        if docs or not upsert:
+            return len(docs), sum(before != after for before, after in changes), None, changes
+        inserted = _apply_update(_upsert_seed(query), update, inserting=True)
+        self._insert(connection, inserted)
+        return 0, 0, inserted["_id"], [(None, inserted)]
+
+    def _bulk(self, connection, requests: list, ordered: bool) -> dict:
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [], "writeErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(connection, request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    matched, modified, upserted_id, _ = self._update(
+                        connection, request._filter, request._doc, request._upsert, isinstance(request, UpdateMany)
+                    )
+                    result["nMatched"] += matched
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": upserted_id})
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    docs = self._select(request._filter, {"_id": 1}, [], 0, 0 if isinstance(request, DeleteMany) else 1)
+                    for doc in docs:
+                        self._delete(connection, doc)
+                    result["nRemoved"] += len(docs)
+                else:
+                    raise OperationFailure(f"Unsupported bulk request {request!r}")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        return result
+
+    # The Motor API
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> EmbeddedCursor:
+        cursor = EmbeddedCursor(self, filter, projection or kwargs.get("projection"))
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> Optional[dict]:
+        docs = await self.find(filter, projection, **kwargs).limit(1).to_list(1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        return await self.database._read(self._count, filter)
+
+    def aggregate(self, pipeline: list, **kwargs) -> _Results:
+        return _Results(lambda: self.database._read(self._aggregate, pipeline))
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        await self.database._write(lambda connection: self._insert(connection, document))
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents, ordered: bool = True, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        result = await self.database._write(
+            lambda connection: self._bulk(connection, [InsertOne(doc) for doc in documents], ordered)
+        )
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return InsertManyResult([doc["_id"] for doc in documents if "_id" in doc], True)
+
+    async def _update_result(self, filter, update, upsert: bool, many: bool) -> UpdateResult:
+        matched, modified, upserted_id, _ = await self.database._write(
+            lambda connection: self._update(connection, filter, update, upsert, many)
+        )
+        raw = {"n": matched + (upserted_id is not None), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def update_one(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self._update_result(filter, update, upsert, many=False)
+
+    async def update_many(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self._update_result(filter, update, upsert, many=True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        def replace(connection):
+            docs = self._select(filter, {"_id": 1}, [], 0, 1)
+            if docs:
+                self._replace(connection, {**replacement, "_id": docs[0]["_id"]})
+                return {"n": 1, "nModified": 1}
+            if not upsert:
+                return {"n": 0, "nModified": 0}
+            doc = {**_upsert_seed(filter), **replacement}
+            self._insert(connection, doc)
+            return {"n": 1, "nModified": 0, "upserted": doc["_id"]}
+        return UpdateResult(await self.database._write(replace), True)
+
+    async def find_one_and_update(
+        self, filter: dict, update, projection: Optional[dict] = None, sort=None, upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE, **kwargs
+    ) -> Optional[dict]:
+        def find_and_update(connection):
+            query = filter
+            if sort:
+                docs = self._select(filter, {"_id": 1}, _normalize_sort(sort), 0, 1)
+                if docs:
+                    query = {"_id": docs[0]["_id"]}
+            _, _, _, changes = self._update(connection, query, update, upsert, many=False)
+            return changes[0] if changes else (None, None)
+        before, after = await self.database._write(find_and_update)
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return _project(doc, projection) if doc is not None else None
+
+    async def find_one_and_delete(self, filter: dict, projection: Optional[dict] = None, sort=None, **kwargs) -> Optional[dict]:
+        def find_and_delete(connection):
+            docs = self._select(filter, None, _normalize_sort(sort) if sort else [], 0, 1)
+            if docs:
+                self._delete(connection, docs[0])
+                return docs[0]
+            return None
+        doc = await self.database._write(find_and_delete)
+        return _project(doc, projection) if doc is not None else None
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        result = await self.database._write(lambda connection: self._bulk(connection, [DeleteOne(filter)], True))
+        return DeleteResult({"n": result["nRemoved"]}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        result = await self.database._write(lambda connection: self._bulk(connection, [DeleteMany(filter)], True))
+        return DeleteResult({"n": result["nRemoved"]}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = await self.database._write(lambda connection: self._bulk(connection, list(requests), ordered))
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_indexes(self, indexes: list, **kwargs) -> list:
+        return await self.database._write(lambda connection: [self._create_index(connection, index) for index in indexes])
+
+    def _create_index(self, connection, index) -> str:
+        self.database._ensure_table(self.name)
+        spec = index.document
+        name = spec["name"]
+        keys = list(spec["key"].items())
+        if any(direction == "text" for _, direction in keys):
+            # Keys before the text fields are prefix fields, matched by equality
+            prefix = [field for field, direction in keys if direction != "text"]
+            fields = [field for field, direction in keys if direction == "text"]
+            weights = [spec.get("weights", {}).get(field, 1) for field in fields]
+            self.database._create_text_index(connection, self.name, name, prefix, fields, weights)
+            return name
+        columns = ", ".join(f"{_field_sql(field)}{' DESC' if direction == -1 else ''}" for field, direction in keys)
+        unique = "UNIQUE " if spec.get("unique") else ""
+        connection.execute(f"CREATE {unique}INDEX IF NOT EXISTS {_quote(f'{self.name}__{name}')} ON {self.table} ({columns})")
+        return name
+
+    def _drop_index(self, connection, name: str):
+        index = self.database._text_index(self.name)
+        if index is not None and index["name"] == name:
+            self.database._drop_text_index(connection, self.name)
+            return
+        index_name = f"{self.name}__{name}"
+        if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).fetchone():
+            raise OperationFailure(f"index not found with name [{name}]", code=27)
+        connection.execute(f"DROP INDEX {_quote(index_name)}")
+
+    async def drop_index(self, index_or_name, **kwargs):
+        await self.database._write(lambda connection: self._drop_index(connection, index_or_name))
+
+    async def drop(self):
+        await self.database._write(lambda connection: self.database._drop_table(connection, self.name))
+
+class EmbeddedDatabase:
+    def __init__(self, path, reader_threads: int = READER_THREADS):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix="sqlite-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._tables = set()
+        self._text_indexes = {}
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> EmbeddedCollection:
+        if name not in self._collections:
+            self._collections[name] = EmbeddedCollection(self, name)
+        return self._collections[name]
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only risks the last transactions on power loss, never corruption
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            connection.create_function("REGEXP", 2, _regexp, deterministic=True)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS _text_indexes "
+                "(collection TEXT PRIMARY KEY, name TEXT, prefix TEXT, fields TEXT, weights TEXT)"
+            )
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _ensure_table(self, name: str):
+        if name not in self._tables:
+            self._connection().execute(
+                f"CREATE TABLE IF NOT EXISTS {_quote(name)} (rowid INTEGER PRIMARY KEY, _id TEXT NOT NULL UNIQUE, doc TEXT NOT NULL)"
+            )
+            self._tables.add(name)
+
+    def _text_index(self, name: str) -> Optional[dict]:
+        """The name, prefix fields and column weights of a collection's text index"""
+        if name not in self._text_indexes:
+            row = self._connection().execute(
+                "SELECT name, prefix, weights FROM _text_indexes WHERE collection = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._text_indexes[name] = {"name": row[0], "prefix": json.loads(row[1]), "weights": json.loads(row[2])}
+        return self._text_indexes[name]
+
+    def _create_text_index(self, connection, name: str, index_name: str, prefix: list, fields: list, weights: list):
+        self._ensure_table(name)
+        if self._text_index(name) is not None:
+            return
+        # Prefix fields are indexed too, so they can narrow a match, but do not count toward relevance
+        fields, weights = prefix + fields, [0] * len(prefix) + weights
+        table, text_table = _quote(name), _quote(f"{name}__text")
+        columns = ", ".join(_quote(field) for field in fields)
+        values = lambda row: ", ".join(f"json_extract({row}.doc, '{_json_path(field)}')" for field in fields)
+        # Contentless: the documents table holds the text, the index only the terms
+        connection.execute(f"CREATE VIRTUAL TABLE {text_table} USING fts5({columns}, content='', tokenize='porter unicode61')")
+        connection.execute(
+            f"CREATE TRIGGER {_quote(f'{name}__text_insert')} AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {text_table} (rowid, {columns}) VALUES (new.rowid, {values('new')}); END"
+        )
+        connection.execute(
+            f"CREATE TRIGGER {_quote(f'{name}__text_delete')} AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {text_table} ({text_table}, rowid, {columns}) VALUES ('delete', old.rowid, {values('old')}); END"
+        )
+        connection.execute(
+            f"CREATE TRIGGER {_quote(f'{name}__text_update')} AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {text_table} ({text_table}, rowid, {columns}) VALUES ('delete', old.rowid, {values('old')}); "
+            f"INSERT INTO {text_table} (rowid, {columns}) VALUES (new.rowid, {values('new')}); END"
+        )
+        connection.execute(f"INSERT INTO {text_table} (rowid, {columns}) SELECT rowid, {values(table)} FROM {table}")
+        connection.execute(
+            "INSERT INTO _text_indexes (collection, name, prefix, fields, weights) VALUES (?, ?, ?, ?, ?)",
+            (name, index_name, json.dumps(prefix), json.dumps(fields), json.dumps(weights))
+        )
+        self._text_indexes[name] = {"name": index_name, "prefix": prefix, "weights": weights}
+
+    def _drop_text_index(self, connection, name: str):
+        for trigger in ("insert", "delete", "update"):
+            connection.execute(f"DROP TRIGGER IF EXISTS {_quote(f'{name}__text_{trigger}')}")
+        connection.execute(f"DROP TABLE IF EXISTS {_quote(f'{name}__text')}")
+        connection.execute("DELETE FROM _text_indexes WHERE collection = ?", (name,))
+        self._text_indexes.pop(name, None)
+
+    def _drop_table(self, connection, name: str):
+        connection.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        connection.execute(f"DROP TABLE IF EXISTS {_quote(f'{name}__text')}")
+        connection.execute("DELETE FROM _text_indexes WHERE collection = ?", (name,))
+        self._tables.discard(name)
+        self._text_indexes.pop(name, None)
+
+    def _transaction(self, operation):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = operation(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    async def _read(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, partial(function, *args))
+
+    async def _write(self, operation):
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self._transaction, operation)
+
+    async def list_collection_names(self, **kwargs) -> list:
+        def names():
+            rows = self._connection().execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE '%\\_\\_%' ESCAPE '\\' "
+                "AND name NOT LIKE 'sqlite%' AND name != '_text_indexes'"
+            ).fetchall()
+            return [row[0] for row in rows]
+        return await self._read(names)
+
+    async def create_collection(self, name: str, **options) -> EmbeddedCollection:
+        """Create a collection's table; options such as timeseries and storageEngine do not apply to it"""
+        if name in await self.list_collection_names():
+            raise CollectionInvalid(f"collection {name} already exists")
+        await self._write(lambda connection: self._ensure_table(name))
+        return self[name]
+
+    async def command(self, command, **kwargs) -> dict:
+        if command != "ping":
+            raise OperationFailure(f"The embedded store does not support the {command} command")
+        await self._read(lambda: self._connection().execute("SELECT 1").fetchone())
+        return {"ok": 1.0}
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
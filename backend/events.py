@@ -0,0 +1,90 @@
+"""In-process broadcast of write events to Server-Sent Events subscribers.
+
+Events are delivered only to the subscribers of the user whose data
+changed. Every event gets an id of the form "<epoch>-<sequence>", with
+one sequence shared by all users. A reconnecting
+client sends the last id it saw and is replayed whatever it missed from a
+bounded history; if that is no longer possible (history overflowed or
+the server restarted) it receives a "reset" event and should refetch.
+Each subscriber has a bounded queue, and a subscriber that falls behind
+is disconnected instead of buffering without limit.
+"""
+import asyncio
+import os
+import uuid
+from collections import deque
+from typing import Optional
+import orjson
+
+HISTORY_SIZE = int(os.environ.get("EVENTS_HISTORY_SIZE", 1000))
+QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", 256))
+
+class Subscription:
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    async def get(self) -> Optional[dict]:
+        """Next event, or None once the subscriber has been dropped for falling behind"""
+        return await self.queue.get()
+
+class EventBroker:
+    def __init__(self, history_size: int = HISTORY_SIZE, queue_size: int = QUEUE_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self._sequence = 0
+        self._history = deque(maxlen=history_size)
+        # user id -> that user's subscriptions, so a write only reaches its owner's streams
+        self._subscribers = {}
+
+    def publish(self, user_id: str, resource: str, action: str, data: dict):
+        self._sequence += 1
+        event = {"id": f"{self.epoch}-{self._sequence}", "resource": resource, "action": action, "data": data}
+        self._history.append((self._sequence, user_id, event))
+
+        for subscription in list(self._subscribers.get(user_id, ())):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(user_id, subscription)
+
+    def _drop(self, user_id: str, subscription: Subscription):
+        """Disconnect a subscriber whose queue is full; it can resume from its last event id"""
+        self.unsubscribe(user_id, subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    def _missed_since(self, user_id: str, last_event_id: str) -> Optional[list]:
+        """`user_id`'s events after `last_event_id`, or None if they can no longer be replayed"""
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        oldest = self._history[0][0] if self._history else self._sequence + 1
+        if sequence + 1 < oldest:
+            return None
+        return [event for seq, owner, event in self._history if seq > sequence and owner == user_id]
+
+    def subscribe(self, user_id: str, last_event_id: Optional[str] = None) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        if last_event_id:
+            missed = self._missed_since(user_id, last_event_id)
+            if missed is None or len(missed) >= self.queue_size:
+                missed = [{"id": f"{self.epoch}-{self._sequence}", "resource": "*", "action": "reset", "data": {}}]
+            for event in missed:
+                subscription.queue.put_nowait(event)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id: str, subscription: Subscription):
+        subscriptions = self._subscribers.get(user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[user_id]
+
+def format_sse(event: dict) -> bytes:
+    data = orjson.dumps({k: event[k] for k in ("resource", "action", "data")})
+    return b"id: " + event["id"].encode() + b"\ndata: " + data + b"\n\n"
+
+broker = EventBroker()
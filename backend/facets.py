@@ -0,0 +1,43 @@
+from typing import Dict, Optional
+
+def facet_pipeline(filters: Dict[str, Optional[str]], base_query: Optional[dict] = None) -> list:
+    """Count the values of every filter field in one aggregation.
+
+    Each field is counted under all the other active filters but not its own,
+    so a dropdown keeps offering the alternatives to its current selection.
+    """
+    active = {field: value for field, value in filters.items() if value and value != "All"}
+    facets = {}
+    for field in filters:
+        others = {f: v for f, v in active.items() if f != field}
+        facets[field] = [
+            {"$match": others},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}}
+        ]
+    return [{"$match": base_query or {}}, {"$facet": facets}]
+
+async def facet_counts(collection, filters: Dict[str, Optional[str]], base_query: Optional[dict] = None) -> dict:
+    """Map each filter field to its values and counts, most common first"""
+    result = await collection.aggregate(facet_pipeline(filters, base_query)).to_list(1)
+    facets = result[0] if result else {}
+    return {
+        field: [{"value": row["_id"], "count": row["count"]} for row in facets.get(field, []) if row["_id"] is not None]
+        for field in filters
+    }
+
+def merge_facet_counts(*results: dict) -> dict:
+    """Add up the facet_counts of several collections holding the same kind of documents"""
+    merged = {}
+    for result in results:
+        for field, rows in result.items():
+            counts = merged.setdefault(field, {})
+            for row in rows:
+                counts[row["value"]] = counts.get(row["value"], 0) + row["count"]
+    return {
+        field: [
+            {"value": value, "count": count}
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        ]
+        for field, counts in merged.items()
+    }
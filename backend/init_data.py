@@ -1,7 +1,31 @@
+"""Seed the database with the sample library or a large synthetic one.
+
+Without arguments the collections are replaced by the handful of mock
+games and backlog items below. With --games/--backlog a library of any
+size is generated instead, reproducibly for a given --seed, with
+platform, genre, status and studio counts skewed the way real libraries
+are. The library belongs to DEFAULT_USER_ID, or is spread over --users
+generated users:
+
+    python init_data.py --games 1000000 --backlog 200000 --seed 7 --users 100
+"""
+import argparse
 import asyncio
+import itertools
+import math
+import random
+import time
 import uuid
-from datetime import datetime
-from database import games_collection, backlog_collection
+from datetime import datetime, timedelta
+from database import (
+    games_collection, games_archive_collection, backlog_collection, stats_collection, analytics_collection,
+    close_db_connection, create_indexes
+)
+from stats import rebuild_stats
+from analytics import rebuild_analytics
+from dates import store_dates
+from deals import deal_fields
+from tenants import DEFAULT_USER_ID
 
 # Mock data for games
 mock_games = [
@@ -164,26 +188,261 @@ mock_backlog = [
     }
 ]
 
+# Relative weights of the synthetic library's values, most common first
+PLATFORM_WEIGHTS = {
+    "PC": 40, "PlayStation 5": 22, "Nintendo Switch": 16, "Xbox Series X": 9,
+    "PlayStation 4": 7, "Steam Deck": 4, "Xbox One": 2,
+}
+GENRE_WEIGHTS = {
+    "RPG": 20, "Action": 18, "Adventure": 14, "Shooter": 10, "Strategy": 8, "Roguelike": 7,
+    "Platformer": 6, "Simulation": 5, "Puzzle": 4, "Sports": 3, "Racing": 3, "Horror": 2,
+}
+STATUS_WEIGHTS = {"Not Started": 38, "Completed": 32, "In Progress": 14, "Dropped": 16}
+CATEGORY_WEIGHTS = {"Wishlist": 55, "Maybe Later": 30, "Next to Play": 15}
+PRIORITY_WEIGHTS = {"Low": 45, "Medium": 35, "High": 20}
+PRICE_POINTS = {59.99: 25, 69.99: 15, 39.99: 20, 29.99: 15, 19.99: 15, 9.99: 10}
+
+TITLE_WORDS = (
+    "Shadow", "Crown", "Echo", "Iron", "Hollow", "Star", "Last", "Wild", "Silent", "Ember", "Frost", "Neon",
+    "Ancient", "Broken", "Crimson", "Dawn", "Drift", "Forge", "Golden", "Lost", "Night", "Rift", "Storm", "Void",
+)
+TITLE_NOUNS = (
+    "Legacy", "Odyssey", "Frontier", "Kingdom", "Protocol", "Saga", "Tactics", "Chronicles", "Descent",
+    "Horizon", "Requiem", "Signal", "Dynasty", "Run", "Expedition", "Covenant",
+)
+NOTES = (
+    "Great soundtrack.", "Picked up in a sale.", "Recommended by a friend.",
+    "Waiting for the definitive edition.", "Co-op with the group on weekends.",
+    "The first act drags but it gets much better. The side quests are worth doing, "
+    "the crafting system less so, and the ending split opinions in the group.",
+)
+COVERS = [game["cover"] for game in mock_games]
+STUDIOS = 2000
+# Exponent of the power law behind studio sizes: a few studios make many of the games
+STUDIO_SKEW = 0.9
+DAY = timedelta(days=1)
+
+def _weighted(weights) -> tuple:
+    """(values, cumulative weights), so each pick does not re-sum the weights"""
+    weights = dict(weights)
+    return list(weights), list(itertools.accumulate(weights.values()))
+
+def synthetic_user_ids(count: int, seed: int) -> list:
+    """`count` user ids, the same for a given seed; a single user is DEFAULT_USER_ID"""
+    if count == 1:
+        return [DEFAULT_USER_ID]
+    rng = random.Random(f"users-{seed}")
+    return [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(count)]
+
+class LibraryGenerator:
+    """Builds synthetic game and backlog documents shaped like the ones the API stores.
+
+    Each document goes to one of `user_ids`, picked uniformly.
+    """
+
+    def __init__(self, seed: int, now: datetime = None, user_ids: list = None):
+        self.rng = random.Random(seed)
+        self.user_ids = user_ids or [DEFAULT_USER_ID]
+        self.now = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+        self._platforms = _weighted(PLATFORM_WEIGHTS)
+        self._genres = _weighted(GENRE_WEIGHTS)
+        self._statuses = _weighted(STATUS_WEIGHTS)
+        self._categories = _weighted(CATEGORY_WEIGHTS)
+        self._priorities = _weighted(PRIORITY_WEIGHTS)
+        self._prices = _weighted(PRICE_POINTS)
+        self._studios = _weighted((f"Studio {rank}", 1 / rank ** STUDIO_SKEW) for rank in range(1, STUDIOS + 1))
+
+    def _pick(self, choices: tuple):
+        values, cumulative = choices
+        return self.rng.choices(values, cum_weights=cumulative)[0]
+
+    def _id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _user_id(self) -> str:
+        # A single user draws nothing, so a seed gives the same library as before users existed
+        return self.user_ids[0] if len(self.user_ids) == 1 else self.rng.choice(self.user_ids)
+
+    def _title(self) -> str:
+        title = f"{self.rng.choice(TITLE_WORDS)} {self.rng.choice(TITLE_NOUNS)}"
+        roll = self.rng.random()
+        if roll < 0.2:
+            title += f" {self.rng.randint(2, 5)}"
+        elif roll < 0.35:
+            title += f": {self.rng.choice(TITLE_WORDS)} {self.rng.choice(TITLE_NOUNS)}"
+        return title
+
+    def _release_date(self) -> datetime:
+        # Skewed towards recent years, as libraries are
+        years_ago = self.rng.triangular(0, 30, 0)
+        return self.now - timedelta(days=int(years_ago * 365))
+
+    def _created_at(self, after: datetime) -> datetime:
+        start = max(after, self.now - timedelta(days=5 * 365))
+        return start + timedelta(seconds=self.rng.uniform(0, max((self.now - start).total_seconds(), 0)))
+
+    def _notes(self):
+        return self.rng.choice(NOTES) if self.rng.random() < 0.3 else None
+
+    def game(self) -> dict:
+        status = self._pick(self._statuses)
+        release = self._release_date()
+        created = self._created_at(release)
+        # Playtimes are long-tailed: most games take a few dozen hours, some hundreds
+        playtime = int(self.rng.lognormvariate(math.log(25), 0.9))
+        game = {
+            "id": self._id(),
+            "userId": self._user_id(),
+            "title": self._title(),
+            "platform": self._pick(self._platforms),
+            "genre": self._pick(self._genres),
+            "status": status,
+            "rating": 0.0,
+            "playtime": 0,
+            "developer": self._pick(self._studios),
+            "releaseDate": release,
+            "cover": self.rng.choice(COVERS),
+            "progress": 0,
+            "notes": self._notes(),
+            "createdAt": created,
+            "updatedAt": created,
+        }
+        if status != "Not Started":
+            start = created.replace(hour=0, minute=0, second=0, microsecond=0)
+            game["startDate"] = start
+            game["rating"] = round(min(max(self.rng.gauss(7.4, 1.4), 1.0), 10.0), 1)
+            completion = start + DAY * self.rng.randint(1, 180)
+            if status == "Completed" and completion <= self.now:
+                game["completionDate"] = completion
+                game["playtime"], game["progress"] = playtime, 100
+            else:
+                # Games started too recently to have been finished are still being played
+                if status == "Completed":
+                    game["status"] = "In Progress"
+                progress = self.rng.randint(1, 95)
+                game["playtime"], game["progress"] = playtime * progress // 100, progress
+        return game
+
+    def backlog_item(self) -> dict:
+        release = self._release_date()
+        created = self._created_at(release)
+        wishlist_price = self._pick(self._prices)
+        # Most items sit at full price; the rest are on some sale
+        discount = 0.0 if self.rng.random() < 0.6 else self.rng.choice((0.1, 0.2, 0.25, 0.33, 0.5, 0.75))
+        current_price = round(wishlist_price * (1 - discount) * self.rng.uniform(1.0, 1.4), 2)
+        return {
+            "id": self._id(),
+            "userId": self._user_id(),
+            "title": self._title(),
+            "platform": self._pick(self._platforms),
+            "genre": self._pick(self._genres),
+            "category": self._pick(self._categories),
+            "priority": self._pick(self._priorities),
+            "developer": self._pick(self._studios),
+            "releaseDate": release,
+            "cover": self.rng.choice(COVERS),
+            "estimatedPlaytime": max(int(self.rng.lognormvariate(math.log(20), 0.8)), 1),
+            "currentPrice": current_price,
+            "wishlistPrice": wishlist_price,
+            "notes": self._notes(),
+            **deal_fields(current_price, wishlist_price),
+            "createdAt": created,
+            "updatedAt": created,
+        }
+
+async def insert_generated(collection, make, count: int, batch_size: int, concurrency: int):
+    """Insert `count` documents from `make()` in batches, with up to `concurrency` batches in flight.
+
+    The next batch is generated while the previous ones are being written.
+    """
+    pending = set()
+    started = time.perf_counter()
+    for offset in range(0, count, batch_size):
+        batch = [make() for _ in range(min(batch_size, count - offset))]
+        if len(pending) >= concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        pending.add(asyncio.ensure_future(collection.insert_many(batch, ordered=False)))
+        inserted = offset + len(batch)
+        if inserted % (batch_size * 20) == 0 or inserted == count:
+            print(f"  {collection.name}: {inserted}/{count} ({inserted / (time.perf_counter() - started):.0f} docs/s)")
+    await asyncio.gather(*pending)
+
+async def rebuild_derived(user_ids: list):
+    """Rebuild the stats counters and analytics rollups of every user in `user_ids`"""
+    for user_id in user_ids:
+        await rebuild_stats(user_id)
+        await rebuild_analytics(user_id)
+
+async def seed_synthetic(games: int, backlog: int, seed: int, batch_size: int, concurrency: int, users: int = 1):
+    """Replace the library with a generated one and rebuild what is derived from it"""
+    # Dropping is much faster than deleting millions of documents; indexes are
+    # rebuilt once at the end instead of being maintained on every insert
+    for collection in (
+        games_collection, games_archive_collection, backlog_collection, stats_collection, analytics_collection
+    ):
+        await collection.drop()
+
+    # Separate streams, so the games of a seed do not change with the backlog size
+    user_ids = synthetic_user_ids(users, seed)
+    await insert_generated(games_collection, LibraryGenerator(seed, user_ids=user_ids).game, games, batch_size, concurrency)
+    await insert_generated(
+        backlog_collection, LibraryGenerator(seed + 1, user_ids=user_ids).backlog_item, backlog, batch_size, concurrency
+    )
+    across = f" across {users} users" if users > 1 else ""
+    print(f"Inserted {games} games and {backlog} backlog items{across}")
+
+    await create_indexes()
+    await rebuild_derived(user_ids)
+    print("Rebuilt indexes, stats and analytics")
+
 async def init_database():
     """Initialize database with mock data"""
     try:
         # Clear existing data
         await games_collection.delete_many({})
+        await games_archive_collection.delete_many({})
         await backlog_collection.delete_many({})
+        await stats_collection.delete_many({})
+        await analytics_collection.delete_many({})
         
         # Insert mock data
         if mock_games:
-            await games_collection.insert_many(mock_games)
+            await games_collection.insert_many([store_dates({**game, "userId": DEFAULT_USER_ID}) for game in mock_games])
             print(f"Inserted {len(mock_games)} games")
         
         if mock_backlog:
-            await backlog_collection.insert_many(mock_backlog)
+            await backlog_collection.insert_many(
+                [store_dates({**item, "userId": DEFAULT_USER_ID}) for item in mock_backlog]
+            )
             print(f"Inserted {len(mock_backlog)} backlog items")
         
+        await rebuild_derived([DEFAULT_USER_ID])
+        
         print("Database initialization completed successfully!")
         
     except Exception as e:
         print(f"Error initializing database: {e}")
 
+async def main():
+    parser = argparse.ArgumentParser(description="Seed the database with sample or synthetic data")
+    parser.add_argument("--games", type=int, help="generate this many games instead of the sample library")
+    parser.add_argument("--backlog", type=int, help="generate this many backlog items instead of the sample ones")
+    parser.add_argument("--seed", type=int, default=42, help="random seed; the same seed gives the same library")
+    parser.add_argument("--users", type=int, default=1, help="spread the generated library over this many users")
+    parser.add_argument("--batch-size", type=int, default=5000, help="documents per insert_many call")
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many calls in flight at once")
+    args = parser.parse_args()
+    try:
+        if args.games is None and args.backlog is None:
+            await init_database()
+        else:
+            await seed_synthetic(
+                args.games or 0, args.backlog or 0, args.seed, args.batch_size, args.concurrency, args.users
+            )
+    finally:
+        await close_db_connection()
+
 if __name__ == "__main__":
-    asyncio.run(init_database())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,247 @@
+"""In-process request and MongoDB metrics, exposed in Prometheus text format.
+
+The middleware times every request against its route template, and the
+command listener registered on the Motor client times every MongoDB
+command. Motor runs commands in a copy of the caller's context, so the
+listener can attribute the documents it sees to the request in flight.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from pymongo import monitoring
+
+logger = logging.getLogger("gamevault.slow_queries")
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DOCUMENT_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000)
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+REGISTRY = []
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+REQUEST_LATENCY = register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ("method", "route", "status")
+))
+REQUEST_DOCUMENTS = register(Histogram(
+    "http_request_documents", "MongoDB documents read while serving a request",
+    ("route",), DOCUMENT_BUCKETS
+))
+MONGO_COMMANDS = register(Counter(
+    "mongo_commands_total", "MongoDB commands by collection, command and outcome",
+    ("collection", "command", "outcome")
+))
+MONGO_LATENCY = register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ("collection", "command")
+))
+MONGO_DOCUMENTS = register(Counter(
+    "mongo_documents_returned_total", "Documents returned by MongoDB per collection",
+    ("collection",)
+))
+SLOW_QUERIES = register(Counter(
+    "mongo_slow_commands_total", "MongoDB commands slower than SLOW_QUERY_MS",
+    ("collection", "command")
+))
+
+class RequestStats:
+    __slots__ = ("documents",)
+
+    def __init__(self):
+        self.documents = 0
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+def _documents_in_reply(reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    if reply.get("value") is not None:
+        return 1
+    return 0
+
+def query_shape(query):
+    """`query` with every value replaced by "?", so it can be logged without the user data it holds"""
+    if isinstance(query, dict):
+        return {key: query_shape(value) for key, value in query.items()}
+    # The branches of $and and $or are queries themselves
+    if isinstance(query, list) and query and all(isinstance(item, dict) for item in query):
+        return [query_shape(item) for item in query]
+    return "?"
+
+class QueryMonitor(monitoring.CommandListener):
+    """Times every MongoDB command and logs the slow ones"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        command = event.command
+        collection = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else "-",
+            command.get("filter") or command.get("query")
+        )
+
+    def _finish(self, event, outcome: str, reply: dict = None):
+        collection, query = self._pending.pop((event.connection_id, event.request_id), ("-", None))
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMANDS.inc(collection, event.command_name, outcome)
+        MONGO_LATENCY.observe(seconds, collection, event.command_name)
+
+        if reply is not None:
+            documents = _documents_in_reply(reply)
+            if documents:
+                MONGO_DOCUMENTS.inc(collection, amount=documents)
+                stats = current_request.get()
+                if stats is not None:
+                    stats.documents += documents
+
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            SLOW_QUERIES.inc(collection, event.command_name)
+            logger.warning(
+                "Slow MongoDB %s on %s took %.1f ms (filter=%s)",
+                event.command_name, collection, seconds * 1000, query_shape(query)
+            )
+
+    def succeeded(self, event):
+        self._finish(event, "ok", event.reply)
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+query_monitor = QueryMonitor()
+
+class MetricsMiddleware:
+    """Records latency and documents read per request, labelled by route template"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = self._route_path(scope)
+            REQUEST_LATENCY.observe(elapsed, scope["method"], route, status)
+            REQUEST_DOCUMENTS.observe(stats.documents, route)
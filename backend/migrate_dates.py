@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+from pymongo import UpdateOne
+from database import games_collection, backlog_collection, close_db_connection
+from dates import DATE_FIELDS, parse_date
+
+BATCH_SIZE = 1000
+
+async def migrate_collection(collection, batch_size: int = BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Convert date strings in `collection` to BSON dates, one bulk write per batch.
+
+    Safe to rerun: only documents still holding a string date are read.
+    Each update is conditional on the string it replaces, so a value
+    changed through the API in the meantime is never overwritten.
+    """
+    query = {"$or": [{field: {"$type": "string"}} for field in DATE_FIELDS]}
+    projection = {field: 1 for field in DATE_FIELDS}
+    converted, unparseable = 0, []
+    batch = []
+
+    async def flush():
+        nonlocal converted, batch
+        if batch and not dry_run:
+            result = await collection.bulk_write(batch, ordered=False)
+            converted += result.modified_count
+        elif dry_run:
+            converted += len(batch)
+        batch = []
+
+    async for doc in collection.find(query, projection).sort("_id", 1).batch_size(batch_size):
+        current, updates = {}, {}
+        for field in DATE_FIELDS:
+            value = doc.get(field)
+            if not isinstance(value, str):
+                continue
+            try:
+                updates[field] = parse_date(value)
+            except ValueError:
+                unparseable.append((doc["_id"], field, value))
+                continue
+            current[field] = value
+        if updates:
+            batch.append(UpdateOne({"_id": doc["_id"], **current}, {"$set": updates}))
+        if len(batch) >= batch_size:
+            await flush()
+    await flush()
+
+    return {"converted": converted, "unparseable": unparseable}
+
+async def migrate(batch_size: int = BATCH_SIZE, dry_run: bool = False) -> dict:
+    results = {}
+    for name, collection in (("games", games_collection), ("backlog", backlog_collection)):
+        result = results[name] = await migrate_collection(collection, batch_size, dry_run)
+        verb = "would convert" if dry_run else "converted"
+        print(f"{name}: {verb} {result['converted']} documents")
+        for _id, field, value in result["unparseable"]:
+            print(f"{name}: left {field}={value!r} on {_id} unchanged, it is not a date")
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser(description="Convert stored date strings to BSON dates")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="documents per bulk write")
+    args = parser.parse_args()
+    try:
+        await migrate(batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Move a single-user database to the per-user schema.
+
+Run it once when upgrading, before starting the new version of the
+server. It:
+
+- drops the indexes of the single-user schema, which the userId-led ones
+  in database.INDEXES replace;
+- gives every game, backlog item and preferences document without a
+  userId to the --user (DEFAULT_USER_ID by default);
+- re-keys the analytics rollups to (userId, key), keeping the recorded
+  backlog flow counters, and rebuilds the dashboard counters of every user;
+- creates the new indexes.
+
+Safe to rerun: only documents still missing a userId are changed.
+
+    python migrate_tenants.py --user 6f1c2a9e-...
+"""
+import argparse
+import asyncio
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from database import (
+    SUPERSEDED_INDEXES, analytics_collection, backlog_collection, close_db_connection, create_indexes,
+    games_collection, get_database, preferences_collection, stats_collection, user_ids
+)
+from stats import rebuild_stats
+from tenants import DEFAULT_USER_ID
+
+async def drop_superseded_indexes(dry_run: bool = False):
+    db = get_database()
+    for collection_name, names in SUPERSEDED_INDEXES.items():
+        for name in names:
+            if dry_run:
+                print(f"{collection_name}: would drop index {name}")
+                continue
+            try:
+                await db[collection_name].drop_index(name)
+            except OperationFailure as e:
+                # IndexNotFound: never created, or dropped by an earlier run
+                if e.code != 27:
+                    raise
+                continue
+            print(f"{collection_name}: dropped index {name}")
+
+async def assign_owner(user_id: str, dry_run: bool = False) -> dict:
+    """Give the documents without a userId to `user_id`"""
+    unowned = {"userId": {"$exists": False}}
+    assigned = {}
+    for name, collection in (
+        ("games", games_collection), ("backlog", backlog_collection), ("preferences", preferences_collection)
+    ):
+        if dry_run:
+            assigned[name] = await collection.count_documents(unowned)
+        else:
+            assigned[name] = (await collection.update_many(unowned, {"$set": {"userId": user_id}})).modified_count
+        print(f"{name}: {'would assign' if dry_run else 'assigned'} {assigned[name]} documents to {user_id}")
+    return assigned
+
+async def rekey_analytics(user_id: str, dry_run: bool = False) -> int:
+    """Copy the single-user rollups, keyed by _id, to documents keyed by (userId, key)"""
+    legacy = await analytics_collection.find({"userId": {"$exists": False}}).to_list(None)
+    if not dry_run and legacy:
+        # Upserting by (userId, key) keeps a rerun after an interrupted one from duplicating rollups
+        await analytics_collection.bulk_write([
+            UpdateOne(
+                {"userId": user_id, "key": doc["_id"]},
+                {"$set": {k: v for k, v in doc.items() if k != "_id"}},
+                upsert=True
+            )
+            for doc in legacy
+        ], ordered=False)
+        await analytics_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in legacy]}})
+    print(f"analytics: {'would re-key' if dry_run else 're-keyed'} {len(legacy)} rollup documents")
+    return len(legacy)
+
+async def migrate(user_id: str = DEFAULT_USER_ID, dry_run: bool = False):
+    await drop_superseded_indexes(dry_run)
+    await assign_owner(user_id, dry_run)
+    await rekey_analytics(user_id, dry_run)
+    if dry_run:
+        return
+    # The single dashboard document is replaced by one per user
+    await stats_collection.delete_many({"userId": {"$exists": False}})
+    for owner in await user_ids():
+        await rebuild_stats(owner)
+    await create_indexes()
+    print("Rebuilt the dashboard counters and created the per-user indexes")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Give existing documents an owner and switch to per-user indexes")
+    parser.add_argument("--user", default=DEFAULT_USER_ID, help="user id that existing documents are given to")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+    try:
+        await migrate(user_id=args.user, dry_run=args.dry_run)
+    finally:
+        await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
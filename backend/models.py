@@ -2,6 +2,8 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 import uuid
+from dates import StoredDate
+from tenants import DEFAULT_USER_ID
 
 # Game Models
 class GameBase(BaseModel):
@@ -12,9 +14,9 @@ class GameBase(BaseModel):
     rating: float
     playtime: int
     developer: str
-    releaseDate: str
-    startDate: Optional[str] = None
-    completionDate: Optional[str] = None
+    releaseDate: StoredDate
+    startDate: Optional[StoredDate] = None
+    completionDate: Optional[StoredDate] = None
     cover: str
     progress: int = 0  # 0-100
     notes: Optional[str] = None
@@ -30,15 +32,16 @@ class GameUpdate(BaseModel):
     rating: Optional[float] = None
     playtime: Optional[int] = None
     developer: Optional[str] = None
-    releaseDate: Optional[str] = None
-    startDate: Optional[str] = None
-    completionDate: Optional[str] = None
+    releaseDate: Optional[StoredDate] = None
+    startDate: Optional[StoredDate] = None
+    completionDate: Optional[StoredDate] = None
     cover: Optional[str] = None
     progress: Optional[int] = None
     notes: Optional[str] = None
 
 class Game(GameBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    userId: str = DEFAULT_USER_ID  # owner; set by the server, never by the client
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
 
@@ -53,7 +56,7 @@ class BacklogBase(BaseModel):
     category: str  # "Next to Play", "Maybe Later", "Wishlist"
     priority: str  # "High", "Medium", "Low"
     developer: str
-    releaseDate: str
+    releaseDate: StoredDate
     cover: str
     estimatedPlaytime: int
     currentPrice: float
@@ -70,7 +73,7 @@ class BacklogUpdate(BaseModel):
     category: Optional[str] = None
     priority: Optional[str] = None
     developer: Optional[str] = None
-    releaseDate: Optional[str] = None
+    releaseDate: Optional[StoredDate] = None
     cover: Optional[str] = None
     estimatedPlaytime: Optional[int] = None
     currentPrice: Optional[float] = None
@@ -79,12 +82,19 @@ class BacklogUpdate(BaseModel):
 
 class Backlog(BacklogBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    userId: str = DEFAULT_USER_ID
+    # Maintained from the two prices; a deal is a current price at or below the wishlist price
+    isDeal: bool = False
+    discountPct: float = 0.0
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
 
     class Config:
         from_attributes = True
 
+class RankedBacklog(Backlog):
+    score: float  # higher means more worth playing next
+
 # User Preferences Models
 class PreferencesBase(BaseModel):
     language: str = "en"
@@ -97,6 +107,7 @@ class PreferencesUpdate(BaseModel):
 
 class Preferences(PreferencesBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    userId: str = DEFAULT_USER_ID
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
 
@@ -112,11 +123,57 @@ class StatsResponse(BaseModel):
     avgRating: float
     backlogCount: int
 
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class MonthlyCompletions(BaseModel):
+    month: str  # YYYY-MM
+    completions: int
+
+class BacklogFlow(BaseModel):
+    month: str  # YYYY-MM
+    added: int
+    moved: int
+
+class PlaytimeBreakdown(BaseModel):
+    value: str
+    playtime: int
+    games: int
+
+class RatingBucket(BaseModel):
+    rating: int  # whole points, 0-10
+    count: int
+
+class BulkRowError(BaseModel):
+    row: int  # 0-based position in the upload
+    errors: List[str]
+
+class BulkImportResponse(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkRowError]
+
+class PricePoint(BaseModel):
+    at: datetime
+    price: float
+
+class PriceUpdate(BaseModel):
+    id: str  # backlog item id
+    price: float = Field(ge=0)
+    at: Optional[datetime] = None  # defaults to the time of the upload
+
+class PriceIngestResponse(BaseModel):
+    changed: int
+    unchanged: int
+    failed: int
+    errors: List[BulkRowError]
+
 class MoveToLibraryRequest(BaseModel):
     status: str = "Not Started"
     rating: float = 0.0
     playtime: int = 0
     progress: int = 0
-    startDate: Optional[str] = None
-    completionDate: Optional[str] = None
+    startDate: Optional[StoredDate] = None
+    completionDate: Optional[StoredDate] = None
     notes: Optional[str] = None
\ No newline at end of file
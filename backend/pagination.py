@@ -0,0 +1,102 @@
+import base64
+import heapq
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, Response
+
+# Listings are ordered by creation time, with the id breaking ties so the order is stable
+SORT_ORDER = [("createdAt", 1), ("id", 1)]
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def sort_key(doc: dict) -> tuple:
+    """Position of `doc` in SORT_ORDER"""
+    return tuple(doc[field] for field, _ in SORT_ORDER)
+
+def encode_cursor(doc: dict) -> str:
+    """Build an opaque cursor pointing just after `doc`"""
+    payload = json.dumps([doc["createdAt"].isoformat(), doc["id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), str(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def apply_cursor(query: dict, after: Optional[str]) -> dict:
+    """Restrict `query` to documents sorted after the `after` cursor"""
+    if not after:
+        return query
+    created_at, last_id = decode_cursor(after)
+    keyset = {"$or": [
+        {"createdAt": {"$gt": created_at}},
+        {"createdAt": created_at, "id": {"$gt": last_id}}
+    ]}
+    return {"$and": [query, keyset]} if query else keyset
+
+async def fetch_page(cursor, limit: Optional[int], response: Response, keyset: bool = True) -> list:
+    """Read one page from a sorted cursor and advertise the next cursor in a header.
+
+    Relevance-ranked cursors are not ordered by (createdAt, id), so they pass
+    `keyset=False` and are only limited.
+    """
+    if not keyset:
+        return await cursor.limit(limit or 0).to_list(None)
+    if not limit:
+        return await cursor.to_list(None)
+    # Read one extra document to learn whether another page exists
+    docs = await cursor.limit(limit + 1).to_list(None)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1])
+    return docs
+
+async def stream_ndjson(cursor, serializer):
+    """Serialize documents one per line as the cursor yields them"""
+    async for doc in cursor:
+        yield serializer.dumps(doc) + b"\n"
+
+class MergedCursor:
+    """Reads several cursors sorted the same way as one sorted cursor.
+
+    `key` gives each document's position in the common order. Only the
+    parts of the cursor API the listings use are provided: limit(),
+    to_list() and async iteration.
+    """
+
+    def __init__(self, cursors: list, key):
+        self._cursors = cursors
+        self._key = key
+        self._limit = 0
+
+    def limit(self, limit: int) -> "MergedCursor":
+        # No cursor can contribute more than the merged limit
+        self._cursors = [cursor.limit(limit) for cursor in self._cursors]
+        self._limit = limit
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        docs = [doc async for doc in self]
+        return docs[:length] if length else docs
+
+    async def __aiter__(self):
+        iterators = [cursor.__aiter__() for cursor in self._cursors]
+        # The iterator's index breaks ties, so documents themselves are never compared
+        heads = []
+        for index, iterator in enumerate(iterators):
+            doc = await anext(iterator, None)
+            if doc is not None:
+                heads.append((self._key(doc), index, doc))
+        heapq.heapify(heads)
+        returned = 0
+        while heads and (not self._limit or returned < self._limit):
+            _, index, doc = heapq.heappop(heads)
+            yield doc
+            returned += 1
+            following = await anext(iterators[index], None)
+            if following is not None:
+                heapq.heappush(heads, (self._key(following), index, following))
@@ -0,0 +1,171 @@
+"""Scores backlog items to suggest what to play next.
+
+Each user's backlog is held in memory as NumPy columns, so scoring every
+item is a handful of vector operations and picking the best ones an
+argpartition. The columns are reloaded after a backlog write, and the
+genre affinities after a game write; both also expire so writes made
+through another worker are picked up. Only the most recently ranked
+users are kept loaded.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from database import backlog_collection, games_archive_collection, games_collection
+
+PRIORITY_SCORES = {"High": 1.0, "Medium": 0.5, "Low": 0.0}
+CATEGORY_SCORES = {"Next to Play": 1.0, "Maybe Later": 0.3, "Wishlist": 0.0}
+WEIGHTS = {"priority": 3.0, "category": 2.0, "discount": 1.5, "short": 1.0, "affinity": 2.0}
+# Playtime at which the short-game bonus has halved
+SHORT_PLAYTIME_HOURS = 20
+# How many ratings' worth of pull toward the library-wide mean a genre gets,
+# so one great game does not make its whole genre a favourite
+AFFINITY_PRIOR = 5
+REFRESH_SECONDS = 60
+MAX_LOADED_USERS = int(os.environ.get("RANKING_MAX_USERS", 1000))
+
+FEATURE_PROJECTION = {
+    "_id": 0, "id": 1, "genre": 1, "priority": 1, "category": 1,
+    "estimatedPlaytime": 1, "currentPrice": 1, "wishlistPrice": 1
+}
+
+class BacklogFeatures:
+    """Column arrays of the fields the ranking uses, one row per backlog item"""
+
+    def __init__(self, docs: list):
+        self.ids = np.array([doc["id"] for doc in docs], dtype=object)
+        self.genres, self.genre_codes = np.unique(
+            np.array([str(doc.get("genre")) for doc in docs], dtype=object), return_inverse=True
+        )
+        self.priority = np.array([PRIORITY_SCORES.get(doc.get("priority"), 0.0) for doc in docs])
+        self.category = np.array([CATEGORY_SCORES.get(doc.get("category"), 0.0) for doc in docs])
+        self.playtime = np.array([doc.get("estimatedPlaytime") or 0 for doc in docs], dtype=float)
+        self.current_price = np.array([doc.get("currentPrice") or 0 for doc in docs], dtype=float)
+        self.wishlist_price = np.array([doc.get("wishlistPrice") or 0 for doc in docs], dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+def score(features: BacklogFeatures, affinity: dict, weights: dict = WEIGHTS) -> np.ndarray:
+    """Score every item; `affinity` maps a genre to how much better than average it is rated (-1..1)"""
+    discount = np.clip(
+        (features.wishlist_price - features.current_price) / np.maximum(features.wishlist_price, 0.01), -1, 1
+    )
+    short = 1 / (1 + np.maximum(features.playtime, 0) / SHORT_PLAYTIME_HOURS)
+    genre_affinity = np.array([affinity.get(genre, 0.0) for genre in features.genres])
+    return (
+        weights["priority"] * features.priority
+        + weights["category"] * features.category
+        + weights["discount"] * discount
+        + weights["short"] * short
+        + weights["affinity"] * genre_affinity[features.genre_codes]
+    )
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the `k` highest scores, best first"""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+def affinity_pipeline(user_id: str) -> list:
+    """Rating total and count per genre of `user_id`'s rated games"""
+    # Unrated games (rating 0, e.g. fresh moves from the backlog) say nothing about taste
+    return [
+        {"$match": {"userId": user_id, "rating": {"$gt": 0}}},
+        {"$group": {"_id": "$genre", "total": {"$sum": "$rating"}, "count": {"$sum": 1}}}
+    ]
+
+async def genre_affinity(user_id: str) -> dict:
+    """How much better or worse than the user's library average each genre is rated, on a -1..1 scale"""
+    pipeline = affinity_pipeline(user_id)
+    # Archived games are mostly the finished, rated ones
+    genres = {}
+    for collection in (games_collection, games_archive_collection):
+        for row in await collection.aggregate(pipeline).to_list(None):
+            total, count = genres.get(str(row["_id"]), (0, 0))
+            genres[str(row["_id"])] = (total + row["total"], count + row["count"])
+    ratings = sum(count for _, count in genres.values())
+    if not ratings:
+        return {}
+    mean = sum(total for total, _ in genres.values()) / ratings
+    return {
+        genre: ((total + AFFINITY_PRIOR * mean) / (count + AFFINITY_PRIOR) - mean) / 10
+        for genre, (total, count) in genres.items()
+    }
+
+class BacklogRanker:
+    def __init__(self, user_id: str, refresh_seconds: float = REFRESH_SECONDS):
+        self.user_id = user_id
+        self.refresh_seconds = refresh_seconds
+        self._features: Optional[BacklogFeatures] = None
+        self._affinity: Optional[dict] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate_backlog(self):
+        self._features = None
+
+    def invalidate_affinity(self):
+        self._affinity = None
+
+    async def _refresh(self) -> tuple:
+        """Reload what has expired or been invalidated; returns (features, affinity).
+
+        The loaded values are returned rather than read back from the
+        attributes, which a write may invalidate again while this awaits.
+        """
+        async with self._lock:
+            expired = time.monotonic() - self._loaded_at > self.refresh_seconds
+            if expired:
+                self._features = self._affinity = None
+            features, affinity = self._features, self._affinity
+            if features is None:
+                features = self._features = BacklogFeatures(
+                    await backlog_collection.find({"userId": self.user_id}, FEATURE_PROJECTION).to_list(None)
+                )
+            if affinity is None:
+                affinity = self._affinity = await genre_affinity(self.user_id)
+            if expired:
+                self._loaded_at = time.monotonic()
+            return features, affinity
+
+    async def rank(self, k: int) -> list:
+        """(id, score) of the `k` items most worth playing next, best first"""
+        features, affinity = self._features, self._affinity
+        if features is None or affinity is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            features, affinity = await self._refresh()
+        if not len(features):
+            return []
+        scores = score(features, affinity)
+        return [(features.ids[i], float(scores[i])) for i in top_k(scores, k)]
+
+class BacklogRankers:
+    """One ranker per user, keeping only the `max_users` most recently used loaded"""
+
+    def __init__(self, max_users: int = MAX_LOADED_USERS):
+        self.max_users = max_users
+        self._rankers = OrderedDict()
+
+    def get(self, user_id: str) -> BacklogRanker:
+        ranker = self._rankers.get(user_id)
+        if ranker is None:
+            ranker = self._rankers[user_id] = BacklogRanker(user_id)
+            while len(self._rankers) > self.max_users:
+                self._rankers.popitem(last=False)
+        self._rankers.move_to_end(user_id)
+        return ranker
+
+    def invalidate_backlog(self, user_id: str):
+        # Users without a loaded ranker have nothing to invalidate
+        if user_id in self._rankers:
+            self._rankers[user_id].invalidate_backlog()
+
+    def invalidate_affinity(self, user_id: str):
+        if user_id in self._rankers:
+            self._rankers[user_id].invalidate_affinity()
+
+backlog_rankers = BacklogRankers()
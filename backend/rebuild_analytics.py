@@ -0,0 +1,27 @@
+import argparse
+import asyncio
+from analytics import rebuild_analytics
+from database import close_db_connection, user_ids
+
+async def main():
+    parser = argparse.ArgumentParser(description="Recompute the analytics rollups from the collections")
+    parser.add_argument("--dry-run", action="store_true", help="print the rollups instead of writing them")
+    parser.add_argument(
+        "--reset-flow", action="store_true",
+        help="re-estimate backlog additions from the current backlog and drop the recorded moves"
+    )
+    parser.add_argument("--user", action="append", help="only rebuild this user's rollups; repeatable (default: every user)")
+    args = parser.parse_args()
+    try:
+        for user_id in args.user or await user_ids():
+            docs = await rebuild_analytics(user_id, reset_flow=args.reset_flow, dry_run=args.dry_run)
+            if args.dry_run:
+                for doc in docs:
+                    print(doc)
+            else:
+                print(f"{user_id}: rebuilt {len(docs)} rollup documents")
+    finally:
+        await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+import argparse
+import asyncio
+from database import stats_collection, close_db_connection, user_ids
+from stats import compute_stats, rebuild_stats
+
+def _flatten(stats: dict) -> dict:
+    """Flatten statusCounts so every counter can be compared on its own"""
+    flat = {k: v for k, v in stats.items() if k not in ("_id", "userId", "statusCounts", "version")}
+    for status, count in stats.get("statusCounts", {}).items():
+        flat[f"statusCounts.{status}"] = count
+    return flat
+
+def find_drift(stored: dict, rebuilt: dict) -> dict:
+    """Map each drifted counter to its (stored, rebuilt) values"""
+    stored, rebuilt = _flatten(stored), _flatten(rebuilt)
+    drift = {}
+    for field in sorted(set(stored) | set(rebuilt)):
+        before, after = stored.get(field, 0), rebuilt.get(field, 0)
+        if abs(before - after) > 1e-6:
+            drift[field] = (before, after)
+    return drift
+
+async def reconcile(user_id: str, dry_run: bool = False) -> dict:
+    """Rebuild `user_id`'s dashboard counters from scratch and report any drift"""
+    stored = await stats_collection.find_one({"userId": user_id}) or {}
+    rebuilt = await compute_stats(user_id)
+    drift = find_drift(stored, rebuilt)
+
+    if not stored:
+        print(f"{user_id}: no stats document found")
+    for field, (before, after) in drift.items():
+        print(f"{user_id}: {field}: stored={before} actual={after}")
+    if stored and not drift:
+        print(f"{user_id}: stats counters are in sync")
+
+    if not dry_run and (drift or not stored):
+        await rebuild_stats(user_id)
+        print(f"{user_id}: stats counters rebuilt")
+    return drift
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild the dashboard stats counters")
+    parser.add_argument("--dry-run", action="store_true", help="only report drift, do not rewrite the counters")
+    parser.add_argument("--user", action="append", help="only reconcile this user; repeatable (default: every user)")
+    args = parser.parse_args()
+    try:
+        for user_id in args.user or await user_ids():
+            await reconcile(user_id, dry_run=args.dry_run)
+    finally:
+        await close_db_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Optional
+from models import BacklogFlow, MonthlyCompletions, PlaytimeBreakdown, RatingBucket
+from analytics import RATING_BUCKETS, read_monthly, read_totals
+from cache import ANALYTICS, response_cache
+from tenants import current_user
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+# Keeps a mistyped range from producing a response with thousands of empty months
+MAX_MONTHS = 600
+
+def _check_range(start: Optional[str], end: Optional[str]):
+    if start and end:
+        span = (int(end[:4]) - int(start[:4])) * 12 + int(end[5:]) - int(start[5:])
+        if span >= MAX_MONTHS:
+            raise HTTPException(status_code=400, detail=f"Ranges are limited to {MAX_MONTHS} months")
+
+@router.get("/completions", response_model=List[MonthlyCompletions])
+async def get_completions(
+    request: Request,
+    start: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN),
+    end: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN),
+    user_id: str = Depends(current_user)
+):
+    """Games completed per month, oldest first. `from`/`to` take YYYY-MM and are inclusive."""
+    _check_range(start, end)
+
+    async def produce(response: Response):
+        return await read_monthly(user_id, ("completions",), start, end)
+
+    return await response_cache.respond(request, user_id, ANALYTICS, {"view": "completions", "from": start, "to": end}, produce)
+
+@router.get("/backlog-flow", response_model=List[BacklogFlow])
+async def get_backlog_flow(
+    request: Request,
+    start: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN),
+    end: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN),
+    user_id: str = Depends(current_user)
+):
+    """Items added to the backlog and moved to the library per month"""
+    _check_range(start, end)
+
+    async def produce(response: Response):
+        months = await read_monthly(user_id, ("backlogAdded", "backlogMoved"), start, end)
+        return [
+            {"month": row["month"], "added": row["backlogAdded"], "moved": row["backlogMoved"]}
+            for row in months
+        ]
+
+    return await response_cache.respond(request, user_id, ANALYTICS, {"view": "backlog-flow", "from": start, "to": end}, produce)
+
+@router.get("/playtime", response_model=List[PlaytimeBreakdown])
+async def get_playtime(
+    request: Request,
+    by: str = Query("genre", pattern="^(genre|platform)$"),
+    user_id: str = Depends(current_user)
+):
+    """Total playtime and game count per genre or platform, largest first"""
+    async def produce(response: Response):
+        totals = await read_totals(user_id)
+        playtime = totals.get("playtimeByGenre" if by == "genre" else "playtimeByPlatform", {})
+        games = totals.get("gamesByGenre" if by == "genre" else "gamesByPlatform", {})
+        rows = [
+            {"value": value, "playtime": playtime.get(value, 0), "games": count}
+            for value, count in games.items() if count > 0
+        ]
+        return sorted(rows, key=lambda row: (-row["playtime"], row["value"]))
+
+    return await response_cache.respond(request, user_id, ANALYTICS, {"view": "playtime", "by": by}, produce)
+
+@router.get("/ratings", response_model=List[RatingBucket])
+async def get_rating_distribution(request: Request, user_id: str = Depends(current_user)):
+    """Number of games per whole-point rating"""
+    async def produce(response: Response):
+        ratings = (await read_totals(user_id)).get("ratings", {})
+        return [{"rating": bucket, "count": ratings.get(str(bucket), 0)} for bucket in RATING_BUCKETS]
+
+    return await response_cache.respond(request, user_id, ANALYTICS, {"view": "ratings"}, produce)
@@ -1,19 +1,46 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Optional
-from datetime import datetime
-from models import Backlog, BacklogCreate, BacklogUpdate, Game, MoveToLibraryRequest
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+from datetime import date, datetime
+from functools import partial
+import uuid
+from pymongo import ReturnDocument
+from models import (
+    Backlog, BacklogCreate, BacklogUpdate, Game, MoveToLibraryRequest, BulkImportResponse, FacetCount,
+    RankedBacklog, PricePoint, PriceIngestResponse
+)
 from database import backlog_collection, games_collection
+from pagination import SORT_ORDER, NDJSON_MEDIA_TYPE, apply_cursor, fetch_page, stream_ndjson
+from search import ranked_find, text_query
+from serialize import FastSerializer
+from facets import facet_counts
+from ranking import backlog_rankers
+from deals import deal_fields, ingest_prices, price_history, set_with_deal_fields
+from dates import date_range
+from bulk import export_response, import_rows, read_rows
+from cache import BACKLOG, response_cache
+from changes import (
+    backlog_created, backlog_deleted, backlog_inserted, backlog_moved, backlog_prices_updated, backlog_updated,
+    game_created
+)
+from tenants import current_user
+
+backlog_serializer = FastSerializer(Backlog)
+ranked_serializer = FastSerializer(RankedBacklog)
 
 router = APIRouter(prefix="/backlog", tags=["backlog"])
 
-@router.get("/", response_model=List[Backlog])
-async def get_backlog(
+def build_backlog_query(
+    user_id: str,
     category: Optional[str] = None,
     priority: Optional[str] = None,
-    platform: Optional[str] = None
-):
-    """Get backlog games with optional filters"""
-    query = {}
+    platform: Optional[str] = None,
+    search: Optional[str] = None,
+    released_from: Optional[date] = None,
+    released_to: Optional[date] = None
+) -> dict:
+    """Translate the listing filters into a MongoDB query over `user_id`'s backlog"""
+    query = {"userId": user_id}
     
     if category and category != "All":
         query["category"] = category
@@ -21,31 +48,179 @@ async def get_backlog(
         query["priority"] = priority
     if platform and platform != "All":
         query["platform"] = platform
+    released = date_range(released_from, released_to)
+    if released:
+        query["releaseDate"] = released
+    if search:
+        query.update(text_query(search))
+    return query
+
+@router.get("/", response_model=List[Backlog])
+async def get_backlog(
+    request: Request,
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    platform: Optional[str] = None,
+    search: Optional[str] = None,
+    releasedFrom: Optional[date] = None,
+    releasedTo: Optional[date] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    user_id: str = Depends(current_user)
+):
+    """Get backlog games with optional filters.
+
+    Supports the same `limit`/`after` pagination, `stream` NDJSON mode,
+    ranked `search`, release date range and `fields` selection as the
+    games listing.
+    """
+    serializer = backlog_serializer.select(fields)
+    query = build_backlog_query(user_id, category, priority, platform, search, releasedFrom, releasedTo)
+    
+    if search:
+        if after:
+            raise HTTPException(status_code=400, detail="Search results cannot be paged with a cursor")
+        cursor = ranked_find(backlog_collection, query, SORT_ORDER, serializer.projection)
+    else:
+        cursor = backlog_collection.find(apply_cursor(query, after), serializer.projection).sort(SORT_ORDER)
+    
+    if stream:
+        if limit:
+            cursor = cursor.limit(limit)
+        return StreamingResponse(stream_ndjson(cursor, serializer), media_type=NDJSON_MEDIA_TYPE)
     
-    backlog_items = await backlog_collection.find(query).to_list(1000)
-    return [Backlog(**item) for item in backlog_items]
+    async def produce(response: Response):
+        backlog_items = await fetch_page(cursor, limit, response, keyset=not search)
+        return serializer.dumps_many(backlog_items)
+    
+    params = {
+        "category": category, "priority": priority, "platform": platform,
+        "search": search, "releasedFrom": releasedFrom, "releasedTo": releasedTo,
+        "limit": limit, "after": after, "fields": fields and ",".join(serializer.fields)
+    }
+    return await response_cache.respond(request, user_id, BACKLOG, params, produce)
 
-@router.post("/", response_model=Backlog)
-async def create_backlog_item(backlog_item: BacklogCreate):
-    """Add a game to backlog"""
+@router.get("/facets", response_model=Dict[str, List[FacetCount]])
+async def get_backlog_facets(
+    request: Request,
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    platform: Optional[str] = None,
+    search: Optional[str] = None,
+    user_id: str = Depends(current_user)
+):
+    """Get the category, priority and platform values with their item counts.
+
+    Each field's counts respect the other active filters.
+    """
+    base_query = build_backlog_query(user_id, search=search)
+    
+    async def produce(response: Response):
+        filters = {"category": category, "priority": priority, "platform": platform}
+        return await facet_counts(backlog_collection, filters, base_query)
+    
+    params = {"view": "facets", "category": category, "priority": priority, "platform": platform, "search": search}
+    return await response_cache.respond(request, user_id, BACKLOG, params, produce)
+
+@router.get("/ranked", response_model=List[RankedBacklog])
+async def get_ranked_backlog(limit: int = Query(10, ge=1, le=100), user_id: str = Depends(current_user)):
+    """Get the backlog items most worth playing next, best first.
+
+    Scores combine priority, category, discount against the wishlist price,
+    short playtime and how well the genre is rated in the library.
+    """
+    ranked = await backlog_rankers.get(user_id).rank(limit)
+    if not ranked:
+        return Response(b"[]", media_type="application/json")
+    
+    items = await backlog_collection.find(
+        {"userId": user_id, "id": {"$in": [item_id for item_id, _ in ranked]}}, backlog_serializer.projection
+    ).to_list(None)
+    by_id = {item["id"]: item for item in items}
+    # Items deleted since the ranking was loaded are skipped
+    ranked_items = [{**by_id[item_id], "score": score} for item_id, score in ranked if item_id in by_id]
+    return Response(ranked_serializer.dumps_many(ranked_items), media_type="application/json")
+
+@router.get("/deals", response_model=List[Backlog])
+async def get_deals(
+    request: Request,
+    minDiscount: float = Query(0, ge=0, le=100),
+    limit: int = Query(50, ge=1, le=1000),
+    user_id: str = Depends(current_user)
+):
+    """Get the items priced at or below their wishlist price, biggest discount first"""
+    query = {"userId": user_id, "isDeal": True}
+    if minDiscount:
+        query["discountPct"] = {"$gte": minDiscount}
+    
+    async def produce(response: Response):
+        cursor = backlog_collection.find(query, backlog_serializer.projection)
+        deals = await cursor.sort([("discountPct", -1), ("id", 1)]).limit(limit).to_list(limit)
+        return backlog_serializer.dumps_many(deals)
+    
+    params = {"view": "deals", "minDiscount": minDiscount, "limit": limit}
+    return await response_cache.respond(request, user_id, BACKLOG, params, produce)
+
+@router.post("/prices", response_model=PriceIngestResponse)
+async def ingest_backlog_prices(request: Request, user_id: str = Depends(current_user)):
+    """Apply current prices from a JSON array, NDJSON or CSV of {id, price, at} rows.
+
+    Meant for price syncs: only points that change an item's price are
+    stored in its history.
+    """
+    rows = await read_rows(request)
+    return await ingest_prices(user_id, rows, backlog_prices_updated)
+
+def new_backlog_document(backlog_item: BacklogCreate, user_id: str) -> dict:
+    """Build the stored document for a new backlog item of `user_id`"""
     backlog_dict = backlog_item.dict()
-    backlog_dict["id"] = Backlog().id
+    backlog_dict.update(deal_fields(backlog_dict["currentPrice"], backlog_dict["wishlistPrice"]))
+    backlog_dict["id"] = str(uuid.uuid4())
+    backlog_dict["userId"] = user_id
     backlog_dict["createdAt"] = datetime.utcnow()
     backlog_dict["updatedAt"] = datetime.utcnow()
+    return backlog_dict
+
+@router.post("/", response_model=Backlog)
+async def create_backlog_item(backlog_item: BacklogCreate, user_id: str = Depends(current_user)):
+    """Add a game to backlog"""
+    backlog_dict = new_backlog_document(backlog_item, user_id)
     
     await backlog_collection.insert_one(backlog_dict)
+    await backlog_created(user_id, backlog_dict)
     return Backlog(**backlog_dict)
 
+@router.post("/bulk", response_model=BulkImportResponse)
+async def bulk_import_backlog(request: Request, user_id: str = Depends(current_user)):
+    """Import backlog items from a JSON array, NDJSON or CSV body or file upload"""
+    rows = await read_rows(request)
+    return await import_rows(
+        rows, BacklogCreate, backlog_collection,
+        partial(new_backlog_document, user_id=user_id), partial(backlog_inserted, user_id)
+    )
+
+@router.get("/export")
+async def export_backlog(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    user_id: str = Depends(current_user)
+):
+    """Stream the whole backlog as NDJSON or CSV"""
+    cursor = backlog_collection.find({"userId": user_id}, backlog_serializer.projection).sort(SORT_ORDER)
+    return export_response(cursor, Backlog, format, "backlog")
+
 @router.get("/{backlog_id}", response_model=Backlog)
-async def get_backlog_item(backlog_id: str):
-    """Get a specific backlog item by ID"""
-    item = await backlog_collection.find_one({"id": backlog_id})
+async def get_backlog_item(backlog_id: str, fields: Optional[str] = None, user_id: str = Depends(current_user)):
+    """Get a specific backlog item by ID, optionally only the comma-separated `fields`"""
+    serializer = backlog_serializer.select(fields)
+    item = await backlog_collection.find_one({"userId": user_id, "id": backlog_id}, serializer.projection)
     if not item:
         raise HTTPException(status_code=404, detail="Backlog item not found")
-    return Backlog(**item)
+    return Response(serializer.dumps(item), media_type="application/json")
 
 @router.put("/{backlog_id}", response_model=Backlog)
-async def update_backlog_item(backlog_id: str, backlog_update: BacklogUpdate):
+async def update_backlog_item(backlog_id: str, backlog_update: BacklogUpdate, user_id: str = Depends(current_user)):
     """Update a backlog item"""
     update_data = {k: v for k, v in backlog_update.dict().items() if v is not None}
     if not update_data:
@@ -53,36 +228,74 @@ async def update_backlog_item(backlog_id: str, backlog_update: BacklogUpdate):
     
     update_data["updatedAt"] = datetime.utcnow()
     
-    result = await backlog_collection.update_one(
-        {"id": backlog_id}, 
-        {"$set": update_data}
+    # The deal fields are recomputed in the same write; the previous version
+    # tells whether the price changed and must go into the price history
+    previous_item = await backlog_collection.find_one_and_update(
+        {"userId": user_id, "id": backlog_id}, 
+        set_with_deal_fields(update_data),
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if not previous_item:
         raise HTTPException(status_code=404, detail="Backlog item not found")
     
-    updated_item = await backlog_collection.find_one({"id": backlog_id})
+    updated_item = {**previous_item, **update_data}
+    updated_item.update(deal_fields(updated_item["currentPrice"], updated_item["wishlistPrice"]))
+    await backlog_updated(user_id, previous_item, updated_item)
     return Backlog(**updated_item)
 
 @router.delete("/{backlog_id}")
-async def delete_backlog_item(backlog_id: str):
+async def delete_backlog_item(backlog_id: str, user_id: str = Depends(current_user)):
     """Remove item from backlog"""
-    result = await backlog_collection.delete_one({"id": backlog_id})
-    if result.deleted_count == 0:
+    deleted_item = await backlog_collection.find_one_and_delete(
+        {"userId": user_id, "id": backlog_id}, projection={"_id": 0}
+    )
+    if not deleted_item:
         raise HTTPException(status_code=404, detail="Backlog item not found")
+    await backlog_deleted(user_id, deleted_item)
     return {"message": "Backlog item deleted successfully"}
 
+@router.get("/{backlog_id}/prices", response_model=List[PricePoint])
+async def get_price_history(
+    backlog_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: str = Depends(current_user)
+):
+    """Get the recorded prices of an item, oldest first"""
+    # Price points are keyed by item alone, so ownership is checked on the item
+    if not await backlog_collection.find_one({"userId": user_id, "id": backlog_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Backlog item not found")
+    return await price_history(backlog_id, start, end)
+
 @router.post("/{backlog_id}/move-to-library", response_model=Game)
-async def move_backlog_to_library(backlog_id: str, move_data: MoveToLibraryRequest):
-    """Move a backlog item to the main games library"""
-    # Get the backlog item
-    backlog_item = await backlog_collection.find_one({"id": backlog_id})
+async def move_backlog_to_library(
+    backlog_id: str,
+    move_data: MoveToLibraryRequest,
+    user_id: str = Depends(current_user)
+):
+    """Move a backlog item to the main games library.
+
+    The move is idempotent rather than transactional: the backlog item first
+    records the id its game will get, so retrying a move that was interrupted
+    between the insert and the delete finishes it instead of duplicating it,
+    and the stats and analytics for the game are recorded along with the delete.
+    """
+    # Claim the game id, keeping the one from an earlier interrupted attempt
+    backlog_item = await backlog_collection.find_one_and_update(
+        {"userId": user_id, "id": backlog_id},
+        [{"$set": {"movedToGameId": {"$ifNull": ["$movedToGameId", str(uuid.uuid4())]}}}],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
     if not backlog_item:
         raise HTTPException(status_code=404, detail="Backlog item not found")
     
     # Create new game from backlog item
     game_dict = {
-        "id": Game().id,
+        "id": backlog_item["movedToGameId"],
+        "userId": user_id,
         "title": backlog_item["title"],
         "platform": backlog_item["platform"],
         "genre": backlog_item["genre"],
@@ -100,10 +313,23 @@ async def move_backlog_to_library(backlog_id: str, move_data: MoveToLibraryReque
         "updatedAt": datetime.utcnow()
     }
     
-    # Insert into games collection
-    await games_collection.insert_one(game_dict)
+    # Insert into games collection unless an earlier attempt already did
+    result = await games_collection.update_one(
+        {"userId": user_id, "id": game_dict["id"]},
+        {"$setOnInsert": game_dict},
+        upsert=True
+    )
+    if result.upserted_id is None:
+        game_dict = await games_collection.find_one({"userId": user_id, "id": game_dict["id"]}, {"_id": 0})
     
-    # Remove from backlog
-    await backlog_collection.delete_one({"id": backlog_id})
+    # Removing the backlog item completes the move. Only the attempt that removes
+    # it records the new game, so an attempt interrupted after the insert leaves
+    # the bookkeeping to its retry instead of skipping it
+    deleted_item = await backlog_collection.find_one_and_delete(
+        {"userId": user_id, "id": backlog_id}, projection={"_id": 0}
+    )
+    if deleted_item:
+        await game_created(user_id, game_dict)
+        await backlog_moved(user_id, deleted_item)
     
     return Game(**game_dict)
\ No newline at end of file
@@ -0,0 +1,120 @@
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError
+from typing import Optional
+from datetime import date
+import asyncio
+import hashlib
+import time
+import orjson
+from pagination import NEXT_CURSOR_HEADER
+from routes.games import get_games, get_dashboard_stats
+from routes.backlog import get_backlog
+from routes.preferences import get_preferences
+from tenants import current_user
+
+router = APIRouter(tags=["bootstrap"])
+
+SERVER_TIMING_HEADER = "Server-Timing"
+PARTS = ("preferences", "stats", "games", "backlog")
+CONDITIONAL_HEADERS = {b"if-none-match", b"if-modified-since"}
+
+class _GamesParams(BaseModel):
+    platform: Optional[str] = None
+    genre: Optional[str] = None
+    status: Optional[str] = None
+    search: Optional[str] = None
+    completedFrom: Optional[date] = None
+    completedTo: Optional[date] = None
+    releasedFrom: Optional[date] = None
+    releasedTo: Optional[date] = None
+    limit: Optional[int] = Field(None, ge=1, le=1000)
+    after: Optional[str] = None
+    fields: Optional[str] = None
+    includeArchived: bool = False
+
+class _BacklogParams(BaseModel):
+    category: Optional[str] = None
+    priority: Optional[str] = None
+    platform: Optional[str] = None
+    search: Optional[str] = None
+    releasedFrom: Optional[date] = None
+    releasedTo: Optional[date] = None
+    limit: Optional[int] = Field(None, ge=1, le=1000)
+    after: Optional[str] = None
+    fields: Optional[str] = None
+
+def _sub_params(request: Request, prefix: str, model, errors: list):
+    """Validate the `prefix.`-scoped query parameters of one sub-request"""
+    raw = {
+        key[len(prefix) + 1:]: value
+        for key, value in request.query_params.items()
+        if key.startswith(prefix + ".")
+    }
+    try:
+        return model(**raw)
+    except ValidationError as e:
+        errors.extend({**error, "loc": ("query", f"{prefix}.{error['loc'][0]}")} for error in e.errors())
+
+def _unconditional(request: Request) -> Request:
+    """`request` without its conditional headers, so a part never answers 304 with an empty body"""
+    headers = [(name, value) for name, value in request.scope["headers"] if name.lower() not in CONDITIONAL_HEADERS]
+    return Request({**request.scope, "headers": headers})
+
+async def _timed(name: str, call) -> tuple:
+    started = time.perf_counter()
+    response = await call
+    return name, response, (time.perf_counter() - started) * 1000
+
+@router.get("/bootstrap")
+async def get_bootstrap(
+    request: Request,
+    include: str = Query(",".join(PARTS)),
+    user_id: str = Depends(current_user)
+):
+    """Get everything the app needs on first load in a single response.
+
+    Preferences, dashboard stats and the games and backlog listings are
+    read concurrently. Listing filters are passed with a `games.` or
+    `backlog.` prefix (e.g. `games.status=Completed&backlog.limit=50`) and
+    the next page cursors are returned under `cursors`. `include` selects
+    the parts to load. Each part's time is reported in Server-Timing.
+    """
+    parts = [part for part in include.split(",") if part in PARTS]
+    errors = []
+    games_params = _sub_params(request, "games", _GamesParams, errors)
+    backlog_params = _sub_params(request, "backlog", _BacklogParams, errors)
+    if errors:
+        raise RequestValidationError(errors)
+
+    # The combined response answers If-None-Match itself, against the ETag of the whole
+    part_request = _unconditional(request)
+    calls = {
+        "preferences": lambda: get_preferences(part_request, user_id),
+        "stats": lambda: get_dashboard_stats(part_request, user_id),
+        "games": lambda: get_games(part_request, **games_params.model_dump(), stream=False, user_id=user_id),
+        "backlog": lambda: get_backlog(part_request, **backlog_params.model_dump(), stream=False, user_id=user_id),
+    }
+    results = await asyncio.gather(*[_timed(part, calls[part]()) for part in parts])
+
+    # The parts are served by the response cache already encoded; splice them in as they are
+    body = bytearray(b"{")
+    cursors = {}
+    for name, response, _ in results:
+        body += orjson.dumps(name) + b":" + bytes(response.body) + b","
+        if name in ("games", "backlog"):
+            cursors[name] = response.headers.get(NEXT_CURSOR_HEADER)
+    body += b'"cursors":' + orjson.dumps(cursors) + b"}"
+
+    etag = '"' + hashlib.blake2b(
+        "".join(response.headers["ETag"] for _, response, _ in results).encode() + include.encode(),
+        digest_size=16
+    ).hexdigest() + '"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        SERVER_TIMING_HEADER: ", ".join(f"{name};dur={elapsed:.1f}" for name, _, elapsed in results),
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=bytes(body), media_type="application/json", headers=headers)
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+import os
+from database import games_archive_collection, games_collection, backlog_collection
+from covers import THUMBNAIL_MEDIA_TYPE, CoverUnavailable, cover_store
+from tenants import current_user
+
+router = APIRouter(prefix="/covers", tags=["covers"])
+
+# The URL names the item, not the image, so browsers revalidate now and then
+# in case the cover was changed; the ETag makes that a 304. Which cover an item
+# id stands for depends on the user, so shared caches must not keep it
+COVER_MAX_AGE = int(os.environ.get("COVER_MAX_AGE", 7 * 24 * 3600))
+
+def cover_query(user_id: str, item_id: str) -> dict:
+    """Filter of the cover lookup; the image itself is found on disk by its URL"""
+    return {"userId": user_id, "id": item_id}
+
+async def _cover_url(user_id: str, item_id: str):
+    for collection in (games_collection, games_archive_collection, backlog_collection):
+        item = await collection.find_one(cover_query(user_id, item_id), {"_id": 0, "cover": 1})
+        if item:
+            return item.get("cover")
+    return None
+
+@router.get("/{item_id}")
+async def get_cover(
+    request: Request,
+    item_id: str,
+    size: str = Query("medium", pattern="^(small|medium|large)$"),
+    user_id: str = Depends(current_user)
+):
+    """Get a thumbnail of the cover of a game or backlog item, served from the local cover cache"""
+    url = await _cover_url(user_id, item_id)
+    if not url:
+        raise HTTPException(status_code=404, detail="Cover not found")
+    
+    try:
+        path, content_hash = await cover_store.thumbnail(url, size)
+    except CoverUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    
+    etag = f'"{content_hash[:32]}-{size}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={COVER_MAX_AGE}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    # Sent with the server's pathsend extension (sendfile) when it supports it
+    return FileResponse(path, media_type=THUMBNAIL_MEDIA_TYPE, headers=headers)
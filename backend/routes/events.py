@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+from events import broker, format_sse
+from tenants import current_user
+
+router = APIRouter(tags=["events"])
+
+# Comment lines keep proxies from closing an idle stream
+KEEPALIVE_SECONDS = 15
+
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    lastEventId: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+    user_id: str = Depends(current_user)
+):
+    """Stream create/update/delete events for the user's games, backlog and preferences (SSE).
+
+    Reconnecting clients resume from the Last-Event-ID header (sent by
+    EventSource automatically) or the `lastEventId` query parameter.
+    """
+    subscription = broker.subscribe(user_id, last_event_id or lastEventId)
+    
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # Fell too far behind; the client reconnects and resumes
+                    break
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(user_id, subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
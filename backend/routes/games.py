@@ -1,20 +1,42 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Optional
-from datetime import datetime
-from models import Game, GameCreate, GameUpdate, StatsResponse
-from database import games_collection, backlog_collection
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+from datetime import date, datetime
+from functools import partial
+import asyncio
+import uuid
+from pymongo import ReturnDocument
+from models import Game, GameCreate, GameUpdate, StatsResponse, BulkImportResponse, FacetCount
+from database import games_archive_collection, games_collection
+from pagination import SORT_ORDER, NDJSON_MEDIA_TYPE, MergedCursor, apply_cursor, fetch_page, sort_key, stream_ndjson
+from search import ranked_find, ranked_key, text_query
+from serialize import FastSerializer
+from facets import facet_counts, merge_facet_counts
+from archive import find_game, restore_game
+from dates import date_range
+from bulk import export_response, import_rows, read_rows
+from stats import read_stats, to_stats_response
+from cache import GAMES, STATS, response_cache
+from changes import game_created, game_deleted, game_updated, games_inserted
+from tenants import current_user
+
+game_serializer = FastSerializer(Game)
 
 router = APIRouter(prefix="/games", tags=["games"])
 
-@router.get("/", response_model=List[Game])
-async def get_games(
+def build_games_query(
+    user_id: str,
     platform: Optional[str] = None,
     genre: Optional[str] = None,
     status: Optional[str] = None,
-    search: Optional[str] = None
-):
-    """Get all games with optional filters"""
-    query = {}
+    search: Optional[str] = None,
+    completed_from: Optional[date] = None,
+    completed_to: Optional[date] = None,
+    released_from: Optional[date] = None,
+    released_to: Optional[date] = None
+) -> dict:
+    """Translate the listing filters into a MongoDB query over `user_id`'s games"""
+    query = {"userId": user_id}
     
     if platform and platform != "All":
         query["platform"] = platform
@@ -22,78 +44,211 @@ async def get_games(
         query["genre"] = genre
     if status and status != "All":
         query["status"] = status
+    completed = date_range(completed_from, completed_to)
+    if completed:
+        query["completionDate"] = completed
+    released = date_range(released_from, released_to)
+    if released:
+        query["releaseDate"] = released
     if search:
-        query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"developer": {"$regex": search, "$options": "i"}}
-        ]
+        query.update(text_query(search))
+    return query
+
+@router.get("/", response_model=List[Game])
+async def get_games(
+    request: Request,
+    platform: Optional[str] = None,
+    genre: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    completedFrom: Optional[date] = None,
+    completedTo: Optional[date] = None,
+    releasedFrom: Optional[date] = None,
+    releasedTo: Optional[date] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    includeArchived: bool = False,
+    user_id: str = Depends(current_user)
+):
+    """Get all games with optional filters.
+
+    Pass `limit` to page through the results; the cursor for the next page
+    is returned in the X-Next-Cursor header and goes back in `after`.
+    With `stream=true` the games are streamed as NDJSON instead.
+    `search` matches title, developer and notes and ranks by relevance.
+    The date filters take YYYY-MM-DD and include both ends of the range.
+    `fields` takes a comma-separated list, e.g. `id,title,cover`, and
+    returns only those fields of each game.
+    Finished games that have not changed for a while are archived (see
+    archive.py) and left out unless `includeArchived=true`, which merges
+    them into the same order.
+    """
+    serializer = game_serializer.select(fields)
+    query = build_games_query(
+        user_id, platform, genre, status, search,
+        completedFrom, completedTo, releasedFrom, releasedTo
+    )
+    if search and after:
+        raise HTTPException(status_code=400, detail="Search results cannot be paged with a cursor")
+    
+    def find(collection):
+        if search:
+            return ranked_find(collection, query, SORT_ORDER, serializer.projection)
+        return collection.find(apply_cursor(query, after), serializer.projection).sort(SORT_ORDER)
+    
+    cursor = find(games_collection)
+    if includeArchived:
+        cursor = MergedCursor([cursor, find(games_archive_collection)], ranked_key if search else sort_key)
     
-    games = await games_collection.find(query).to_list(1000)
-    return [Game(**game) for game in games]
+    if stream:
+        if limit:
+            cursor = cursor.limit(limit)
+        return StreamingResponse(stream_ndjson(cursor, serializer), media_type=NDJSON_MEDIA_TYPE)
+    
+    async def produce(response: Response):
+        games = await fetch_page(cursor, limit, response, keyset=not search)
+        return serializer.dumps_many(games)
+    
+    params = {
+        "platform": platform, "genre": genre, "status": status, "search": search,
+        "completedFrom": completedFrom, "completedTo": completedTo,
+        "releasedFrom": releasedFrom, "releasedTo": releasedTo,
+        "limit": limit, "after": after, "fields": fields and ",".join(serializer.fields),
+        "includeArchived": includeArchived
+    }
+    return await response_cache.respond(request, user_id, GAMES, params, produce)
 
-@router.post("/", response_model=Game)
-async def create_game(game: GameCreate):
-    """Create a new game"""
+@router.get("/facets", response_model=Dict[str, List[FacetCount]])
+async def get_game_facets(
+    request: Request,
+    platform: Optional[str] = None,
+    genre: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    includeArchived: bool = False,
+    user_id: str = Depends(current_user)
+):
+    """Get the platform, genre and status values with their game counts.
+
+    Each field's counts respect the other active filters, so they match what
+    the listing would return after picking that value; `includeArchived`
+    counts archived games too, as it lists them.
+    """
+    base_query = build_games_query(user_id, search=search)
+    
+    async def produce(response: Response):
+        filters = {"platform": platform, "genre": genre, "status": status}
+        if not includeArchived:
+            return await facet_counts(games_collection, filters, base_query)
+        return merge_facet_counts(*await asyncio.gather(
+            facet_counts(games_collection, filters, base_query),
+            facet_counts(games_archive_collection, filters, base_query)
+        ))
+    
+    params = {
+        "view": "facets", "platform": platform, "genre": genre, "status": status, "search": search,
+        "includeArchived": includeArchived
+    }
+    return await response_cache.respond(request, user_id, GAMES, params, produce)
+
+def new_game_document(game: GameCreate, user_id: str) -> dict:
+    """Build the stored document for a new game of `user_id`"""
     game_dict = game.dict()
-    game_dict["id"] = Game().id
+    game_dict["id"] = str(uuid.uuid4())
+    game_dict["userId"] = user_id
     game_dict["createdAt"] = datetime.utcnow()
     game_dict["updatedAt"] = datetime.utcnow()
+    return game_dict
+
+@router.post("/", response_model=Game)
+async def create_game(game: GameCreate, user_id: str = Depends(current_user)):
+    """Create a new game"""
+    game_dict = new_game_document(game, user_id)
     
     await games_collection.insert_one(game_dict)
+    await game_created(user_id, game_dict)
     return Game(**game_dict)
 
+@router.post("/bulk", response_model=BulkImportResponse)
+async def bulk_import_games(request: Request, user_id: str = Depends(current_user)):
+    """Import games from a JSON array, NDJSON or CSV body or file upload"""
+    rows = await read_rows(request)
+    return await import_rows(
+        rows, GameCreate, games_collection,
+        partial(new_game_document, user_id=user_id), partial(games_inserted, user_id)
+    )
+
+@router.get("/export")
+async def export_games(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    user_id: str = Depends(current_user)
+):
+    """Stream the whole library, archived games included, as NDJSON or CSV"""
+    cursor = MergedCursor([
+        collection.find({"userId": user_id}, game_serializer.projection).sort(SORT_ORDER)
+        for collection in (games_collection, games_archive_collection)
+    ], sort_key)
+    return export_response(cursor, Game, format, "games")
+
 @router.get("/{game_id}", response_model=Game)
-async def get_game(game_id: str):
-    """Get a specific game by ID"""
-    game = await games_collection.find_one({"id": game_id})
+async def get_game(game_id: str, fields: Optional[str] = None, user_id: str = Depends(current_user)):
+    """Get a specific game by ID, archived or not, optionally only the comma-separated `fields`"""
+    serializer = game_serializer.select(fields)
+    game = await find_game(user_id, game_id, serializer.projection)
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
-    return Game(**game)
+    return Response(serializer.dumps(game), media_type="application/json")
 
 @router.put("/{game_id}", response_model=Game)
-async def update_game(game_id: str, game_update: GameUpdate):
-    """Update a game"""
+async def update_game(game_id: str, game_update: GameUpdate, user_id: str = Depends(current_user)):
+    """Update a game; an archived game is moved back to the library first"""
     update_data = {k: v for k, v in game_update.dict().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No update data provided")
     
     update_data["updatedAt"] = datetime.utcnow()
     
-    result = await games_collection.update_one(
-        {"id": game_id}, 
-        {"$set": update_data}
-    )
+    # The previous version is needed to adjust the dashboard counters; the
+    # updated one is derived from it, so both come from this single atomic write
+    async def apply_update():
+        return await games_collection.find_one_and_update(
+            {"userId": user_id, "id": game_id}, 
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
     
-    if result.matched_count == 0:
+    previous_game = await apply_update()
+    if not previous_game and await restore_game(user_id, game_id):
+        previous_game = await apply_update()
+    
+    if not previous_game:
         raise HTTPException(status_code=404, detail="Game not found")
     
-    updated_game = await games_collection.find_one({"id": game_id})
+    updated_game = {**previous_game, **update_data}
+    await game_updated(user_id, previous_game, updated_game)
     return Game(**updated_game)
 
 @router.delete("/{game_id}")
-async def delete_game(game_id: str):
-    """Delete a game"""
-    result = await games_collection.delete_one({"id": game_id})
-    if result.deleted_count == 0:
+async def delete_game(game_id: str, user_id: str = Depends(current_user)):
+    """Delete a game, archived or not"""
+    # While the archiver is moving the game it is in both tiers; both copies go
+    deleted_game = None
+    for collection in (games_collection, games_archive_collection):
+        deleted = await collection.find_one_and_delete({"userId": user_id, "id": game_id}, projection={"_id": 0})
+        deleted_game = deleted_game or deleted
+    if not deleted_game:
         raise HTTPException(status_code=404, detail="Game not found")
+    await game_deleted(user_id, deleted_game)
     return {"message": "Game deleted successfully"}
 
 @router.get("/stats/dashboard", response_model=StatsResponse)
-async def get_dashboard_stats():
+async def get_dashboard_stats(request: Request, user_id: str = Depends(current_user)):
     """Get dashboard statistics"""
-    games = await games_collection.find().to_list(1000)
-    backlog = await backlog_collection.find().to_list(1000)
-    
-    completed = len([g for g in games if g.get("status") == "Completed"])
-    in_progress = len([g for g in games if g.get("status") == "In Progress"])
-    total_playtime = sum(g.get("playtime", 0) for g in games)
-    avg_rating = sum(g.get("rating", 0) for g in games) / len(games) if games else 0
+    # Counters are maintained incrementally by the write handlers
+    async def produce(response: Response):
+        return to_stats_response(await read_stats(user_id))
     
-    return StatsResponse(
-        totalGames=len(games),
-        completed=completed,
-        inProgress=in_progress,
-        totalPlaytime=total_playtime,
-        avgRating=round(avg_rating, 1),
-        backlogCount=len(backlog)
-    )
\ No newline at end of file
+    return await response_cache.respond(request, user_id, STATS, {}, produce)
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, Request
+import asyncio
+import logging
+import os
+import sqlite3
+from pymongo.errors import PyMongoError
+from database import ping
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+PING_TIMEOUT = float(os.environ.get("HEALTH_PING_TIMEOUT", 2.0))
+
+async def _ping_mongo() -> dict:
+    try:
+        latency = await asyncio.wait_for(ping(), PING_TIMEOUT)
+    except (PyMongoError, sqlite3.Error, asyncio.TimeoutError) as e:
+        # The driver's message names hosts and topology details; keep it in the logs
+        logger.warning("Database health ping failed: %s", str(e) or "timed out")
+        return {"status": "unreachable"}
+    return {"status": "ok", "latencyMs": round(latency, 2)}
+
+@router.get("/live")
+async def liveness():
+    """Liveness probe: the worker is up and serving requests.
+
+    MongoDB is pinged and reported, but an outage does not fail this
+    probe: restarting the worker would not bring the database back.
+    """
+    return {"status": "alive", "mongo": await _ping_mongo()}
+
+@router.get("/ready")
+async def readiness(request: Request):
+    """Readiness probe: startup has finished and the database answers a ping.
+
+    The database status stays under the "mongo" key with the embedded
+    backend too, so existing probe checks keep working.
+    """
+    if not getattr(request.app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="Startup has not finished")
+    mongo = await _ping_mongo()
+    if mongo["status"] != "ok":
+        raise HTTPException(status_code=503, detail="The database is unreachable")
+    return {"status": "ready", "mongo": mongo}
@@ -1,29 +1,51 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from datetime import datetime
+import uuid
+from pymongo import ReturnDocument
 from models import Preferences, PreferencesCreate, PreferencesUpdate
 from database import preferences_collection
+from cache import PREFERENCES, response_cache
+from serialize import FastSerializer
+from changes import preferences_updated
+from tenants import current_user
+
+preferences_serializer = FastSerializer(Preferences)
 
 router = APIRouter(prefix="/preferences", tags=["preferences"])
 
+def _default_preferences() -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "language": "en",
+        "createdAt": datetime.utcnow(),
+        "updatedAt": datetime.utcnow()
+    }
+
+async def _load_preferences(user_id: str) -> dict:
+    # Each user has a single preferences document, found by its userId
+    prefs = await preferences_collection.find_one({"userId": user_id}, preferences_serializer.projection)
+    if not prefs:
+        # Create default preferences if none exist; the upsert leaves
+        # preferences created concurrently by another request untouched
+        prefs = await preferences_collection.find_one_and_update(
+            {"userId": user_id},
+            {"$setOnInsert": _default_preferences()},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    return prefs
+
 @router.get("/", response_model=Preferences)
-async def get_preferences():
+async def get_preferences(request: Request, user_id: str = Depends(current_user)):
     """Get user preferences"""
-    prefs = await preferences_collection.find_one()
-    if not prefs:
-        # Create default preferences if none exist
-        default_prefs = {
-            "id": Preferences().id,
-            "language": "en",
-            "createdAt": datetime.utcnow(),
-            "updatedAt": datetime.utcnow()
-        }
-        await preferences_collection.insert_one(default_prefs)
-        return Preferences(**default_prefs)
+    async def produce(response: Response):
+        return preferences_serializer.dumps(await _load_preferences(user_id))
     
-    return Preferences(**prefs)
+    return await response_cache.respond(request, user_id, PREFERENCES, {}, produce)
 
 @router.put("/", response_model=Preferences)
-async def update_preferences(prefs_update: PreferencesUpdate):
+async def update_preferences(prefs_update: PreferencesUpdate, user_id: str = Depends(current_user)):
     """Update user preferences"""
     update_data = {k: v for k, v in prefs_update.dict().items() if v is not None}
     if not update_data:
@@ -31,22 +53,15 @@ async def update_preferences(prefs_update: PreferencesUpdate):
     
     update_data["updatedAt"] = datetime.utcnow()
     
-    # Get existing preferences or create new ones
-    existing_prefs = await preferences_collection.find_one()
-    if not existing_prefs:
-        new_prefs = {
-            "id": Preferences().id,
-            "language": update_data.get("language", "en"),
-            "createdAt": datetime.utcnow(),
-            "updatedAt": datetime.utcnow()
-        }
-        await preferences_collection.insert_one(new_prefs)
-        return Preferences(**new_prefs)
-    
-    await preferences_collection.update_one(
-        {"id": existing_prefs["id"]}, 
-        {"$set": update_data}
+    # Update the existing preferences, or create them if none exist, in one round trip
+    defaults = {k: v for k, v in _default_preferences().items() if k not in update_data}
+    updated_prefs = await preferences_collection.find_one_and_update(
+        {"userId": user_id},
+        {"$set": update_data, "$setOnInsert": defaults},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
     )
     
-    updated_prefs = await preferences_collection.find_one({"id": existing_prefs["id"]})
-    return Preferences(**updated_prefs)
\ No newline at end of file
+    await preferences_updated(user_id, updated_prefs)
+    return Preferences(**updated_prefs)
@@ -0,0 +1,22 @@
+from typing import Optional
+from pagination import sort_key
+
+# Relevance comes from the "userId_search_text" index declared in database.INDEXES
+SCORE_PROJECTION = {"score": {"$meta": "textScore"}}
+SCORE_SORT = [("score", {"$meta": "textScore"})]
+
+def text_query(search: str) -> dict:
+    """Match documents through the text index instead of a regex scan.
+
+    The input is handed to MongoDB's text search syntax, so words are
+    matched case-insensitively with stemming and never compiled as a regex.
+    """
+    return {"$text": {"$search": search}}
+
+def ranked_find(collection, query: dict, sort: list, projection: Optional[dict] = None):
+    """Find text search matches ordered by relevance, then by `sort`"""
+    return collection.find(query, {**(projection or {}), **SCORE_PROJECTION}).sort(SCORE_SORT + sort)
+
+def ranked_key(doc: dict) -> tuple:
+    """Position of a `ranked_find` result: best score first, then by sort_key"""
+    return (-doc["score"], *sort_key(doc))
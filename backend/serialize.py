@@ -0,0 +1,64 @@
+from typing import Any, Optional, Sequence, Type
+import orjson
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from dates import DATE_FIELDS, format_date
+from pagination import SORT_ORDER
+
+class FastSerializer:
+    """Encodes stored documents in the shape of a response model without validating them.
+
+    Documents written through the API were validated on the way in, so the
+    read path only projects the model's fields, fills in the defaults of the
+    optional ones and hands the result to orjson.
+    """
+
+    def __init__(self, model: Type[BaseModel], fields: Optional[Sequence[str]] = None):
+        self.model = model
+        self.fields = list(fields or model.model_fields)
+        self.date_fields = [name for name in self.fields if name in DATE_FIELDS]
+        self.defaults = {
+            name: field.default
+            for name, field in model.model_fields.items()
+            if name in self.fields and not field.is_required() and field.default_factory is None
+        }
+        # Fetch only what the response exposes so unused fields never leave the
+        # database, plus the sort keys the next page cursor is built from
+        self.projection = {"_id": 0, **{name: 1 for name in self.fields}, **{name: 1 for name, _ in SORT_ORDER}}
+        self._subsets = {}
+
+    def select(self, fields: Optional[str]) -> "FastSerializer":
+        """Serializer for the comma-separated subset `fields` of the model's fields.
+
+        Without `fields` this serializer itself is returned.
+        """
+        names = tuple(dict.fromkeys(name.strip() for name in (fields or "").split(",") if name.strip()))
+        if not names:
+            return self
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        if names not in self._subsets:
+            self._subsets[names] = FastSerializer(self.model, names)
+        return self._subsets[names]
+
+    def shape(self, doc: dict) -> dict:
+        shaped = {name: doc.get(name, self.defaults.get(name)) for name in self.fields}
+        for name in self.date_fields:
+            shaped[name] = format_date(shaped[name])
+        return shaped
+
+    def dumps(self, doc: dict) -> bytes:
+        return orjson.dumps(self.shape(doc))
+
+    def dumps_many(self, docs: list) -> bytes:
+        return orjson.dumps([self.shape(doc) for doc in docs])
+
+def encode(data: Any) -> bytes:
+    """Encode a response body; bytes from a FastSerializer pass through untouched"""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, BaseModel):
+        return orjson.dumps(data.model_dump(mode="json"))
+    return orjson.dumps(jsonable_encoder(data))
@@ -1,17 +1,51 @@
 from fastapi import FastAPI, APIRouter
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
-from routes import games, backlog, preferences
-from database import close_db_connection
+from routes import games, backlog, preferences, events, analytics, covers, bootstrap, health
+from database import close_db_connection, connect_db, create_indexes, with_retries
+from deals import ensure_deal_fields
+from archive import archiver
+from covers import cover_store
+from pagination import NEXT_CURSOR_HEADER
+from routes.bootstrap import SERVER_TIMING_HEADER
+from metrics import MetricsMiddleware, render_metrics
+from compression import CompressionMiddleware
+from admission import AdmissionMiddleware
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+async def prepare_database():
+    # Stats counters are built per user on first read; analytics as users write
+    await create_indexes()
+    await ensure_deal_fields()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Readiness is only reported once the database is reachable and prepared
+    app.state.ready = False
+    await connect_db()
+    await with_retries(prepare_database)
+    app.state.ready = True
+    archiver.start()
+    yield
+    app.state.ready = False
+    await archiver.stop()
+    await cover_store.close()
+    await close_db_connection()
+
 # Create the main app without a prefix
-app = FastAPI(title="GameVault API", description="API for gaming management system")
+app = FastAPI(
+    title="GameVault API",
+    description="API for gaming management system",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -21,29 +55,42 @@ api_router = APIRouter(prefix="/api")
 async def root():
     return {"message": "GameVault API is running", "status": "healthy"}
 
+# Prometheus scrape endpoint
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Include route modules
 api_router.include_router(games.router)
 api_router.include_router(backlog.router)
 api_router.include_router(preferences.router)
+api_router.include_router(events.router)
+api_router.include_router(analytics.router)
+api_router.include_router(covers.router)
+api_router.include_router(bootstrap.router)
+api_router.include_router(health.router)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Innermost, so shed requests still get CORS headers and show up in the request metrics
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),  # In production, specify exact origins
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, SERVER_TIMING_HEADER, "Retry-After"],
 )
 
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    await close_db_connection()
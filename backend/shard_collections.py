@@ -0,0 +1,51 @@
+"""Shard the collections of a MongoDB sharded cluster on the keys in database.SHARD_KEYS.
+
+Run it once against a mongos, after migrate_tenants.py has given every
+document its userId and the indexes exist (the server creates them at
+startup). Collections that are already sharded are reported and skipped:
+
+    python shard_collections.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+from pymongo.errors import OperationFailure
+from database import SHARD_KEYS, close_db_connection, create_indexes, get_client, storage_backend
+
+async def shard_collections(dry_run: bool = False) -> int:
+    db_name = os.environ["DB_NAME"]
+    admin = get_client().admin
+    if not dry_run:
+        await create_indexes()
+        await admin.command("enableSharding", db_name)
+    for name, key in SHARD_KEYS.items():
+        namespace = f"{db_name}.{name}"
+        if dry_run:
+            print(f"{namespace}: would shard on {key}")
+            continue
+        try:
+            await admin.command("shardCollection", namespace, key=key)
+        except OperationFailure as e:
+            # AlreadyInitialized: sharded by an earlier run
+            if e.code != 23:
+                raise
+            print(f"{namespace}: already sharded")
+            continue
+        print(f"{namespace}: sharded on {key}")
+    return 0
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Shard the collections on their per-user shard keys")
+    parser.add_argument("--dry-run", action="store_true", help="only print the shard keys")
+    args = parser.parse_args()
+    if storage_backend() != "mongo":
+        print("Sharding only applies to the MongoDB backend")
+        return 1
+    try:
+        return await shard_collections(dry_run=args.dry_run)
+    finally:
+        await close_db_connection()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
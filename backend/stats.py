@@ -0,0 +1,135 @@
+import asyncio
+from typing import Optional
+from pymongo.errors import DuplicateKeyError
+from models import StatsResponse
+from database import games_archive_collection, games_collection, backlog_collection, stats_collection
+
+# One materialized document per user, found by its userId, holds the dashboard
+# counters. They cover archived games too, so archiving a game leaves them alone.
+# Every update bumps its `version`, which lets a rebuild tell it raced a write
+REBUILD_ATTEMPTS = 5
+
+def field_key(value: str) -> str:
+    """Make a value such as a status or genre usable as a field name"""
+    return str(value).replace(".", "_").lstrip("$")
+
+def _game_delta(game: Optional[dict], sign: int) -> dict:
+    if not game:
+        return {}
+    return {
+        "totalGames": sign,
+        f"statusCounts.{field_key(game.get('status'))}": sign,
+        "totalPlaytime": sign * (game.get("playtime") or 0),
+        "ratingSum": sign * (game.get("rating") or 0),
+    }
+
+def game_change_delta(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Counter increments that turn the stats for `before` into the stats for `after`"""
+    delta = _game_delta(before, -1)
+    for field, value in _game_delta(after, 1).items():
+        delta[field] = delta.get(field, 0) + value
+    return {field: value for field, value in delta.items() if value}
+
+async def _increment(user_id: str, delta: dict):
+    if delta:
+        await stats_collection.update_one({"userId": user_id}, {"$inc": {**delta, "version": 1}}, upsert=True)
+
+async def record_game_change(user_id: str, before: Optional[dict] = None, after: Optional[dict] = None):
+    """Apply a game insert (no before), update or delete (no after) to the counters"""
+    await _increment(user_id, game_change_delta(before, after))
+
+async def record_games_inserted(user_id: str, games: list):
+    """Apply a batch of inserted games to the counters with a single update"""
+    delta = {}
+    for game in games:
+        for field, value in game_change_delta(None, game).items():
+            delta[field] = delta.get(field, 0) + value
+    await _increment(user_id, delta)
+
+async def record_backlog_change(user_id: str, count: int):
+    """Adjust the backlog counter by `count` items"""
+    if count:
+        await _increment(user_id, {"backlogCount": count})
+
+def games_stats_pipeline(user_id: str) -> list:
+    """Game counters of `user_id` in one aggregation over a games collection"""
+    return [
+        {"$match": {"userId": user_id}},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "totalGames": {"$sum": 1},
+                    "totalPlaytime": {"$sum": {"$ifNull": ["$playtime", 0]}},
+                    "ratingSum": {"$sum": {"$ifNull": ["$rating", 0]}}
+                }}
+            ],
+            "byStatus": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+            ]
+        }}
+    ]
+
+async def compute_stats(user_id: str) -> dict:
+    """Recompute `user_id`'s counters from the collections with server-side aggregation"""
+    games_pipeline = games_stats_pipeline(user_id)
+
+    hot_result, archived_result, backlog_count = await asyncio.gather(
+        games_collection.aggregate(games_pipeline).to_list(1),
+        games_archive_collection.aggregate(games_pipeline).to_list(1),
+        backlog_collection.count_documents({"userId": user_id})
+    )
+
+    stats = {
+        "userId": user_id, "totalGames": 0, "statusCounts": {}, "totalPlaytime": 0, "ratingSum": 0,
+        "backlogCount": backlog_count
+    }
+    for result in (hot_result, archived_result):
+        facets = result[0] if result else {}
+        totals = (facets.get("totals") or [{}])[0]
+        for field in ("totalGames", "totalPlaytime", "ratingSum"):
+            stats[field] += totals.get(field, 0)
+        for row in facets.get("byStatus", []):
+            status = field_key(row["_id"])
+            stats["statusCounts"][status] = stats["statusCounts"].get(status, 0) + row["count"]
+    return stats
+
+async def rebuild_stats(user_id: str) -> dict:
+    """Overwrite `user_id`'s counters with freshly computed values.
+
+    The result is only written over the version read before computing it; an
+    increment landing in between changes the version and the rebuild starts
+    over, so it is counted instead of overwritten.
+    """
+    for _ in range(REBUILD_ATTEMPTS):
+        current = await stats_collection.find_one({"userId": user_id}, {"_id": 0, "version": 1})
+        version = current.get("version") if current else None
+        stats = {**await compute_stats(user_id), "version": (version or 0) + 1}
+        try:
+            # With a newer version stored the filter matches nothing, and the upsert hits the unique userId
+            await stats_collection.replace_one({"userId": user_id, "version": version}, stats, upsert=True)
+            return stats
+        except DuplicateKeyError:
+            continue
+    raise RuntimeError(f"The stats of {user_id} kept changing through {REBUILD_ATTEMPTS} rebuilds")
+
+async def read_stats(user_id: str) -> dict:
+    """Read `user_id`'s counters with a single point lookup, building them on first use"""
+    stats = await stats_collection.find_one({"userId": user_id})
+    if not stats:
+        stats = await rebuild_stats(user_id)
+    return stats
+
+def to_stats_response(stats: dict) -> StatsResponse:
+    total_games = stats.get("totalGames", 0)
+    status_counts = stats.get("statusCounts", {})
+    avg_rating = stats.get("ratingSum", 0) / total_games if total_games else 0
+
+    return StatsResponse(
+        totalGames=total_games,
+        completed=status_counts.get("Completed", 0),
+        inProgress=status_counts.get(field_key("In Progress"), 0),
+        totalPlaytime=stats.get("totalPlaytime", 0),
+        avgRating=round(avg_rating, 1),
+        backlogCount=stats.get("backlogCount", 0)
+    )
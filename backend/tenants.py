@@ -0,0 +1,22 @@
+"""Which user's data a request reads and writes.
+
+Every document in the games, backlog, preferences, stats and analytics
+collections carries a `userId`, and every query the routes issue is
+scoped by it. The id comes from the X-User-Id header, set by the
+authenticating gateway in front of the API; requests without one act on
+DEFAULT_USER_ID, so a single-user deployment works unchanged.
+"""
+import os
+from typing import Optional
+from fastapi import Header
+
+USER_HEADER = "X-User-Id"
+DEFAULT_USER_ID = os.environ.get("DEFAULT_USER_ID", "default")
+# Ids from identity providers (UUIDs, subject claims, emails) fit; anything else is rejected
+USER_ID_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_.:@|-]{0,127}$"
+
+async def current_user(
+    user_id: Optional[str] = Header(None, alias=USER_HEADER, pattern=USER_ID_PATTERN)
+) -> str:
+    """Route dependency resolving the id of the user the request acts for"""
+    return user_id or DEFAULT_USER_ID
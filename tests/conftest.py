@@ -0,0 +1,87 @@
+"""Fixtures shared by the backend tests.
+
+The backend modules import each other as top-level modules, as they do
+when the server runs from backend/, so that directory goes on the path.
+Tests never touch the database configured in backend/.env: DB_NAME
+defaults to a scratch database of its own.
+"""
+import os
+import sys
+import uuid
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", f"gameplan_test_{uuid.uuid4().hex[:8]}")
+
+import database  # noqa: E402
+import httpx  # noqa: E402
+from pymongo.errors import PyMongoError  # noqa: E402
+from cache import InMemoryCacheBackend, response_cache  # noqa: E402
+from server import app  # noqa: E402
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+async def mongo_reachable() -> bool:
+    """Whether a mongod answers at MONGO_URL within a second"""
+    client = database.AsyncIOMotorClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=1000)
+    try:
+        await client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+async def _use_mongo() -> str:
+    """Point database at a live mongod, or at mongomock when none is running; returns which"""
+    if await mongo_reachable():
+        return "mongo"
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database._client = mongomock_motor.AsyncMongoMockClient()
+    return "mongomock"
+
+@pytest.fixture(params=database.BACKENDS)
+async def backend(request, tmp_path, monkeypatch):
+    """An empty database with the declared indexes, once per storage backend.
+
+    Yields "mongo", "mongomock" or "sqlite". Collection options
+    (time-series, compression) are left out: they are server features
+    that neither mongomock nor the embedded store needs.
+    """
+    await database.close_db_connection()
+    monkeypatch.setenv("STORAGE_BACKEND", request.param)
+    if request.param == "sqlite":
+        monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "gameplan.sqlite3"))
+        name = "sqlite"
+    else:
+        name = await _use_mongo()
+    db = database.get_database()
+    for collection_name, indexes in database.INDEXES.items():
+        await db[collection_name].create_indexes(indexes)
+    yield name
+    if name == "mongo":
+        await database.get_client().drop_database(os.environ["DB_NAME"])
+    await database.close_db_connection()
+
+@pytest.fixture
+async def mongo(monkeypatch):
+    """A scratch database on a live mongod with the collections and indexes created; skips when none answers"""
+    if not await mongo_reachable():
+        pytest.skip(f"no mongod reachable at {os.environ['MONGO_URL']}")
+    await database.close_db_connection()
+    monkeypatch.setenv("STORAGE_BACKEND", "mongo")
+    await database.create_indexes()
+    yield
+    await database.get_client().drop_database(os.environ["DB_NAME"])
+    await database.close_db_connection()
+
+@pytest.fixture
+async def api(backend, monkeypatch):
+    """An HTTP client for the app running on `backend`, starting with an empty response cache"""
+    monkeypatch.setattr(response_cache, "backend", InMemoryCacheBackend())
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
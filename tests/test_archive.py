@@ -0,0 +1,64 @@
+"""The archiver on every storage backend, including writes racing a sweep."""
+from datetime import datetime, timedelta
+import pytest
+
+import archive
+from database import games_archive_collection, games_collection
+
+pytestmark = pytest.mark.anyio
+
+OLD = datetime(2023, 1, 1)
+
+def game(game_id: str, status: str = "Completed") -> dict:
+    return {"userId": "alice", "id": game_id, "title": f"Game {game_id}", "status": status, "updatedAt": OLD}
+
+class _Patched:
+    """`collection` with its bulk_write replaced"""
+
+    def __init__(self, collection, bulk_write):
+        self._collection = collection
+        self.bulk_write = bulk_write
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._collection, attribute)
+
+async def tiers(game_id: str) -> tuple:
+    query = {"userId": "alice", "id": game_id}
+    return await games_collection.count_documents(query), await games_archive_collection.count_documents(query)
+
+async def test_moves_finished_games(backend):
+    await games_collection.insert_many([game("a"), game("b", "Dropped"), game("c", "In Progress")])
+    assert await archive.archive_games(now=OLD + timedelta(days=365)) == 2
+    assert [await tiers(game_id) for game_id in "abc"] == [(0, 1), (0, 1), (1, 0)]
+    assert await archive.archive_games(now=OLD + timedelta(days=365)) == 0
+
+@pytest.mark.parametrize("stage", ["copy", "delete"])
+async def test_writes_during_a_sweep_win(backend, monkeypatch, stage):
+    await games_collection.insert_many([game("a"), game("edited"), game("deleted")])
+
+    async def race():
+        await games_collection.update_one({"userId": "alice", "id": "edited"}, {"$set": {"updatedAt": datetime.utcnow()}})
+        # As the delete route does, in both tiers
+        await games_collection.delete_one({"userId": "alice", "id": "deleted"})
+        await games_archive_collection.delete_one({"userId": "alice", "id": "deleted"})
+
+    # The writes land right after the copies are made, or between the check and the delete
+    target = "games_archive_collection" if stage == "copy" else "games_collection"
+    original = getattr(archive, target).bulk_write
+    raced = []
+
+    async def bulk_write(requests, **kwargs):
+        if not raced:
+            raced.append(True)
+            if stage == "copy":
+                result = await original(requests, **kwargs)
+                await race()
+                return result
+            await race()
+        return await original(requests, **kwargs)
+
+    monkeypatch.setattr(archive, target, _Patched(getattr(archive, target), bulk_write))
+    await archive.archive_games(now=OLD + timedelta(days=365))
+    assert await tiers("a") == (0, 1)
+    assert await tiers("edited") == (1, 0)
+    assert await tiers("deleted") == (0, 0)
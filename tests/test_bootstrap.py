@@ -0,0 +1,25 @@
+"""The combined first-load response."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+GAME = {
+    "title": "Celeste", "platform": "PC", "genre": "Platformer", "status": "Completed", "rating": 9.5,
+    "playtime": 20, "developer": "Maddy Makes Games", "releaseDate": "2018-01-25", "cover": "", "progress": 100,
+}
+
+async def test_conditional_request_keeps_every_part(api):
+    assert (await api.post("/api/games/", json=GAME)).status_code == 200
+    games = await api.get("/api/games/")
+    preferences = await api.get("/api/preferences/")
+
+    # ETags of single parts must not empty those parts out of the combined body
+    etags = ", ".join([games.headers["ETag"], preferences.headers["ETag"]])
+    response = await api.get("/api/bootstrap", headers={"If-None-Match": etags})
+    assert response.status_code == 200
+    body = response.json()
+    assert [game["title"] for game in body["games"]] == ["Celeste"]
+    assert body["preferences"]["language"] == "en"
+
+    unchanged = await api.get("/api/bootstrap", headers={"If-None-Match": response.headers["ETag"]})
+    assert unchanged.status_code == 304
@@ -0,0 +1,37 @@
+"""Negotiated response compression."""
+import zlib
+import brotli
+import pytest
+
+from compression import CompressionMiddleware
+
+pytestmark = pytest.mark.anyio
+
+CHUNKS = [b'{"id": "%d", "title": "Game %d"}\n' % (i, i) * 20 for i in range(3)]
+
+async def streaming_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/x-ndjson")]})
+    for index, chunk in enumerate(CHUNKS):
+        await send({"type": "http.response.body", "body": chunk, "more_body": index < len(CHUNKS) - 1})
+
+async def sent_messages(encoding: str) -> list:
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", encoding.encode())]}
+    await CompressionMiddleware(streaming_app, minimum_size=10)(scope, None, send)
+    return messages
+
+@pytest.mark.parametrize("encoding, decompressor", [
+    ("gzip", lambda: zlib.decompressobj(zlib.MAX_WBITS | 16)),
+    ("br", brotli.Decompressor),
+])
+async def test_streamed_chunks_are_flushed(encoding, decompressor):
+    start, *bodies = await sent_messages(encoding)
+    assert dict(start["headers"])[b"content-encoding"] == encoding.encode()
+    decoder = decompressor()
+    decompress = decoder.decompress if encoding == "gzip" else decoder.process
+    # Every chunk decompresses in full as soon as it arrives, without the ones after it
+    assert [decompress(message["body"]) for message in bodies] == CHUNKS
@@ -0,0 +1,74 @@
+"""Cover thumbnails served from the local cover cache."""
+import asyncio
+import io
+import pytest
+from PIL import Image
+
+import routes.covers
+from covers import CoverStore, DiskLRU
+
+pytestmark = pytest.mark.anyio
+
+GAME = {
+    "title": "Celeste", "platform": "PC", "genre": "Platformer", "status": "Completed", "rating": 9.5,
+    "playtime": 20, "developer": "Maddy Makes Games", "releaseDate": "2018-01-25",
+    "cover": "https://covers.example/celeste.png", "progress": 100,
+}
+
+def png(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (60, 90), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+class StaticFetcher:
+    """Serves covers from a dict of URL to image bytes"""
+
+    def __init__(self, images: dict):
+        self.images = images
+        self.fetched = []
+
+    async def fetch(self, url: str) -> bytes:
+        self.fetched.append(url)
+        return self.images[url]
+
+@pytest.fixture
+async def store(tmp_path, monkeypatch):
+    store = CoverStore(tmp_path / "covers", fetcher=StaticFetcher({GAME["cover"]: png("red")}), workers=1)
+    monkeypatch.setattr(routes.covers, "cover_store", store)
+    yield store
+    await store.close()
+
+async def test_cover_is_private_to_its_user(api, store):
+    game = (await api.post("/api/games/", json=GAME, headers={"X-User-Id": "alice"})).json()
+    response = await api.get(f"/api/covers/{game['id']}", params={"size": "small"}, headers={"X-User-Id": "alice"})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"].startswith("private")
+    assert Image.open(io.BytesIO(response.content)).size == (120, 180)
+    other = await api.get(f"/api/covers/{game['id']}", params={"size": "small"}, headers={"X-User-Id": "bob"})
+    assert other.status_code == 404
+
+def cached_files(store) -> list:
+    return [path for path in store.root.rglob("*") if path.is_file()]
+
+async def test_budget_counts_every_cached_file(store):
+    await store.thumbnail(GAME["cover"], "small")
+    files = cached_files(store)
+    assert {path.relative_to(store.root).parts[0] for path in files} == {"objects", "thumbs", "urls"}
+    assert store.lru.total == sum(path.stat().st_size for path in files)
+    # Reloaded from disk after a restart, the budget comes out the same
+    reloaded = DiskLRU(store.root, store.lru.max_bytes)
+    reloaded.touch()
+    assert reloaded.total == store.lru.total
+
+async def test_budget_evicts_url_files(store):
+    store.fetcher.images.update({f"https://covers.example/{color}.png": png(color) for color in ("green", "blue")})
+    await store.thumbnail(GAME["cover"], "small")
+    store.lru.max_bytes = store.lru.total
+    for color in ("green", "blue"):
+        await store.thumbnail(f"https://covers.example/{color}.png", "small")
+    assert store.lru.total <= store.lru.max_bytes
+    assert store.lru.total == sum(path.stat().st_size for path in cached_files(store))
+    # The least recently used cover went, URL file included, and is fetched again when asked for
+    assert await asyncio.to_thread(store._cached_hash, GAME["cover"]) is None
+    await store.thumbnail(GAME["cover"], "small")
+    assert store.fetcher.fetched.count(GAME["cover"]) == 2
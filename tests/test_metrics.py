@@ -0,0 +1,27 @@
+"""MongoDB command metrics and slow query logging."""
+import logging
+from types import SimpleNamespace
+import metrics
+from metrics import QueryMonitor, query_shape
+
+def test_query_shape_hides_values():
+    query = {
+        "userId": "alice", "$text": {"$search": "hollow knight"}, "rating": {"$gte": 8},
+        "$or": [{"platform": "PC"}, {"genre": {"$in": ["RPG", "Roguelike"]}}],
+    }
+    assert query_shape(query) == {
+        "userId": "?", "$text": {"$search": "?"}, "rating": {"$gte": "?"},
+        "$or": [{"platform": "?"}, {"genre": {"$in": "?"}}],
+    }
+
+def test_slow_query_log_holds_no_user_data(caplog, monkeypatch):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 0)
+    monitor = QueryMonitor()
+    command = {"find": "games", "filter": {"userId": "alice", "$text": {"$search": "secret title"}}}
+    event = SimpleNamespace(connection_id=1, request_id=1, command_name="find", command=command, duration_micros=5000)
+    monitor.started(event)
+    with caplog.at_level(logging.WARNING, logger=metrics.logger.name):
+        monitor.failed(event)
+    [record] = caplog.records
+    assert "$search" in record.getMessage()
+    assert "alice" not in record.getMessage() and "secret" not in record.getMessage()
@@ -0,0 +1,49 @@
+"""Every query and aggregation the routes run is planned on an index.
+
+Explain only means something on a real server, so the plan test needs a
+mongod at MONGO_URL and is skipped without one. The shape tests make
+sure the plan check explains the filters the routes actually send.
+"""
+import json
+from datetime import datetime
+import pytest
+
+from archive import archivable
+from check_query_plans import find_collection_scans, route_aggregations, route_queries
+from database import backlog_collection, games_archive_collection, games_collection
+from facets import facet_pipeline
+from metrics import query_shape
+from ranking import affinity_pipeline
+from routes.backlog import build_backlog_query
+from routes.covers import cover_query
+from routes.games import build_games_query
+from stats import games_stats_pipeline
+
+pytestmark = pytest.mark.anyio
+
+def shape(collection, query: dict) -> tuple:
+    return collection.name, json.dumps(query_shape(query), sort_keys=True)
+
+def checked_shapes() -> set:
+    shapes = {shape(collection, query) for _, collection, query, _ in route_queries()}
+    return shapes | {shape(collection, pipeline[0]["$match"]) for _, collection, pipeline in route_aggregations()}
+
+@pytest.mark.parametrize("collection, query", [
+    (games_collection, cover_query("alice", "game")),
+    (games_archive_collection, cover_query("alice", "game")),
+    (backlog_collection, cover_query("alice", "item")),
+    (games_collection, build_games_query("alice", platform="PC", search="knight")),
+    (backlog_collection, build_backlog_query("alice", category="Wishlist", priority="High", platform="PC")),
+    (games_collection, archivable(datetime(2024, 1, 1))),
+    (games_collection, facet_pipeline({"platform": "PC"}, build_games_query("alice", search="knight"))[0]["$match"]),
+    (games_archive_collection, affinity_pipeline("alice")[0]["$match"]),
+    (games_archive_collection, games_stats_pipeline("alice")[0]["$match"]),
+], ids=[
+    "games cover", "archive cover", "backlog cover", "games search", "backlog filters", "archiver sweep",
+    "games facets", "genre affinity", "stats",
+])
+def test_route_filters_are_checked(collection, query):
+    assert shape(collection, query) in checked_shapes()
+
+async def test_no_collection_scans(mongo):
+    assert await find_collection_scans() == []
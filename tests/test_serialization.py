@@ -0,0 +1,82 @@
+"""Per-document cost of serializing list responses.
+
+Compares the original path (build a model per document, then let FastAPI
+validate the list against response_model and JSON-encode it) with the
+FastSerializer used by the routes. Both must produce the same JSON; the
+timings are only reported, not asserted. Pure CPU, no database needed;
+run with -s to see them:
+
+    python -m pytest tests/test_serialization.py -s
+"""
+import json
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import List
+import orjson
+import pytest
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models import Backlog, Game, Preferences
+from serialize import FastSerializer
+
+DOCUMENTS = 2_000
+REPEAT = 5
+
+def _common(rng: random.Random) -> dict:
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))), "userId": "alice", "platform": rng.choice(["PC", "Switch"]),
+        "genre": rng.choice(["RPG", "Strategy"]), "developer": f"Studio {rng.randrange(500)}",
+        "releaseDate": datetime(2020, 1, 1), "cover": "https://example.com/cover.jpg", "createdAt": now, "updatedAt": now,
+    }
+
+def make_game(rng: random.Random) -> dict:
+    return {
+        **_common(rng), "title": f"Game {rng.randrange(10**6)}", "status": rng.choice(["Completed", "Dropped"]),
+        "rating": round(rng.uniform(0, 10), 1), "playtime": rng.randrange(200), "progress": rng.randrange(101),
+        "notes": "Generated for the serialization test.",
+    }
+
+def make_backlog_item(rng: random.Random) -> dict:
+    return {
+        **_common(rng), "title": f"Backlog {rng.randrange(10**6)}", "category": "Wishlist", "priority": "High",
+        "estimatedPlaytime": rng.randrange(1, 120), "currentPrice": round(rng.uniform(5, 70), 2),
+        "wishlistPrice": round(rng.uniform(5, 50), 2), "notes": None,
+    }
+
+def make_preferences(rng: random.Random) -> dict:
+    now = datetime.utcnow()
+    return {"id": str(uuid.UUID(int=rng.getrandbits(128))), "language": "en", "createdAt": now, "updatedAt": now}
+
+def legacy_encode(model, adapter, docs: list) -> bytes:
+    models = [model(**doc) for doc in docs]
+    validated = adapter.validate_python([m.model_dump() for m in models])
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+def per_document_us(fn, docs: list) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fn(docs)
+        best = min(best, time.perf_counter() - started)
+    return best / len(docs) * 1_000_000
+
+@pytest.mark.parametrize("model, factory", [
+    (Game, make_game),
+    (Backlog, make_backlog_item),
+    (Preferences, make_preferences),
+])
+def test_fast_serialization_matches(model, factory):
+    rng = random.Random(42)
+    docs = [{**factory(rng), "_id": None} for _ in range(DOCUMENTS)]
+    adapter = TypeAdapter(List[model])
+    serializer = FastSerializer(model)
+
+    assert orjson.loads(serializer.dumps_many(docs)) == json.loads(legacy_encode(model, adapter, docs))
+
+    legacy = per_document_us(lambda d: legacy_encode(model, adapter, d), docs)
+    fast = per_document_us(serializer.dumps_many, docs)
+    print(f"\n{model.__name__:>12}: legacy {legacy:.2f} us/doc, fast {fast:.2f} us/doc, {legacy / fast:.1f}x")
@@ -0,0 +1,50 @@
+"""Dashboard counters on every storage backend, including writes racing a rebuild."""
+import pytest
+
+import stats
+from database import games_collection, stats_collection
+
+pytestmark = pytest.mark.anyio
+
+def game(game_id: str) -> dict:
+    return {"userId": "alice", "id": game_id, "title": f"Game {game_id}", "status": "Playing", "playtime": 10}
+
+async def add_game(game_id: str):
+    """Insert a game and count it, as the create route does"""
+    await games_collection.insert_one(game(game_id))
+    await stats.record_game_change("alice", after=game(game_id))
+
+async def stored_total() -> int:
+    return (await stats_collection.find_one({"userId": "alice"}))["totalGames"]
+
+@pytest.mark.parametrize("existing", [0, 1], ids=["first use", "stored"])
+async def test_write_during_a_rebuild_is_counted(backend, monkeypatch, existing):
+    for game_id in range(existing):
+        await add_game(str(game_id))
+    compute_stats = stats.compute_stats
+    raced = []
+
+    async def racing_compute_stats(user_id: str) -> dict:
+        computed = await compute_stats(user_id)
+        # The write lands after the counting and before the rebuild is stored
+        if not raced:
+            raced.append(True)
+            await add_game("raced")
+        return computed
+
+    monkeypatch.setattr(stats, "compute_stats", racing_compute_stats)
+    rebuilt = await stats.rebuild_stats("alice")
+    assert rebuilt["totalGames"] == await stored_total() == existing + 1
+
+async def test_rebuild_gives_up_on_a_user_that_keeps_changing(backend, monkeypatch):
+    await add_game("a")
+    compute_stats = stats.compute_stats
+
+    async def racing_compute_stats(user_id: str) -> dict:
+        computed = await compute_stats(user_id)
+        await stats.record_game_change("alice", after=game("a"))
+        return computed
+
+    monkeypatch.setattr(stats, "compute_stats", racing_compute_stats)
+    with pytest.raises(RuntimeError):
+        await stats.rebuild_stats("alice")
@@ -0,0 +1,207 @@
+"""The collection API the routes rely on, checked against every storage backend.
+
+Each test runs once on MongoDB (mongomock when no mongod is reachable)
+and once on the embedded SQLite store, so a query that behaves
+differently on the two fails here rather than in production.
+"""
+from datetime import datetime, timedelta
+import pytest
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import analytics_collection, backlog_collection, games_collection, preferences_collection
+from deals import set_with_deal_fields
+from facets import facet_counts
+from search import ranked_find, text_query
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2024, 1, 1)
+
+def game(game_id: str, day: int, user_id: str = "alice", **fields) -> dict:
+    created = START + timedelta(days=day)
+    return {
+        "userId": user_id, "id": game_id, "title": f"Game {game_id}", "platform": "PC", "genre": "RPG",
+        "status": "Playing", "rating": 0, "createdAt": created, "updatedAt": created, **fields
+    }
+
+async def ids(cursor) -> list:
+    return [doc["id"] for doc in await cursor.to_list(None)]
+
+@pytest.fixture
+async def games(backend):
+    await games_collection.insert_many([
+        game("a", 0, platform="PC", genre="RPG", status="Completed", rating=9, notes="long"),
+        game("b", 1, platform="PS5", genre="RPG", status="Playing", rating=7),
+        game("c", 2, platform="PC", genre="Strategy", status="Dropped", rating=4),
+        game("d", 3, platform="Switch", genre="Puzzle", status="Playing"),
+        game("e", 4, user_id="bob", platform="PC", genre="RPG", status="Completed", rating=10),
+    ])
+    return backend
+
+@pytest.mark.parametrize("query, expected", [
+    ({"status": {"$in": ["Completed", "Dropped"]}}, ["a", "c"]),
+    ({"platform": {"$nin": ["PC", "PS5"]}}, ["d"]),
+    ({"notes": {"$nin": ["long"]}}, ["b", "c", "d"]),
+    ({"rating": {"$gt": 4}}, ["a", "b"]),
+    ({"rating": {"$gte": 4, "$lte": 7}}, ["b", "c"]),
+    ({"status": {"$ne": "Playing"}}, ["a", "c"]),
+    ({"notes": {"$exists": True}}, ["a"]),
+    ({"notes": {"$exists": False}}, ["b", "c", "d"]),
+    ({"createdAt": {"$lt": START + timedelta(days=2)}}, ["a", "b"]),
+    ({"createdAt": {"$gte": START + timedelta(days=1), "$lt": START + timedelta(days=3)}}, ["b", "c"]),
+    ({"id": {"$regex": "^[ab]"}}, ["a", "b"]),
+    ({"$or": [{"platform": "Switch"}, {"rating": {"$gt": 8}}]}, ["a", "d"]),
+    ({"$and": [{"platform": "PC"}, {"genre": "Strategy"}]}, ["c"]),
+])
+async def test_filter_operators(games, query, expected):
+    cursor = games_collection.find({"userId": "alice", **query}).sort("id", 1)
+    assert await ids(cursor) == expected
+    assert await games_collection.count_documents({"userId": "alice", **query}) == len(expected)
+
+async def test_projections(games):
+    included = await games_collection.find_one({"userId": "alice", "id": "a"}, {"_id": 0, "id": 1, "rating": 1})
+    assert included == {"id": "a", "rating": 9}
+    excluded = await games_collection.find_one({"userId": "alice", "id": "a"}, {"_id": 0, "notes": 0, "userId": 0})
+    assert "_id" not in excluded and "notes" not in excluded and "userId" not in excluded
+    assert excluded["title"] == "Game a" and excluded["createdAt"] == START
+
+async def test_sort_skip_limit(games):
+    listing = games_collection.find({"userId": "alice"}).sort([("createdAt", -1), ("id", -1)])
+    assert await ids(listing) == ["d", "c", "b", "a"]
+    page = games_collection.find({"userId": "alice"}).sort([("createdAt", 1), ("id", 1)]).skip(1).limit(2)
+    assert await ids(page) == ["b", "c"]
+    by_platform = games_collection.find({"userId": "alice"}).sort([("platform", 1), ("createdAt", -1)])
+    assert await ids(by_platform) == ["c", "a", "b", "d"]
+    streamed = [doc["id"] async for doc in games_collection.find({"userId": "alice"}).sort("id", -1).limit(3)]
+    assert streamed == ["d", "c", "b"]
+
+async def test_aggregate_group(games):
+    pipeline = [
+        {"$match": {"userId": "alice", "rating": {"$gt": 0}}},
+        {"$group": {"_id": "$genre", "total": {"$sum": "$rating"}, "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}}
+    ]
+    rows = await games_collection.aggregate(pipeline).to_list(None)
+    assert rows == [{"_id": "RPG", "total": 16, "count": 2}, {"_id": "Strategy", "total": 4, "count": 1}]
+
+async def test_aggregate_facet(games):
+    pipeline = [
+        {"$match": {"userId": "alice"}},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None, "totalGames": {"$sum": 1}, "ratingSum": {"$sum": {"$ifNull": ["$rating", 0]}}
+            }}],
+            "byStatus": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}, {"$sort": {"_id": 1}}]
+        }}
+    ]
+    [result] = await games_collection.aggregate(pipeline).to_list(1)
+    assert result["totals"] == [{"_id": None, "totalGames": 4, "ratingSum": 20}]
+    assert result["byStatus"] == [
+        {"_id": "Completed", "count": 1}, {"_id": "Dropped", "count": 1}, {"_id": "Playing", "count": 2}
+    ]
+
+async def test_facet_counts(games):
+    counts = await facet_counts(games_collection, {"platform": "PC", "genre": None}, {"userId": "alice"})
+    assert counts["platform"] == [
+        {"value": "PC", "count": 2}, {"value": "PS5", "count": 1}, {"value": "Switch", "count": 1}
+    ]
+    assert counts["genre"] == [{"value": "RPG", "count": 1}, {"value": "Strategy", "count": 1}]
+
+async def test_bulk_write(backend):
+    result = await analytics_collection.bulk_write([
+        UpdateOne({"userId": "alice", "key": "month:2024-01"}, {"$inc": {"added": 2}}, upsert=True),
+        UpdateOne({"userId": "alice", "key": "month:2024-02"}, {"$inc": {"added": 1}}, upsert=True),
+    ], ordered=False)
+    assert result.upserted_count == 2
+    result = await analytics_collection.bulk_write([
+        UpdateOne({"userId": "alice", "key": "month:2024-01"}, {"$inc": {"added": 3, "completed": 1}}, upsert=True),
+        DeleteOne({"userId": "alice", "key": "month:2024-02"}),
+        DeleteOne({"userId": "alice", "key": "month:1999-01"}),
+    ], ordered=False)
+    assert (result.upserted_count, result.modified_count, result.deleted_count) == (0, 1, 1)
+    rows = await analytics_collection.find({"userId": "alice"}, {"_id": 0}).to_list(None)
+    assert rows == [{"userId": "alice", "key": "month:2024-01", "added": 5, "completed": 1}]
+
+async def test_unique_index(games):
+    with pytest.raises(DuplicateKeyError):
+        await games_collection.insert_one(game("a", 9))
+    # Uniqueness is per user
+    await games_collection.insert_one(game("a", 9, user_id="bob"))
+
+async def test_find_one_and_update(games):
+    query = {"userId": "alice", "id": "b"}
+    before = await games_collection.find_one_and_update(
+        query, {"$set": {"rating": 8}}, projection={"_id": 0}, return_document=ReturnDocument.BEFORE
+    )
+    assert before["rating"] == 7
+    after = await games_collection.find_one_and_update(
+        query, {"$set": {"status": "Completed"}}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    assert (after["rating"], after["status"]) == (8, "Completed")
+    missing = await games_collection.find_one_and_update({"userId": "bob", "id": "b"}, {"$set": {"rating": 1}})
+    assert missing is None
+
+async def test_find_one_and_update_upsert(backend):
+    defaults = {"id": "p1", "language": "en"}
+    prefs = await preferences_collection.find_one_and_update(
+        {"userId": "alice"}, {"$setOnInsert": defaults}, projection={"_id": 0},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    assert prefs == {"userId": "alice", "id": "p1", "language": "en"}
+    prefs = await preferences_collection.find_one_and_update(
+        {"userId": "alice"}, {"$set": {"language": "es"}, "$setOnInsert": {"id": "p2"}}, projection={"_id": 0},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    assert prefs == {"userId": "alice", "id": "p1", "language": "es"}
+
+async def test_pipeline_update(backend):
+    await backlog_collection.insert_one({"userId": "alice", "id": "w", "currentPrice": 50.0, "wishlistPrice": 40.0})
+    item = await backlog_collection.find_one_and_update(
+        {"userId": "alice", "id": "w"}, set_with_deal_fields({"currentPrice": 30.0, "note": "$5 off"}),
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    assert (item["currentPrice"], item["note"], item["isDeal"]) == (30.0, "$5 off", True)
+    assert item["discountPct"] == pytest.approx(25.0)
+
+async def test_update_one_upsert(backend):
+    game_doc = game("m", 0)
+    result = await games_collection.update_one({"userId": "alice", "id": "m"}, {"$setOnInsert": game_doc}, upsert=True)
+    assert result.upserted_id is not None
+    result = await games_collection.update_one(
+        {"userId": "alice", "id": "m"}, {"$setOnInsert": {**game_doc, "title": "Other"}}, upsert=True
+    )
+    assert (result.upserted_id, result.matched_count, result.modified_count) == (None, 1, 0)
+    assert (await games_collection.find_one({"userId": "alice", "id": "m"}))["title"] == "Game m"
+
+async def test_find_one_and_delete(games):
+    doc = await games_collection.find_one({"userId": "alice", "id": "c"})
+    # A condition on a field changed since the read leaves the document in place
+    stale = await games_collection.find_one_and_delete({"_id": doc["_id"], "updatedAt": START})
+    assert stale is None
+    removed = await games_collection.find_one_and_delete(
+        {"_id": doc["_id"], "updatedAt": doc["updatedAt"]}, projection={"_id": 1}
+    )
+    assert removed == {"_id": doc["_id"]}
+    assert await games_collection.find_one({"userId": "alice", "id": "c"}) is None
+    assert await games_collection.find_one_and_delete({"_id": doc["_id"]}) is None
+
+async def test_delete_many(games):
+    result = await games_collection.delete_many({"userId": "alice", "status": "Playing"})
+    assert result.deleted_count == 2
+    assert await games_collection.count_documents({}) == 3
+
+async def test_text_search(games):
+    if games == "mongomock":
+        pytest.skip("mongomock has no text search")
+    await games_collection.insert_many([
+        game("t1", 5, title="Hollow Knight"),
+        game("t2", 6, title="Celeste", notes="knight themed speedruns"),
+        game("t3", 7, title="Hollow Knight", user_id="bob"),
+    ])
+    query = {"userId": "alice", **text_query("knight")}
+    found = await ranked_find(games_collection, query, [("createdAt", 1), ("id", 1)], {"_id": 0}).to_list(None)
+    # Title matches outrank matches in notes, and other users' games never match
+    assert [doc["id"] for doc in found] == ["t1", "t2"]
+    assert found[0]["score"] > found[1]["score"] > 0
+    assert await games_collection.count_documents({"userId": "alice", **text_query("celeste -speedruns")}) == 0